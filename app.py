@@ -1,30 +1,47 @@
-from flask import Flask, jsonify, g, request
-from datetime import datetime
-from database import db, init_db, shutdown_session
-from routes.identify import identify_bp
-from config import PORT, DEBUG, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
+# Imported first so the startup breakdown covers every import below
+from services import boot
+import logging
+import time
+
+with boot.timed('import_flask'):
+    from flask import Flask, Response, jsonify, g, request
+with boot.timed('import_database'):
+    from database import engine, init_db, prewarm_pool, shutdown_session
+with boot.timed('import_services'):
+    from routes.changes import changes_bp
+    from routes.contacts import contacts_bp
+    from routes.identify import identify_bp
+    from json_provider import FastJSONProvider
+    from services import metrics
+    from services.key_filter import key_filter
+from config import PORT, DEBUG, INIT_DB_ON_STARTUP, DB_POOL_PREWARM
 
 def create_app():
     """Create and configure the Flask application"""
+    started = time.perf_counter()
+    logging.basicConfig(level=logging.INFO)
     app = Flask(__name__)
+    # Request and response bodies go through orjson when it is installed
+    app.json = FastJSONProvider(app)
     
-    # Configure SQLAlchemy
-    app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
-    
-    # Initialize the app with SQLAlchemy
-    db.init_app(app)
+    # Schema DDL only runs when asked for; deployments run `flask --app app init-db` once instead
+    if INIT_DB_ON_STARTUP:
+        with boot.timed('init_db'):
+            try:
+                init_db()
+                app.logger.info("Database initialized successfully")
+            except Exception as e:
+                app.logger.error(f"Error initializing database: {str(e)}")
     
-    # Initialize the database within the app context
-    with app.app_context():
-        try:
-            init_db()
-            app.logger.info("Database initialized successfully")
-        except Exception as e:
-            app.logger.error(f"Error initializing database: {str(e)}")
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing tables and indexes"""
+        init_db()
     
     # Register blueprints
     app.register_blueprint(identify_bp)
+    app.register_blueprint(contacts_bp)
+    app.register_blueprint(changes_bp)
     
     # Add health check endpoint
     @app.route('/health', methods=['GET'])
@@ -39,32 +56,53 @@ def create_app():
             'status': 'running',
             'endpoints': {
                 '/health': 'Health check',
-                '/identify': 'Identity reconciliation (POST)'
+                '/identify': 'Identity reconciliation (POST)',
+                '/identify/batch': 'Batch identity reconciliation (POST)',
+                '/contacts/<primaryId>': 'Paginated or NDJSON-streamed cluster contacts (GET)',
+                '/changes': 'Cluster change feed, paged by cursor (GET)',
+                '/metrics': 'Prometheus metrics'
             }
         }), 200
     
+    # Expose request, database and pool metrics for Prometheus
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+    
     # Register teardown function to clean up resources
     @app.teardown_appcontext
     def teardown_db(exception=None):
         shutdown_session(exception)
     
-    # Add request hooks for logging
+    # Add request hooks for logging and metrics, timed on the monotonic clock
     @app.before_request
     def before_request():
-        g.start_time = datetime.now()
+        g.start_time = time.perf_counter()
+        g.metrics_token = metrics.start_request()
     
     @app.after_request
     def after_request(response):
-        diff = datetime.now() - g.start_time
-        app.logger.info(f"Request processed in {diff.total_seconds():.4f}s: {request.method} {request.path}")
+        elapsed = time.perf_counter() - g.start_time
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.finish_request(g.metrics_token, request.method, route, response.status_code, elapsed)
+        app.logger.info(f"Request processed in {elapsed:.4f}s: {request.method} {request.path}")
         return response
     
+    # Open pooled connections in the background so the first requests skip the connect
+    if DB_POOL_PREWARM > 0:
+        prewarm_pool(DB_POOL_PREWARM)
+    # Load the known-key filter in the background; new contacts take the full path until it is ready
+    if key_filter is not None:
+        key_filter.start(engine)
+    boot.record('create_app', time.perf_counter() - started)
+    boot.report(app.logger)
     return app
 
 # This is for running locally
 if __name__ == '__main__':
     # Create the Flask app
     app = create_app()
+    init_db()
     
     # Run with Flask's built-in server
     app.run(host='0.0.0.0', port=PORT, debug=DEBUG)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""ASGI entry point serving /identify and /health on a single event loop per worker
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+
+The routes and JSON contracts match the Flask app in app.py; requests run
+concurrently through AsyncContactService instead of blocking a worker on every
+database round trip.
+"""
+# Imported first so the startup breakdown covers every import below
+from services import boot
+from typing import Any, Dict, Tuple
+import asyncio
+import logging
+import time
+
+with boot.timed('import_database'):
+    from sqlalchemy.exc import SQLAlchemyError
+    from async_database import AsyncSessionLocal, async_engine, init_async_db, prewarm_async_pool
+with boot.timed('import_services'):
+    from services import metrics
+    from services.async_contact_service import AsyncContactService
+    from services.contact_service import cap_response
+    from services.json_codec import RequestError, codec, parse_identify
+    from services.key_locks import LockContention
+from config import DB_POOL_PREWARM, IDENTIFY_MAX_ARRAY_ITEMS, INIT_DB_ON_STARTUP
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROOT_RESPONSE = {
+    'service': 'Bitespeed Identity Reconciliation API',
+    'status': 'running',
+    'endpoints': {
+        '/health': 'Health check',
+        '/identify': 'Identity reconciliation (POST)',
+        '/metrics': 'Prometheus metrics'
+    }
+}
+
+ROUTES = ('/', '/health', '/identify', '/metrics')
+
+
+async def identify(body: bytes) -> Tuple[int, Dict[str, Any]]:
+    """Endpoint for contact identification"""
+    try:
+        request_data = parse_identify(body)
+    except RequestError as e:
+        return 400, {'error': str(e)}
+
+    async with AsyncSessionLocal() as session:
+        try:
+            service = AsyncContactService(session)
+            return 200, cap_response(await service.identify_contact(request_data), IDENTIFY_MAX_ARRAY_ITEMS)
+
+        except ValueError as e:
+            logger.warning(f"Validation error: {str(e)}")
+            return 400, {'error': str(e)}
+
+        except LockContention as e:
+            logger.warning(f"Gave up locking: {str(e)}")
+            return 503, {'error': 'The service is overloaded, retry later'}
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            return 500, {'error': 'A database error occurred'}
+
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return 500, {'error': 'An unexpected error occurred'}
+
+
+async def dispatch(method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+    if path == '/identify':
+        if method != 'POST':
+            return 405, {'error': 'Method not allowed'}
+        return await identify(body)
+    if path in ('/health', '/'):
+        if method != 'GET':
+            return 405, {'error': 'Method not allowed'}
+        return 200, {'status': 'ok'} if path == '/health' else ROOT_RESPONSE
+    return 404, {'error': 'Not found'}
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+# Keeps the background pool warm-up task referenced until it finishes
+background_tasks = set()
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            started = time.perf_counter()
+            # Schema DDL only runs when asked for; deployments run `flask --app app init-db` once instead
+            if INIT_DB_ON_STARTUP:
+                with boot.timed('init_db'):
+                    try:
+                        await init_async_db()
+                        logger.info("Database initialized successfully")
+                    except Exception as e:
+                        logger.error(f"Error initializing database: {str(e)}")
+            if DB_POOL_PREWARM > 0:
+                task = asyncio.create_task(prewarm_async_pool(DB_POOL_PREWARM))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+            boot.record('startup', time.perf_counter() - started)
+            boot.report(logger)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application callable"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    start_time = time.perf_counter()
+    token = metrics.start_request()
+    method, path = scope['method'], scope['path']
+    if path == '/metrics' and method == 'GET':
+        status, content_type = 200, metrics.CONTENT_TYPE
+        body = metrics.registry.render().encode()
+    else:
+        status, payload = await dispatch(method, path, await read_body(receive))
+        # Encoded by the codec behind the Flask app's JSON provider, so both stacks return identical bodies
+        content_type = 'application/json'
+        body = codec.dumps(payload, newline=True)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+                   + ([(b'retry-after', b'1')] if status == 503 else [])
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+    elapsed = time.perf_counter() - start_time
+    metrics.finish_request(token, method, path if path in ROUTES else 'unmatched', status, elapsed)
+    logger.info(f"Request processed in {elapsed:.4f}s: {method} {path}")
@@ -0,0 +1,47 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.exc import SQLAlchemyError
+from database import Base
+from config import ASYNC_DATABASE_URI, ASYNC_ENGINE_OPTIONS
+from services import boot
+from services.metrics import TimedAsyncAdaptedQueuePool, instrument_engine
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Create the asyncio engine (asyncpg for PostgreSQL, aiosqlite for SQLite)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URI,
+    # aiosqlite defaults to NullPool, which starts a connection thread per request
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **ASYNC_ENGINE_OPTIONS
+)
+instrument_engine(async_engine.sync_engine, 'async')
+
+# Create session factory; objects stay readable after commit
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+async def init_async_db():
+    """Initialize the database and create all tables through the async engine"""
+    # Import models to ensure they're registered with Base
+    import models
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def prewarm_async_pool(count: int) -> None:
+    """Open up to `count` pooled connections (at most pool_size) and return them to the pool"""
+    started = time.perf_counter()
+    connections = []
+    try:
+        for _ in range(min(count, async_engine.pool.size())):
+            connections.append(await async_engine.connect())
+    except SQLAlchemyError as e:
+        logger.warning(f"Pool pre-warm stopped after {len(connections)} connections: {str(e)}")
+    finally:
+        for connection in connections:
+            await connection.close()
+    boot.record('pool_prewarm', time.perf_counter() - started)
@@ -0,0 +1,102 @@
+"""Load test admission control: tail latency at twice the saturation rate
+
+    python benchmarks/bench_admission.py --pool 2 --threads 128 --seconds 10
+
+Seeds the contact table like bench_identify.py and serves it with one gunicorn
+gthread worker of --threads threads over a pool of --pool connections (no
+overflow), so the pool is the bottleneck. First a closed loop of 2 x --pool
+clients finds the saturation throughput. Then requests arrive open-loop at
+--overload times that rate for --seconds, once with admission control on and
+once with it off. Reports p50/p99/max latency of the answered (200) and shed
+(503) requests, and of each request kind by status. Keep --threads above the
+concurrency limit plus ADMISSION_QUEUE_SIZE: requests beyond the threads wait in
+gunicorn, where admission control cannot see them.
+
+With admission control on, admitted requests should stay within roughly
+ADMISSION_QUEUE_TIMEOUT_MS of their saturation latency and the excess should be
+shed in milliseconds. With it off, every request queues for the pool and the
+tail grows with the run until requests fail after DB_POOL_TIMEOUT. Runs on a
+temporary SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_identify import plan_requests, seed
+from loadgen import free_port, run_load, run_rate, start_server, stop_server
+
+
+def serve(env, threads: int, admission: bool):
+    port = free_port()
+    server = start_server(
+        ['gunicorn', '-w', '1', '-k', 'gthread', '--threads', str(threads), '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+        port, dict(env, ADMISSION_ENABLED=str(admission).lower())
+    )
+    return server, port
+
+
+def print_run(name: str, summary) -> None:
+    print(f"{name:<14} offered {summary['requests'] / summary['seconds']:>7.1f} req/s  {summary['statuses']}")
+    for status, values in summary.get('by_status', {}).items():
+        print(f"{'':<14} {status:<13} {values['requests']:>6} reqs  p50={values['p50_ms']:.1f}ms "
+              f"p99={values['p99_ms']:.1f}ms max={values['max_ms']:.1f}ms")
+    for kind, values in summary.get('by_label', {}).items():
+        print(f"{'':<14} {kind:<13} {values['requests']:>6} reqs  p50={values['p50_ms']:.1f}ms "
+              f"p99={values['p99_ms']:.1f}ms max={values['max_ms']:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=2000)
+    parser.add_argument('--pool', type=int, default=2, help='DB_POOL_SIZE, with DB_MAX_OVERFLOW=0')
+    parser.add_argument('--threads', type=int, default=128, help='gunicorn threads per worker')
+    parser.add_argument('--overload', type=float, default=2.0, help='offered rate as a multiple of saturation')
+    parser.add_argument('--seconds', type=float, default=10.0, help='length of each overloaded run')
+    parser.add_argument('--pool-timeout', type=int, default=30, help='DB_POOL_TIMEOUT')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/admission.db"
+    os.environ.update(CLUSTER_CACHE_SIZE='0', DB_POOL_SIZE=str(args.pool), DB_MAX_OVERFLOW='0',
+                      DB_POOL_TIMEOUT=str(args.pool_timeout))
+    env = dict(os.environ)
+
+    rng = random.Random(args.seed)
+    cluster_sizes = seed(args.clusters, {1: 70, 5: 20, 50: 10}, rng)
+    unmerged = list(range(len(cluster_sizes)))
+    rng.shuffle(unmerged)
+    mix = {'new': 10, 'lookup': 75, 'secondary': 10, 'merge': 5}
+
+    def runner(planned):
+        return lambda n: ('POST', '/identify', planned[n][1])
+
+    # Saturation: enough closed-loop clients to keep every pooled connection busy
+    planned = plan_requests(cluster_sizes, unmerged, mix, 200 * args.pool, 's', rng)
+    server, port = serve(env, args.threads, True)
+    try:
+        saturation = asyncio.run(run_load('127.0.0.1', port, runner(planned), 2 * args.pool, len(planned)))
+    finally:
+        stop_server(server)
+    rate = saturation['throughput'] * args.overload
+    print(f"saturation     {saturation['throughput']:>7.1f} req/s  p50={saturation['p50_ms']:.1f}ms "
+          f"p99={saturation['p99_ms']:.1f}ms")
+
+    for admission in (True, False):
+        planned = plan_requests(cluster_sizes, unmerged, mix, int(rate * args.seconds), 'a' if admission else 'o', rng)
+        server, port = serve(env, args.threads, admission)
+        try:
+            summary = asyncio.run(run_rate('127.0.0.1', port, runner(planned), rate, len(planned),
+                                           label=lambda n: planned[n][0]))
+        finally:
+            stop_server(server)
+        print_run(f"admission {'on' if admission else 'off'}", summary)
+
+
+if __name__ == '__main__':
+    main()
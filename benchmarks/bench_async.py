@@ -0,0 +1,96 @@
+"""Compare /identify throughput of the sync (gunicorn + Flask) and async (uvicorn + ASGI) stacks
+
+    python benchmarks/bench_async.py --workers 2 --concurrency 1 8 32 64 --requests 2000
+
+Both stacks serve the same freshly seeded database (a temporary SQLite file unless
+DATABASE_URL is set) with the same number of worker processes and are driven at
+the same client concurrency levels. The cluster cache is disabled unless --cache
+is passed, so every request reaches the database.
+
+SQLite serializes writers across processes, so with more than one worker the
+numbers mostly measure lock waits; point DATABASE_URL at PostgreSQL for a
+meaningful comparison of the two stacks.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadgen import free_port, run_load, start_server, stop_server
+
+
+def seed(env, contacts: int) -> None:
+    """Create `contacts` primaries through the sync service before either server starts"""
+    os.environ.update(env)
+    from app import create_app
+    from database import init_db
+
+    client = create_app().test_client()
+    init_db()
+    for i in range(contacts):
+        client.post('/identify', json={'email': f'seed{i}@bench.io', 'phoneNumber': f'9{i:08d}'})
+
+
+def request_mix(contacts: int, lookup_ratio: float, tag: str):
+    rng = random.Random(42)
+
+    def next_request(n: int):
+        if rng.random() < lookup_ratio:
+            i = rng.randrange(contacts)
+            return 'POST', '/identify', {'email': f'seed{i}@bench.io', 'phoneNumber': f'9{i:08d}'}
+        return 'POST', '/identify', {'email': f'{tag}{n}@bench.io', 'phoneNumber': f'8{n:08d}'}
+
+    return next_request
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per stack and concurrency level')
+    parser.add_argument('--contacts', type=int, default=2000, help='contacts seeded before measuring')
+    parser.add_argument('--lookup-ratio', type=float, default=0.8)
+    parser.add_argument('--cache', action='store_true', help='keep the cluster cache enabled')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    if not args.cache:
+        env['CLUSTER_CACHE_SIZE'] = '0'
+    seed(env, args.contacts)
+
+    stacks = {
+        'sync': lambda port: ['gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+        'async': lambda port: ['uvicorn', 'asgi:app', '--workers', str(args.workers),
+                               '--port', str(port), '--log-level', 'warning'],
+    }
+
+    results = []
+    for stack, command in stacks.items():
+        port = free_port()
+        server = start_server(command(port), port, env)
+        try:
+            for concurrency in args.concurrency:
+                mix = request_mix(args.contacts, args.lookup_ratio, f'{stack}{concurrency}-')
+                summary = asyncio.run(run_load('127.0.0.1', port, mix, concurrency, args.requests))
+                summary.update(stack=stack, concurrency=concurrency)
+                results.append(summary)
+                print(f"{stack:>5} c={concurrency:<4} {summary['throughput']:>8.1f} req/s  "
+                      f"p50={summary['p50_ms']:.1f}ms p99={summary['p99_ms']:.1f}ms  {summary['statuses']}")
+        finally:
+            stop_server(server)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark the write overhead of the change feed
+
+    python benchmarks/bench_change_feed.py --requests 3000 --rounds 3
+
+Runs bench_identify.py in-process with a write-only mix (new primaries,
+secondaries and merges) --rounds times with CHANGE_FEED_ENABLED off and on,
+alternating so drift in the machine hits both alike, each on a freshly seeded
+database with the same --seed. Reports the median over the rounds of the p50
+and p99 latency and SQL statements per request of each kind, and the change
+the feed makes: one more INSERT per write into cluster_event, in the same
+transaction. Runs on temporary SQLite files unless DATABASE_URL is set; a
+DATABASE_URL database is reseeded (not dropped) by every run.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+KINDS = ('new', 'secondary', 'merge')
+
+
+def run_once(feed: bool, args, output: str):
+    env = dict(os.environ, CHANGE_FEED_ENABLED=str(feed).lower())
+    subprocess.run(
+        [sys.executable, os.path.join(HERE, 'bench_identify.py'), '--modes', 'inprocess',
+         '--clusters', str(args.clusters), '--requests', str(args.requests), '--seed', str(args.seed),
+         '--mix', 'new:40', 'secondary:40', 'merge:20', '--output', output],
+        env=env, check=True, capture_output=True, text=True
+    )
+    with open(output) as f:
+        return json.load(f)['runs'][0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    runs = {False: [], True: []}
+    for n in range(args.rounds):
+        for feed in (False, True):
+            runs[feed].append(run_once(feed, args, os.path.join(workdir, f'{n}-{feed}.json')))
+
+    def median(feed: bool, kind: str, key: str) -> float:
+        return statistics.median(run['by_label'][kind][key] for run in runs[feed])
+
+    print(f"{'kind':<10} {'feed':>5} {'p50 ms':>8} {'p99 ms':>8} {'stmts/req':>10}")
+    for kind in KINDS:
+        for feed in (False, True):
+            print(f"{kind:<10} {'on' if feed else 'off':>5} {median(feed, kind, 'p50_ms'):>8.2f} "
+                  f"{median(feed, kind, 'p99_ms'):>8.2f} {median(feed, kind, 'queries_per_request'):>10.2f}")
+        overhead = [(median(True, kind, key) / median(False, kind, key) - 1) * 100 for key in ('p50_ms', 'p99_ms')]
+        print(f"{'':<10} {'':>5} {overhead[0]:>+7.1f}% {overhead[1]:>+7.1f}%")
+
+
+if __name__ == '__main__':
+    main()
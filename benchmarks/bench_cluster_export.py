@@ -0,0 +1,84 @@
+"""Measure peak memory of reading one large cluster through each endpoint
+
+    python benchmarks/bench_cluster_export.py --sizes 1000 10000 100000
+
+For each cluster size one cluster is seeded and materialized, then read through
+create_app().test_client() three ways:
+
+  identify   POST /identify by the primary's email, uncapped
+             (IDENTIFY_MAX_ARRAY_ITEMS=0): the whole response in one body
+  page       GET /contacts/<id>, one page of the default size
+  ndjson     GET /contacts/<id>?format=ndjson, consumed chunk by chunk
+
+Reports wall time and the peak Python memory allocated while serving each
+request (tracemalloc). The page and stream peaks should not grow with the
+cluster. Runs on a temporary SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    os.environ['IDENTIFY_MAX_ARRAY_ITEMS'] = '0'
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/export.db"
+
+    import logging
+    logging.disable(logging.INFO)
+    from sqlalchemy import insert
+    from app import create_app
+    from bulk_import import refresh
+    from database import engine, init_db
+    from models import Contact
+
+    init_db()
+    client = create_app().test_client()
+
+    def measure(send):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = send()
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak, size
+
+    print(f"{'size':>8} {'mode':>9} {'ms':>9} {'peak KiB':>10} {'body KiB':>10}")
+    for n, size in enumerate(args.sizes):
+        with engine.begin() as conn:
+            primary_id = conn.execute(insert(Contact).returning(Contact.id), {
+                'email': f'c{n}@export.io', 'emailKey': f'c{n}@export.io', 'phoneNumber': f'{n}0',
+                'phoneKey': f'{n}0', 'linkPrecedence': 'primary'
+            }).scalar_one()
+            conn.execute(insert(Contact), [
+                {'email': f'c{n}s{i}@export.io', 'emailKey': f'c{n}s{i}@export.io', 'phoneNumber': f'{n}{i}',
+                 'phoneKey': f'{n}{i}', 'linkedId': primary_id, 'linkPrecedence': 'secondary'}
+                for i in range(1, size)
+            ])
+        refresh(5000)
+
+        modes = {
+            'identify': lambda: client.post('/identify', json={'email': f'c{n}@export.io'}, buffered=False),
+            'page': lambda: client.get(f'/contacts/{primary_id}', buffered=False),
+            'ndjson': lambda: client.get(f'/contacts/{primary_id}?format=ndjson', buffered=False),
+        }
+        for mode, send in modes.items():
+            elapsed, peak, body = measure(send)
+            print(f"{size:>8} {mode:>9} {elapsed * 1000:>9.1f} {peak / 1024:>10.0f} {body / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
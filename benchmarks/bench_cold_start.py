@@ -0,0 +1,67 @@
+"""Benchmark worker cold start: imports and app creation in fresh interpreters
+
+    python benchmarks/bench_cold_start.py --runs 10
+    python benchmarks/bench_cold_start.py --runs 10 --init-db --prewarm 5
+
+Every run starts a new Python process that imports app, calls create_app() and
+prints the phases services.boot recorded. Reports the median and max of each
+phase across --runs runs, plus the process wall time including interpreter
+start-up. Runs against a temporary SQLite file unless DATABASE_URL is set. Use
+`python -X importtime -c "import app"` to break a slow import phase down further.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+import app
+app.create_app()
+from services import boot
+if {prewarm}:
+    deadline = time.monotonic() + 10
+    while 'pool_prewarm' not in boot.phases and time.monotonic() < deadline:
+        time.sleep(0.005)
+print(json.dumps(boot.phases))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--init-db', action='store_true', help='run schema DDL at startup (INIT_DB_ON_STARTUP)')
+    parser.add_argument('--prewarm', type=int, default=0, help='pooled connections to open at startup')
+    args = parser.parse_args()
+
+    env = dict(os.environ, INIT_DB_ON_STARTUP=str(args.init_db).lower(), DB_POOL_PREWARM=str(args.prewarm))
+    if not env.get('DATABASE_URL'):
+        env['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/cold.db"
+        # The schema has to exist for the runs that skip DDL to be comparable
+        subprocess.run([sys.executable, '-c', 'from database import init_db; init_db()'],
+                       cwd=ROOT, env=env, check=True)
+
+    samples = {}
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', CHILD.format(prewarm=args.prewarm > 0)],
+                                cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+        wall = time.perf_counter() - started
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        phases['process'] = wall
+        for name, seconds in phases.items():
+            samples.setdefault(name, []).append(seconds)
+
+    print(f"{'phase':<18} {'median ms':>10} {'max ms':>10}")
+    for name, values in samples.items():
+        print(f"{name:<18} {statistics.median(values) * 1000:>10.1f} {max(values) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Benchmark group commit: transactions committed per insert-only /identify request
+
+    python benchmarks/bench_group_commit.py --threads 8 --requests 4000 --windows 0 2 5
+
+Seeds --primaries primary contacts, then for every --windows value (milliseconds,
+0 meaning group commit off) runs --threads threads that each send their share of
+--requests insert-only requests straight to ContactService: half fresh email and
+phone pairs (new primaries), half a seeded email with a fresh phone number (new
+secondaries). Reports throughput, p50/p99 latency, commits per request and the
+mean rows written per commit. Runs on a temporary SQLite file unless
+DATABASE_URL is set; SQLite serializes writers on a file lock, so keep
+--threads low there and use PostgreSQL for throughput numbers.
+
+Finally it checks that a full pool cannot stall a batch: on an engine with
+exactly --threads pooled connections and no overflow, every thread holds a
+connection open, as requests holding PostgreSQL advisory locks do, while it
+joins a batch. The leader must write on its own connection instead of waiting
+for the pool; the run fails if any insert errors.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=4000, help='requests per window setting')
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 2, 5])
+    parser.add_argument('--max-rows', type=int, default=64)
+    parser.add_argument('--primaries', type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads + 1))
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/group.db"
+
+    from sqlalchemy import create_engine, event, insert, select
+    from sqlalchemy.orm import Session
+    from database import db_session, engine, init_db
+    from models import Contact
+    from services.contact_service import ContactService
+    from services.group_commit import GroupCommitter
+
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(insert(Contact), [
+            {'email': f'p{i}@group.io', 'phoneNumber': f'1{i:09d}', 'linkPrecedence': 'primary'}
+            for i in range(args.primaries)
+        ])
+
+    commits = [0]
+
+    def count(conn):
+        commits[0] += 1
+
+    event.listen(engine, 'commit', count)
+    print(f"{'window':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'commits/req':>12} {'rows/commit':>12}")
+    for run, window in enumerate(args.windows):
+        committer = GroupCommitter(engine, window / 1000, args.max_rows) if window > 0 else None
+        service = ContactService(cache=None, group_commit=committer)
+        latencies = []
+        errors = []
+
+        def worker(thread: int) -> None:
+            try:
+                for n in range(thread, args.requests, args.threads):
+                    if n % 2:
+                        payload = {'email': f'p{n % args.primaries}@group.io', 'phoneNumber': f'8{run}{n:08d}'}
+                    else:
+                        payload = {'email': f'w{run}n{n}@group.io', 'phoneNumber': f'9{run}{n:08d}'}
+                    started = time.perf_counter()
+                    service.identify_contact(payload)
+                    latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db_session.remove()
+
+        before = commits[0]
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+
+        committed = commits[0] - before
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{window:>6g}ms {len(latencies) / elapsed:>9.1f} {statistics.median(latencies) * 1000:>8.2f} "
+              f"{p99 * 1000:>8.2f} {committed / len(latencies):>12.3f} {len(latencies) / max(committed, 1):>12.1f}")
+    event.remove(engine, 'commit', count)
+
+    # Full pool: every caller pins a connection while the window is open
+    pinned = create_engine(engine.url, pool_size=args.threads, max_overflow=0, pool_timeout=2)
+    committer = GroupCommitter(pinned, 0.5, args.threads)
+    ids = []
+    errors = []
+
+    def pin(thread: int) -> None:
+        session = Session(bind=pinned)
+        try:
+            session.execute(select(1))
+            ids.append(committer.insert(
+                {'email': f'pool{thread}@group.io', 'phoneNumber': f'7{thread:09d}', 'linkPrecedence': 'primary'},
+                session=session
+            ))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=pin, args=(t,)) for t in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pinned.dispose()
+    if errors:
+        raise errors[0]
+    print(f"\nfull pool: {len(set(ids))} inserts over {args.threads} pinned connections in "
+          f"{(time.perf_counter() - started) * 1000:.0f}ms, {committer.batches} batch(es)")
+
+
+if __name__ == '__main__':
+    main()
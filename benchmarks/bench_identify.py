@@ -0,0 +1,268 @@
+"""Benchmark /identify under a realistic traffic mix, in-process and over HTTP
+
+    python benchmarks/bench_identify.py --clusters 2000 --sizes 1:70 5:20 50:9 500:1 \\
+        --mix new:20 lookup:60 secondary:15 merge:5 --requests 3000 --output results.json
+
+Seeds the contact table (a temporary SQLite file unless DATABASE_URL points at
+a local PostgreSQL) with --clusters clusters whose sizes are drawn from the
+--sizes size:weight distribution, then replays requests drawn from the --mix
+kind:weight distribution:
+
+  new        fresh email and phone number, creating a primary
+  lookup     the email and phone number of a seeded contact, a pure read
+  secondary  a seeded email with a fresh phone number, adding a secondary
+  merge      the email of one seeded primary with the phone number of
+             another, from clusters not merged yet, demoting the younger
+             cluster (Case 4)
+
+Modes (--modes, both by default):
+
+  inprocess  requests go through create_app().test_client() one at a time;
+             also counts the SQL statements each request issues
+  http       requests go over keep-alive HTTP to gunicorn serving wsgi:app
+             (--server asgi for uvicorn serving asgi:app), from --concurrency
+             clients
+
+Every mode reports p50/p95/p99 latency and throughput, overall and per kind.
+--output writes the results with the git commit and settings as JSON, and
+--compare prints the change against an earlier results file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadgen import ROOT, free_port, run_load, start_server, stop_server, summarize
+
+KINDS = ('new', 'lookup', 'secondary', 'merge')
+
+
+def parse_weights(items, allowed=None):
+    weights = {}
+    for item in items:
+        key, _, weight = item.partition(':')
+        if allowed is not None and key not in allowed:
+            raise SystemExit(f"unknown kind {key!r}, expected one of {', '.join(allowed)}")
+        weights[key if allowed else int(key)] = float(weight or 1)
+    return weights
+
+
+def member(cluster: int, index: int):
+    return f'c{cluster}m{index}@seed.io', f'{cluster:07d}{index:04d}'
+
+
+def seed(clusters: int, sizes, rng: random.Random):
+    """Bulk-write the seeded clusters and return their sizes"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import func, select, text
+    from bulk_import import chunked, refresh, write_rows
+    from database import engine, init_db
+    from models import Contact
+    from services.normalize import normalize_email, normalize_phone
+
+    init_db()
+    cluster_sizes = rng.choices(list(sizes), weights=list(sizes.values()), k=clusters)
+    with engine.connect() as conn:
+        next_id = (conn.execute(select(func.max(Contact.id))).scalar() or 0) + 1
+
+    # Older clusters first, so merges demote the cluster seeded later
+    epoch = datetime.now(timezone.utc) - timedelta(days=1)
+    primaries, secondaries = [], []
+    for cluster, size in enumerate(cluster_sizes):
+        primary_id = next_id
+        for index in range(size):
+            email, phone_number = member(cluster, index)
+            row = {
+                'id': next_id, 'email': email, 'phoneNumber': phone_number,
+                'emailKey': normalize_email(email), 'phoneKey': normalize_phone(phone_number),
+                'linkedId': None if index == 0 else primary_id,
+                'linkPrecedence': 'primary' if index == 0 else 'secondary',
+                'createdAt': epoch + timedelta(seconds=cluster, microseconds=index), 'updatedAt': epoch
+            }
+            (primaries if index == 0 else secondaries).append(row)
+            next_id += 1
+
+    for rows in (primaries, secondaries):
+        for chunk in chunked(iter(rows), 5000):
+            with engine.begin() as conn:
+                write_rows(conn, chunk)
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('contact', 'id'), (SELECT MAX(id) FROM contact))"))
+    refresh(5000)
+    return cluster_sizes
+
+
+def plan_requests(cluster_sizes, unmerged, mix, total: int, tag: str, rng: random.Random):
+    """Draw (kind, payload) pairs; merges pop their clusters from `unmerged` so none is merged twice"""
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    planned = []
+    for n, kind in enumerate(kinds):
+        if kind == 'merge' and len(unmerged) < 2:
+            kind = 'lookup'
+        if kind == 'new':
+            payload = {'email': f'{tag}n{n}@bench.io', 'phoneNumber': f'9{tag}{n:08d}'}
+        elif kind == 'lookup':
+            cluster = rng.randrange(len(cluster_sizes))
+            email, phone_number = member(cluster, rng.randrange(cluster_sizes[cluster]))
+            payload = {'email': email, 'phoneNumber': phone_number}
+        elif kind == 'secondary':
+            cluster = rng.randrange(len(cluster_sizes))
+            payload = {'email': member(cluster, 0)[0], 'phoneNumber': f'8{tag}{n:08d}'}
+        else:
+            first, second = sorted((unmerged.pop(), unmerged.pop()))
+            payload = {'email': member(first, 0)[0], 'phoneNumber': member(second, 0)[1]}
+        planned.append((kind, payload))
+    return planned
+
+
+def run_inprocess(planned):
+    from sqlalchemy import event
+    from app import create_app
+    from database import engine
+
+    client = create_app().test_client()
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    latencies = {kind: [] for kind in KINDS}
+    queries = {kind: [] for kind in KINDS}
+    statuses = {}
+    started = time.perf_counter()
+    try:
+        for kind, payload in planned:
+            before = statements[0]
+            request_started = time.perf_counter()
+            status = client.post('/identify', json=payload).status_code
+            latencies[kind].append(time.perf_counter() - request_started)
+            queries[kind].append(statements[0] - before)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    elapsed = time.perf_counter() - started
+
+    summary = summarize([t for values in latencies.values() for t in values], elapsed, statuses)
+    summary['queries_per_request'] = round(sum(map(sum, queries.values())) / max(len(planned), 1), 2)
+    summary['by_label'] = {}
+    for kind in KINDS:
+        if latencies[kind]:
+            summary['by_label'][kind] = summarize(latencies[kind], elapsed, {})
+            summary['by_label'][kind]['queries_per_request'] = round(sum(queries[kind]) / len(queries[kind]), 2)
+    return summary
+
+
+def run_http(planned, args, env):
+    port = free_port()
+    if args.server == 'asgi':
+        command = ['uvicorn', 'asgi:app', '--workers', str(args.workers), '--port', str(port), '--log-level', 'warning']
+    else:
+        command = ['gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{port}', 'wsgi:app']
+    server = start_server(command, port, env)
+    try:
+        return asyncio.run(run_load(
+            '127.0.0.1', port,
+            lambda n: ('POST', '/identify', planned[n][1]),
+            args.concurrency, len(planned),
+            label=lambda n: planned[n][0]
+        ))
+    finally:
+        stop_server(server)
+
+
+def print_summary(mode: str, summary) -> None:
+    queries = f"  {summary['queries_per_request']} queries/req" if 'queries_per_request' in summary else ''
+    print(f"{mode:>9} all        {summary['throughput']:>8.1f} req/s  p50={summary['p50_ms']:.2f}ms "
+          f"p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms{queries}  {summary['statuses']}")
+    for kind, values in summary.get('by_label', {}).items():
+        queries = f"  {values['queries_per_request']} queries/req" if 'queries_per_request' in values else ''
+        print(f"{'':>9} {kind:<10} {values['requests']:>8} reqs   p50={values['p50_ms']:.2f}ms "
+              f"p95={values['p95_ms']:.2f}ms p99={values['p99_ms']:.2f}ms{queries}")
+
+
+def compare(results, path: str) -> None:
+    with open(path) as f:
+        previous = {run['mode']: run for run in json.load(f)['runs']}
+    print(f"\nchange against {path}:")
+    for run in results['runs']:
+        old = previous.get(run['mode'])
+        if old is None:
+            continue
+        deltas = []
+        for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            if key in run and key in old and old[key]:
+                deltas.append(f"{key} {(run[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"{run['mode']:>9} " + '  '.join(deltas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=2000)
+    parser.add_argument('--sizes', nargs='+', default=['1:70', '5:20', '50:9', '500:1'],
+                        help='cluster size:weight pairs for seeding')
+    parser.add_argument('--mix', nargs='+', default=['new:20', 'lookup:60', 'secondary:15', 'merge:5'],
+                        help='request kind:weight pairs')
+    parser.add_argument('--requests', type=int, default=3000, help='requests per mode')
+    parser.add_argument('--modes', nargs='+', choices=['inprocess', 'http'], default=['inprocess', 'http'])
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--cache', action='store_true', help='keep the cluster cache enabled')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='print the change against an earlier --output file')
+    args = parser.parse_args()
+
+    sizes = parse_weights(args.sizes)
+    mix = parse_weights(args.mix, KINDS)
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['FALLBACK_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    if not args.cache:
+        os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    env = dict(os.environ)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    cluster_sizes = seed(args.clusters, sizes, rng)
+    print(f"seeded {args.clusters} clusters, {sum(cluster_sizes)} contacts in {time.perf_counter() - started:.1f}s")
+
+    unmerged = list(range(len(cluster_sizes)))
+    rng.shuffle(unmerged)
+    runs = []
+    for mode in args.modes:
+        # Modes share the pool of unmerged clusters, so each one merges clusters no earlier mode touched
+        planned = plan_requests(cluster_sizes, unmerged, mix, args.requests, mode[0], rng)
+        summary = run_inprocess(planned) if mode == 'inprocess' else run_http(planned, args, env)
+        summary['mode'] = mode
+        runs.append(summary)
+        print_summary(mode, summary)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    results = {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'database': 'postgresql' if env.get('DATABASE_URL', '').startswith('postgres') else 'sqlite',
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'runs': runs
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Microbenchmark /identify request parsing and response encoding across cluster sizes
+
+    python benchmarks/bench_json.py --sizes 1 10 100 1000 10000
+
+For a consolidated response of each --sizes contacts (an email, a phone number
+and, past the primary, a secondary id per contact, capped at
+IDENTIFY_MAX_ARRAY_ITEMS like the route does) times building the 200 response
+three ways:
+
+  jsonify   Flask's DefaultJSONProvider with the standard library, the path
+            before FastJSONProvider
+  provider  jsonify through FastJSONProvider (orjson when it is installed)
+  cached    the body kept in services.json_codec.response_bodies for a cluster
+            served from the cluster cache, wrapped in a response
+
+and parsing a request body the old way (request.json, standard library) and
+with parse_identify. Reports microseconds per call and the speedup over the
+old path. Needs no database.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def per_call_us(func, min_seconds: float) -> float:
+    timer = timeit.Timer(func)
+    calls, elapsed = timer.autorange()
+    while elapsed < min_seconds:
+        calls *= 2
+        elapsed = timer.timeit(calls)
+    return elapsed / calls * 1e6
+
+
+def consolidated(size: int):
+    return {
+        'contact': {
+            'primaryContatctId': 1,
+            'emails': [f'customer.{n}@example.com' for n in range(size)],
+            'phoneNumbers': [f'+1 555 {n:07d}' for n in range(size)],
+            'secondaryContactIds': list(range(2, size + 1))
+        }
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='time spent measuring each case')
+    args = parser.parse_args()
+
+    from flask import Flask, jsonify, request
+    from flask.json.provider import DefaultJSONProvider
+    from config import IDENTIFY_MAX_ARRAY_ITEMS
+    from json_provider import FastJSONProvider
+    from services.contact_service import cap_response
+    from services.json_codec import ResponseBodies, codec, parse_identify
+
+    stdlib_app, fast_app = Flask('stdlib'), Flask('fast')
+    stdlib_app.json = DefaultJSONProvider(stdlib_app)
+    fast_app.json = FastJSONProvider(fast_app)
+    bodies = ResponseBodies(1, 3600)
+    print(f"codec: {codec.name}, arrays capped at {IDENTIFY_MAX_ARRAY_ITEMS or 'no limit'}")
+
+    print(f"{'contacts':>9} {'body KiB':>9} {'jsonify us':>11} {'provider us':>12} {'cached us':>10} "
+          f"{'provider x':>11} {'cached x':>9}")
+    for size in args.sizes:
+        response = consolidated(size)
+        bodies.put('stamp', codec.dumps(cap_response(response, IDENTIFY_MAX_ARRAY_ITEMS), newline=True))
+
+        with stdlib_app.app_context():
+            old = per_call_us(lambda: jsonify(cap_response(response, IDENTIFY_MAX_ARRAY_ITEMS)), args.min_seconds)
+            size_kib = len(jsonify(cap_response(response, IDENTIFY_MAX_ARRAY_ITEMS)).data) / 1024
+        with fast_app.app_context():
+            new = per_call_us(lambda: jsonify(cap_response(response, IDENTIFY_MAX_ARRAY_ITEMS)), args.min_seconds)
+            cached = per_call_us(lambda: fast_app.response_class(bodies.get('stamp'), mimetype='application/json'),
+                                 args.min_seconds)
+        print(f"{size:>9} {size_kib:>9.1f} {old:>11.1f} {new:>12.1f} {cached:>10.1f} "
+              f"{old / new:>10.1f}x {old / cached:>8.1f}x")
+
+    body = b'{"email": "customer.1@example.com", "phoneNumber": "+1 555 0000001"}'
+    with stdlib_app.test_request_context('/identify', method='POST', data=body, content_type='application/json'):
+        def request_json():
+            # request.json caches the decoded body; drop it so every call parses again
+            request._cached_json = (Ellipsis, Ellipsis)
+            return request.json
+        old = per_call_us(request_json, args.min_seconds)
+    new = per_call_us(lambda: parse_identify(body), args.min_seconds)
+    print(f"\nparse request: request.json {old:.2f}us, parse_identify {new:.2f}us ({old / new:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
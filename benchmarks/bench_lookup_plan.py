@@ -0,0 +1,135 @@
+"""Compare the raw-column contact lookup with the normalized-key lookup, plan and latency
+
+    python benchmarks/bench_lookup_plan.py --rows 10000000 --probes 200
+
+Seeds the contact table (a temporary SQLite file unless DATABASE_URL is set)
+with `rows` contacts whose emails are mixed-case and whose phone numbers are
+formatted, soft-deleting --deleted-ratio of them. Seeding is skipped when the
+table already holds that many rows, so a large PostgreSQL table is built once.
+The old single-column indexes on email/phoneNumber are created next to the new
+partial covering key indexes, so both lookups run against their own index:
+
+  before   email = :email OR "phoneNumber" = :phone, AND "deletedAt" IS NULL
+  after    the matches step of cluster_query: one lookup per key column,
+           each on "emailKey"/"phoneKey" over live rows
+
+Each probe uses the lower-cased email and the bare digits of a seeded phone
+number, as clients typically send them. Reported: the plan of each lookup
+(EXPLAIN ANALYZE with buffers on PostgreSQL, EXPLAIN QUERY PLAN on SQLite),
+the median latency over the probes and how many probes found their contact.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BEFORE = (
+    'SELECT id, "linkedId" FROM contact '
+    'WHERE "deletedAt" IS NULL AND (email = :email OR "phoneNumber" = :phone)'
+)
+AFTER = (
+    'SELECT id, "linkedId" FROM contact WHERE "emailKey" = :email AND "deletedAt" IS NULL '
+    'UNION '
+    'SELECT id, "linkedId" FROM contact WHERE "phoneKey" = :phone AND "deletedAt" IS NULL'
+)
+
+
+def seed(conn, rows: int, deleted_ratio: float) -> None:
+    """Insert contacts 1..rows in one set-based statement, keys derived from the same number"""
+    deleted_every = max(int(1 / deleted_ratio), 1) if deleted_ratio > 0 else 0
+    deleted = f"CASE WHEN n % {deleted_every} = 0 THEN CURRENT_TIMESTAMP END" if deleted_every else "NULL"
+    if conn.dialect.name == 'postgresql':
+        source = f"generate_series(1, {rows}) AS s(n)"
+        digits = "lpad(n::text, 8, '0')"
+        prefix = ''
+    else:
+        source = "series"
+        digits = "printf('%08d', n)"
+        prefix = f"WITH RECURSIVE series(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM series WHERE n < {rows}) "
+    conn.exec_driver_sql(
+        f'{prefix}INSERT INTO contact (email, "phoneNumber", "emailKey", "phoneKey", "linkPrecedence", '
+        f'"createdAt", "updatedAt", "deletedAt") '
+        f"SELECT 'User' || n || '@Example.com', '+1 (555) ' || {digits}, "
+        f"'user' || n || '@example.com', '1555' || {digits}, 'primary', "
+        f"CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, {deleted} FROM {source}"
+    )
+
+
+def explain(conn, sql: str, params: dict) -> str:
+    if conn.dialect.name == 'postgresql':
+        plan = conn.exec_driver_sql(
+            'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql.replace(':email', '%(email)s').replace(':phone', '%(phone)s'),
+            params
+        ).scalar()
+        plan = plan if isinstance(plan, list) else json.loads(plan)
+        return json.dumps(plan[0], indent=2)
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql.replace(':email', '?').replace(':phone', '?'),
+                                (params['email'], params['phone'])).all()
+    return '\n'.join(row[-1] for row in rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--probes', type=int, default=200)
+    parser.add_argument('--deleted-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(), 'lookup.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from sqlalchemy import text
+    from database import engine, init_db
+
+    init_db()
+    with engine.begin() as conn:
+        existing = conn.exec_driver_sql('SELECT COUNT(*) FROM contact').scalar()
+        if existing < args.rows:
+            started = time.perf_counter()
+            conn.exec_driver_sql('DELETE FROM contact')
+            seed(conn, args.rows, args.deleted_ratio)
+            print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+        conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS idx_email ON contact (email)')
+        conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS idx_phone ON contact ("phoneNumber")')
+
+    if engine.dialect.name == 'postgresql':
+        # Index-only scans need an up-to-date visibility map
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM (ANALYZE) contact')
+    else:
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+
+    rng = random.Random(7)
+    probes = [rng.randrange(1, args.rows + 1) for _ in range(args.probes)]
+
+    def params(n: int) -> dict:
+        return {'email': f'user{n}@example.com', 'phone': f'1555{n:08d}'}
+
+    with engine.connect() as conn:
+        for name, sql in (('before', BEFORE), ('after', AFTER)):
+            print(f"\n== {name} ==")
+            print(explain(conn, sql, params(probes[0])))
+
+            stmt = text(sql)
+            timings = []
+            found = 0
+            for n in probes:
+                started = time.perf_counter()
+                rows = conn.execute(stmt, params(n)).all()
+                timings.append(time.perf_counter() - started)
+                found += bool(rows)
+            print(f"{name}: median {statistics.median(timings) * 1000:.3f} ms, "
+                  f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:.3f} ms, "
+                  f"{found}/{len(probes)} probes matched")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Measure the cost of merging two clusters as the demoted cluster grows
+
+    python benchmarks/bench_merge.py --sizes 10 100 1000 10000 --repeats 5
+
+For every size a fresh pair of clusters is seeded: an older single-contact
+cluster and a younger one carrying `size` contacts. One /identify request then
+shares a key with both, demoting the younger primary and re-pointing all of its
+members. Reported per size (medians over the repeats):
+
+  total     end-to-end identify_contact latency, including loading the cluster
+            and building a response that lists every member
+  relink    time spent in the relink UPDATE statement
+  queries   statements issued by the request, which stays constant
+
+The relink UPDATE still writes every re-pointed row, so it grows with the
+rows it changes, but no longer with Python-side work or extra round trips.
+
+Runs against a temporary SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(), 'merge.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from sqlalchemy import event, func, insert, select
+    from database import db_session, engine, init_db
+    from models import Contact
+    from services.contact_service import ContactService
+
+    init_db()
+    service = ContactService(cache=None)
+    statements = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info['started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, time.perf_counter() - conn.info['started']))
+
+    seeded = [0]
+
+    def phone(cluster: int, i: int) -> str:
+        # Phone numbers match on their digits alone, so every contact needs digits of its own
+        return f'+1 {cluster:05d} {i:06d}'
+
+    def seed_cluster(tag: str, size: int) -> int:
+        """Insert a primary and size - 1 secondaries sharing nothing but their linkedId; returns the cluster number"""
+        seeded[0] += 1
+        cluster = seeded[0]
+        primary_id = db_session.execute(
+            insert(Contact).returning(Contact.id),
+            [{'email': f'{tag}-0@bench.io', 'phoneNumber': phone(cluster, 0), 'linkPrecedence': 'primary'}]
+        ).scalar()
+        rows = [
+            {'email': f'{tag}-{i}@bench.io', 'phoneNumber': phone(cluster, i),
+             'linkedId': primary_id, 'linkPrecedence': 'secondary'}
+            for i in range(1, size)
+        ]
+        if rows:
+            db_session.execute(insert(Contact), rows)
+        db_session.commit()
+        return cluster
+
+    print(f"{'size':>8} {'total ms':>10} {'relink ms':>10} {'queries':>8}")
+    for size in args.sizes:
+        totals, relinks, counts = [], [], []
+        for repeat in range(args.repeats):
+            old, young = f'old{size}x{repeat}', f'young{size}x{repeat}'
+            seed_cluster(old, 1)
+            time.sleep(0.01 if engine.dialect.name != 'sqlite' else 1.0)  # SQLite timestamps have 1s resolution
+            young_cluster = seed_cluster(young, size)
+
+            statements.clear()
+            started = time.perf_counter()
+            response = service.identify_contact({'email': f'{old}-0@bench.io', 'phoneNumber': phone(young_cluster, 0)})
+            totals.append(time.perf_counter() - started)
+            db_session.remove()
+
+            assert len(response['contact']['secondaryContactIds']) == size
+            relinks.append(sum(t for sql, t in statements if 'UPDATE contact' in sql))
+            counts.append(len(statements))
+
+        print(f"{size:>8} {statistics.median(totals) * 1000:>10.2f} "
+              f"{statistics.median(relinks) * 1000:>10.2f} {statistics.median(counts):>8.0f}")
+
+    live = db_session.execute(select(func.count()).select_from(Contact)).scalar()
+    print(f"{live} contacts in the benchmark database")
+
+
+if __name__ == '__main__':
+    main()
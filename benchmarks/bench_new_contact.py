@@ -0,0 +1,88 @@
+"""Benchmark new-primary requests with and without the known-key filter
+
+    python benchmarks/bench_new_contact.py --clusters 20000 --requests 2000
+
+Seeds the contact table like bench_identify.py, then creates --requests brand-new
+primaries through ContactService.identify_contact twice: once taking the full
+path (match query, then INSERT) and once with a KeyFilter loaded from the table,
+which skips the match query for keys it has never seen. Reports p50/p95/p99
+latency and SQL statements per request for each, plus how long the filter took
+to build from the table and to reload from a snapshot. Runs on a temporary
+SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else values[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['FALLBACK_DATABASE_URL'] = f"sqlite:///{workdir}/new_contact.db"
+
+    import logging
+    logging.disable(logging.INFO)
+    from sqlalchemy import event
+    from bench_identify import seed
+    from database import db_session, engine
+    from services.contact_service import ContactService
+    from services.key_filter import KeyFilter
+
+    cluster_sizes = seed(args.clusters, {1: 70, 5: 20, 50: 10}, random.Random(args.seed))
+    snapshot = os.path.join(workdir, 'keys.kflt')
+    capacity = 2 * (sum(cluster_sizes) + 2 * args.requests)
+    known_keys = KeyFilter(capacity, args.error_rate, snapshot)
+
+    started = time.perf_counter()
+    known_keys.warm(engine)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    KeyFilter(capacity, args.error_rate).load(snapshot)
+    loaded = time.perf_counter() - started
+    print(f"filter: {known_keys.bloom.bits / 8 / 1024:,.0f} KiB, {known_keys.bloom.hashes} hashes, "
+          f"{known_keys.bloom.count} keys; built in {built * 1000:.0f}ms, snapshot loaded in {loaded * 1000:.1f}ms")
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    print(f"{'filter':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'stmts/req':>10}")
+    try:
+        for label, service in (('off', ContactService(cache=None, group_commit=None, known_keys=None)),
+                               ('on', ContactService(cache=None, group_commit=None, known_keys=known_keys))):
+            latencies = []
+            before = statements[0]
+            for n in range(args.requests):
+                request_started = time.perf_counter()
+                service.identify_contact({'email': f'{label}{n}@new.io', 'phoneNumber': f'7{label == "on":d}{n:08d}'})
+                db_session.remove()
+                latencies.append(time.perf_counter() - request_started)
+            per_request = (statements[0] - before) / args.requests
+            print(f"{label:>7} {percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 95) * 1000:>8.2f} "
+                  f"{percentile(latencies, 99) * 1000:>8.2f} {per_request:>10.2f}")
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+if __name__ == '__main__':
+    main()
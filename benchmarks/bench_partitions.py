@@ -0,0 +1,187 @@
+"""Benchmark lookups on plain and hash-partitioned tables at growing row counts (PostgreSQL)
+
+    DATABASE_URL=postgresql://localhost/scratch python benchmarks/bench_partitions.py \\
+        --drop-tables --rows 1000000 10000000 50000000 --partitions 16
+
+For every --rows count and both layouts (unpartitioned, and --partitions hash
+partitions with DB_HASH_PARTITIONS set), a fresh process drops and recreates
+the contact tables, fills them server-side with generate_series (clusters of
+--cluster-size contacts) and builds the materialized cluster tables to match.
+It then times --samples random requests of two kinds:
+
+  lookup   ContactService.lookup: the pure lookup through cluster_key and
+           contact_cluster that answers repeat requests
+  cluster  ContactService.resolve_cluster: the full-path cluster load that
+           every write starts with
+
+and reports p50/p99 latency, the partitions each plan touched (EXPLAIN ANALYZE),
+the size of the largest idx_email_key (the whole index, or its largest
+partition) and the time to VACUUM the whole contact table and one partition.
+
+It drops the contact tables of DATABASE_URL: point it at a scratch database.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Rows written per transaction while seeding; a multiple of every sensible cluster size
+SEED_CHUNK = 1000000
+
+
+def seed(engine, rows: int, cluster_size: int) -> None:
+    """Fill contact, contact_cluster and cluster_key with `rows` contacts in clusters of `cluster_size`"""
+    from sqlalchemy import text
+
+    chunk = SEED_CHUNK - SEED_CHUNK % cluster_size
+    for start in range(1, rows + 1, chunk):
+        bounds = {'start': start, 'stop': min(start + chunk - 1, rows), 'size': cluster_size}
+        with engine.begin() as conn:
+            conn.execute(text(
+                'INSERT INTO contact (id, email, "emailKey", "phoneNumber", "phoneKey", "linkedId", "linkPrecedence") '
+                "SELECT g, 'u' || g || '@part.io', 'u' || g || '@part.io', lpad(g::text, 10, '0'), "
+                "lpad(g::text, 10, '0'), CASE WHEN (g - 1) % :size = 0 THEN NULL ELSE g - (g - 1) % :size END, "
+                "(CASE WHEN (g - 1) % :size = 0 THEN 'primary' ELSE 'secondary' END)::link_precedence_enum "
+                'FROM generate_series(:start, :stop) g'
+            ), bounds)
+            conn.execute(text(
+                'INSERT INTO contact_cluster ("primaryId", emails, "phoneNumbers", "secondaryContactIds") '
+                'SELECT COALESCE("linkedId", id), json_agg(email ORDER BY id), json_agg("phoneNumber" ORDER BY id), '
+                "COALESCE(json_agg(id ORDER BY id) FILTER (WHERE \"linkedId\" IS NOT NULL), '[]'::json) "
+                'FROM contact WHERE id BETWEEN :start AND :stop GROUP BY COALESCE("linkedId", id)'
+            ), bounds)
+            conn.execute(text(
+                'INSERT INTO cluster_key (kind, key, "primaryId") '
+                "SELECT 'email'::cluster_key_kind_enum, \"emailKey\", COALESCE(\"linkedId\", id) "
+                'FROM contact WHERE id BETWEEN :start AND :stop '
+                "UNION ALL SELECT 'phone'::cluster_key_kind_enum, \"phoneKey\", COALESCE(\"linkedId\", id) "
+                'FROM contact WHERE id BETWEEN :start AND :stop'
+            ), bounds)
+        print(f"  seeded {bounds['stop']:,} rows", file=sys.stderr)
+    with engine.begin() as conn:
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('contact', 'id'), (SELECT MAX(id) FROM contact))"))
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM (ANALYZE) contact'))
+        conn.execute(text('VACUUM (ANALYZE) contact_cluster'))
+        conn.execute(text('VACUUM (ANALYZE) cluster_key'))
+
+
+def partitions_touched(engine, stmt) -> int:
+    """Partition (or table) scans EXPLAIN ANALYZE shows the statement executing"""
+    from sqlalchemy import text
+
+    sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        plan = [row[0] for row in conn.execute(text(f'EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF) {sql}'))]
+    scans = [line for line in plan if re.search(r' on (contact|cluster_key|contact_cluster)(_p\d+)?\b', line)
+             and 'never executed' not in line]
+    return len(scans)
+
+
+def run_child(rows: int, cluster_size: int, samples: int) -> None:
+    import logging
+    logging.disable(logging.INFO)
+    from sqlalchemy import text
+    from config import DB_HASH_PARTITIONS
+    from database import Base, db_session, engine, init_db
+    from services.contact_service import ContactService, cluster_query, consolidated_query
+
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    started = time.perf_counter()
+    seed(engine, rows, cluster_size)
+    seeded = time.perf_counter() - started
+
+    service = ContactService(cache=None, group_commit=None, reads=None, known_keys=None)
+    rng = random.Random(rows)
+    timings = {'lookup': [], 'cluster': []}
+    for _ in range(samples):
+        n = rng.randint(1, rows)
+        email, phone_number = f'u{n}@part.io', f'{n:010d}'
+        started = time.perf_counter()
+        service.lookup({'email': email, 'phoneNumber': phone_number})
+        timings['lookup'].append(time.perf_counter() - started)
+        db_session.rollback()
+        started = time.perf_counter()
+        service.resolve_cluster(email, phone_number)
+        timings['cluster'].append(time.perf_counter() - started)
+        db_session.rollback()
+    db_session.remove()
+
+    n = rng.randint(1, rows)
+    touched = {
+        'lookup': partitions_touched(engine, consolidated_query(f'u{n}@part.io', f'{n:010d}')),
+        'cluster': partitions_touched(engine, cluster_query([f'u{n}@part.io'], [f'{n:010d}'])),
+    }
+    with engine.connect() as conn:
+        index_bytes = conn.execute(text(
+            "SELECT COALESCE((SELECT max(pg_relation_size(relid)) FROM pg_partition_tree('idx_email_key') "
+            "WHERE isleaf), pg_relation_size('idx_email_key'))"
+        )).scalar()
+    vacuum = {}
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in ('contact', 'contact_p0') if DB_HASH_PARTITIONS > 0 else ('contact',):
+            started = time.perf_counter()
+            conn.execute(text(f'VACUUM {table}'))
+            vacuum[table] = time.perf_counter() - started
+
+    def quantile(values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    print(json.dumps({
+        'seed_seconds': seeded,
+        'latency': {kind: {'p50': quantile(values, 0.5), 'p99': quantile(values, 0.99)}
+                    for kind, values in timings.items()},
+        'touched': touched,
+        'index_bytes': index_bytes,
+        'vacuum': vacuum,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000, 50000000])
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--cluster-size', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--drop-tables', action='store_true', help='confirm DATABASE_URL is a scratch database')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.cluster_size, args.samples)
+        return
+    if not os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        raise SystemExit('Partitioning needs PostgreSQL: set DATABASE_URL to a scratch database')
+    if not args.drop_tables:
+        raise SystemExit('This drops and recreates the contact tables; pass --drop-tables to confirm')
+
+    print(f"{'rows':>11} {'partitions':>10} {'lookup p50/p99 ms':>18} {'cluster p50/p99 ms':>19} "
+          f"{'scans l/c':>9} {'email idx MiB':>13} {'vacuum s':>14}")
+    for rows in args.rows:
+        for partitions in (0, args.partitions):
+            env = dict(os.environ, DB_HASH_PARTITIONS=str(partitions), CLUSTER_CACHE_SIZE='0')
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', str(rows),
+                 '--cluster-size', str(args.cluster_size), '--samples', str(args.samples)],
+                cwd=ROOT, env=env, check=True, capture_output=True, text=True
+            )
+            r = json.loads(result.stdout.strip().splitlines()[-1])
+            lookup, cluster = r['latency']['lookup'], r['latency']['cluster']
+            vacuum = '/'.join(f"{seconds:.1f}" for seconds in r['vacuum'].values())
+            print(f"{rows:>11,} {partitions:>10} {lookup['p50'] * 1000:>8.2f}/{lookup['p99'] * 1000:<9.2f} "
+                  f"{cluster['p50'] * 1000:>9.2f}/{cluster['p99'] * 1000:<9.2f} "
+                  f"{r['touched']['lookup']:>4}/{r['touched']['cluster']:<4} "
+                  f"{r['index_bytes'] / 2 ** 20:>13.1f} {vacuum:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Microbenchmark the consolidated-response read path: ORM entities versus projected rows
+
+    python benchmarks/bench_read_path.py --sizes 1 10 1000 --iterations 200
+
+For each cluster size one cluster is seeded, then the same cluster query is run
+and turned into a response two ways:
+
+  orm    select(Contact) hydrated into ORM entities, deduplicated with the
+         list `not in` checks the service used before
+  lean   the projected ContactRow query and build_consolidated as served now
+
+Reported per request: CPU time (time.process_time, which excludes time spent
+waiting on a database server) and the peak Python memory allocated while
+serving it, measured with tracemalloc in a separate pass. Runs on a temporary
+SQLite file unless DATABASE_URL is set; SQLite runs in-process, so its query
+execution is part of the CPU time and dominates it for small clusters.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_build(primary, secondaries):
+    """The response builder as it was before projected rows, kept here for comparison"""
+    emails = [primary.email] if primary.email else []
+    phone_numbers = [primary.phoneNumber] if primary.phoneNumber else []
+    secondary_ids = []
+    for secondary in secondaries:
+        secondary_ids.append(secondary.id)
+        if secondary.email and secondary.email not in emails:
+            emails.append(secondary.email)
+        if secondary.phoneNumber and secondary.phoneNumber not in phone_numbers:
+            phone_numbers.append(secondary.phoneNumber)
+    return {'contact': {'primaryContatctId': primary.id, 'emails': emails,
+                        'phoneNumbers': phone_numbers, 'secondaryContactIds': secondary_ids}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 1000])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(), 'read.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from sqlalchemy import insert
+    from database import db_session, init_db
+    from models import Contact
+    from services.contact_service import ContactService, cluster_query
+
+    init_db()
+    service = ContactService(cache=None)
+
+    def orm_request(email):
+        stmt = cluster_query([email], []).with_only_columns(Contact)
+        cluster = db_session.execute(stmt).scalars().all()
+        primary = cluster[0]
+        response = legacy_build(primary, cluster[1:])
+        db_session.rollback()  # end the read transaction and release the identity map, as a request would
+        return response
+
+    def lean_request(email):
+        cluster = service.resolve_cluster(email, None)
+        primary, _ = service.plan_merge(cluster)
+        response = service.build_consolidated(primary, [c for c in cluster if c is not primary])
+        db_session.rollback()
+        return response
+
+    def measure(fn, email):
+        fn(email)  # warm up statement caches
+        started = time.process_time()
+        for _ in range(args.iterations):
+            fn(email)
+        return (time.process_time() - started) / args.iterations
+
+    def peak_memory(fn, email):
+        tracemalloc.start()
+        fn(email)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    print(f"{'size':>6} {'path':>5} {'cpu us':>10} {'peak KiB':>10}")
+    for size in args.sizes:
+        rows = [{'email': f'r{size}-{i}@bench.io', 'phoneNumber': f'{size}{i:06d}',
+                 'linkPrecedence': 'primary' if i == 0 else 'secondary'} for i in range(size)]
+        primary_id = db_session.execute(insert(Contact).returning(Contact.id), rows[:1]).scalar()
+        for row in rows[1:]:
+            row['linkedId'] = primary_id
+        if rows[1:]:
+            db_session.execute(insert(Contact), rows[1:])
+        db_session.commit()
+
+        email = f'r{size}-0@bench.io'
+        assert orm_request(email) == lean_request(email)
+        for name, fn in (('orm', orm_request), ('lean', lean_request)):
+            cpu = measure(fn, email)
+            peak = peak_memory(fn, email)
+            print(f"{size:>6} {name:>5} {cpu * 1e6:>10.1f} {peak / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Check read-replica routing and read-your-writes against two local databases
+
+    python benchmarks/check_replica_routing.py
+    python benchmarks/check_replica_routing.py --primary postgresql://.../a --replica postgresql://.../b
+
+Uses two temporary SQLite files by default. The replica is brought up to date by
+copying the primary's tables into it and otherwise lags, so the script can check:
+
+  - lookups of rows already on the replica are served by it
+  - after a new secondary, lookups by the written key and by another key of the
+    same cluster go to the primary and see the new contact
+  - after a merge, lookups through the demoted cluster go to the primary
+  - requests that need a write never touch the replica's answer
+  - once the read-your-writes window has passed, lookups return to the replica
+
+Exits non-zero on the first failed check.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WINDOW = 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--primary', help='primary database URL (temporary SQLite file by default)')
+    parser.add_argument('--replica', help='replica database URL (temporary SQLite file by default)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.primary or f'sqlite:///{directory}/primary.db'
+    os.environ['DATABASE_REPLICA_URL'] = args.replica or f'sqlite:///{directory}/replica.db'
+    os.environ['READ_YOUR_WRITES_SECONDS'] = str(WINDOW)
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+
+    from sqlalchemy import delete, event, insert, select
+    from app import create_app
+    from database import Base, engine, init_db, replica_engine
+
+    client = create_app().test_client()
+    init_db()
+    Base.metadata.create_all(bind=replica_engine)
+    counts = {'primary': 0, 'replica': 0}
+    event.listen(engine, 'before_cursor_execute', lambda *a: counts.__setitem__('primary', counts['primary'] + 1))
+    event.listen(replica_engine, 'before_cursor_execute', lambda *a: counts.__setitem__('replica', counts['replica'] + 1))
+
+    def replicate() -> None:
+        with engine.connect() as source, replica_engine.begin() as target:
+            for table in Base.metadata.sorted_tables:
+                rows = [dict(row._mapping) for row in source.execute(select(table))]
+                target.execute(delete(table))
+                if rows:
+                    target.execute(insert(table), rows)
+
+    def identify(payload):
+        before = dict(counts)
+        response = client.post('/identify', json=payload)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        served = [name for name in counts if counts[name] != before[name]]
+        return response.get_json()['contact'], served
+
+    def check(label: str, condition: bool) -> None:
+        print(f"{'ok' if condition else 'FAILED':>6}  {label}")
+        if not condition:
+            raise SystemExit(1)
+
+    a, _ = identify({'email': 'a@replica.io', 'phoneNumber': '100'})
+    b, _ = identify({'email': 'b@replica.io', 'phoneNumber': '200'})
+    time.sleep(WINDOW)
+    replicate()
+
+    contact, served = identify({'email': 'a@replica.io', 'phoneNumber': '100'})
+    check('synced lookup is served by the replica', served == ['replica'])
+
+    contact, served = identify({'email': 'a@replica.io', 'phoneNumber': '300'})
+    check('new secondary is written on the primary', '300' in contact['phoneNumbers'] and 'primary' in served)
+
+    contact, served = identify({'email': 'a@replica.io'})
+    check('lookup by a just-written key reads the primary', served == ['primary'] and '300' in contact['phoneNumbers'])
+
+    contact, served = identify({'phoneNumber': '100'})
+    check('lookup through a just-written cluster falls back to the primary',
+          'primary' in served and '300' in contact['phoneNumbers'])
+
+    contact, served = identify({'email': 'b@replica.io', 'phoneNumber': '100'})
+    check('merge is written on the primary', contact['primaryContatctId'] == a['primaryContatctId'])
+
+    contact, served = identify({'phoneNumber': '200'})
+    check('lookup through a demoted cluster sees the merge',
+          'primary' in served and contact['primaryContatctId'] == a['primaryContatctId'])
+
+    time.sleep(WINDOW)
+    replicate()
+    contact, served = identify({'phoneNumber': '200'})
+    check('after the window, lookups return to the replica',
+          served == ['replica'] and contact['primaryContatctId'] == a['primaryContatctId'])
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Small asyncio HTTP/1.1 load generator shared by the benchmark scripts
+
+It speaks just enough HTTP to drive the API (JSON bodies, Content-Length framing,
+keep-alive with reconnects) so benchmarks need no client dependency.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Connection:
+    """One keep-alive client connection that transparently reconnects when the server closes it"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload: Any = None) -> Tuple[int, bytes, Dict[str, str]]:
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(head + body)
+                await self.writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+        raise ConnectionError('unreachable')
+
+    async def _read_response(self) -> Tuple[int, bytes, Dict[str, str]]:
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body, headers
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float, statuses: Dict[int, int]) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds) for one load run"""
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())}
+    }
+
+
+async def run_load(host: str,
+                   port: int,
+                   next_request: Callable[[int], Tuple[str, str, Any]],
+                   concurrency: int,
+                   total: int,
+                   label: Optional[Callable[[int], str]] = None) -> Dict[str, Any]:
+    """Issue `total` requests from `concurrency` closed-loop clients and summarize them
+
+    When `label` is given, latencies are also summarized per label under 'by_label'.
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    labelled: Dict[str, List[float]] = {}
+    counter = iter(range(total))
+
+    async def client() -> None:
+        conn = Connection(host, port)
+        try:
+            for n in counter:
+                method, path, payload = next_request(n)
+                started = time.perf_counter()
+                try:
+                    status, _, _ = await conn.request(method, path, payload)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    status = 599
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                if label is not None:
+                    labelled.setdefault(label(n), []).append(latencies[-1])
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    summary = summarize(latencies, elapsed, statuses)
+    if label is not None:
+        summary['by_label'] = {name: summarize(values, elapsed, {}) for name, values in sorted(labelled.items())}
+    return summary
+
+
+async def run_rate(host: str,
+                   port: int,
+                   next_request: Callable[[int], Tuple[str, str, Any]],
+                   rate: float,
+                   total: int,
+                   label: Optional[Callable[[int], str]] = None) -> Dict[str, Any]:
+    """Issue `total` requests at a fixed `rate` per second, whether or not earlier ones have answered
+
+    Unlike run_load's closed loop, arrivals do not slow down when the server does,
+    so offering more than the server can handle shows how it copes with overload.
+    Latencies are also summarized per status under 'by_status' (and per label
+    and status under 'by_label').
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    by_status: Dict[int, List[float]] = {}
+    labelled: Dict[str, List[float]] = {}
+    idle: List[Connection] = []
+    opened: List[Connection] = []
+
+    async def send(n: int) -> None:
+        conn = idle.pop() if idle else Connection(host, port)
+        if conn not in opened:
+            opened.append(conn)
+        method, path, payload = next_request(n)
+        started = time.perf_counter()
+        try:
+            status, _, _ = await conn.request(method, path, payload)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            status = 599
+            conn.close()
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+        by_status.setdefault(status, []).append(latencies[-1])
+        if label is not None:
+            labelled.setdefault(f"{label(n)} {status}", []).append(latencies[-1])
+        idle.append(conn)
+
+    started = time.perf_counter()
+    tasks = []
+    for n in range(total):
+        delay = started + n / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(n)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    for conn in opened:
+        conn.close()
+    summary = summarize(latencies, elapsed, statuses)
+    summary['by_status'] = {str(status): summarize(values, elapsed, {}) for status, values in sorted(by_status.items())}
+    if label is not None:
+        summary['by_label'] = {name: summarize(values, elapsed, {}) for name, values in sorted(labelled.items())}
+    return summary
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: List[str], port: int, env: Dict[str, str], timeout: float = 30) -> subprocess.Popen:
+    """Start a server process from the project root and wait until /health answers"""
+    process = subprocess.Popen(
+        [sys.executable, '-m', *args], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited early: {' '.join(args)}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Server did not become healthy: {' '.join(args)}")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
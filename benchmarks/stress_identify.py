@@ -0,0 +1,178 @@
+"""Hammer /identify from many threads with colliding keys and check the cluster invariants
+
+    python benchmarks/stress_identify.py --threads 16 --requests 4000 --keys 60
+
+Every thread draws emails and phone numbers from one small shared pool, so most
+requests touch a cluster another thread is merging at the same moment. Requests
+go straight through ContactService (a temporary SQLite file unless DATABASE_URL
+is set) and the cluster cache is disabled. A request that runs out of lock
+attempts (LockContention, answered 503 by the routes) is retried, as a client
+would after Retry-After, and counted. Afterwards every cluster must have
+exactly one primary, the oldest by (createdAt, id), every other member must link
+directly to it, no email or phone number may appear in two clusters and no
+email/phone pair may be stored twice. The materialized contact_cluster and
+cluster_key tables must agree with the contact rows. Exits non-zero on any
+violation.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def check_invariants(contacts) -> list:
+    """Return a description of every broken cluster invariant
+
+    A request can merge two clusters without inserting a row, so clusters are
+    the linkedId groups rather than the components of shared keys; what must
+    hold is that no email or phone number is split across two clusters.
+    """
+    by_id = {c.id: c for c in contacts}
+    problems = []
+    clusters = {}
+    for c in contacts:
+        if c.linkPrecedence == 'primary' and c.linkedId is None:
+            clusters.setdefault(c.id, []).append(c)
+            continue
+        parent = by_id.get(c.linkedId)
+        if c.linkPrecedence != 'secondary' or parent is None or parent.linkedId is not None:
+            problems.append(f"contact {c.id}: not linked directly to a primary (linkedId {c.linkedId})")
+            continue
+        clusters.setdefault(parent.id, []).append(c)
+
+    seen = {}
+    for c in contacts:
+        pair = (c.emailKey, c.phoneKey)
+        if pair in seen:
+            problems.append(f"contact {c.id}: duplicates contact {seen[pair]}")
+        seen.setdefault(pair, c.id)
+
+    owner = {}
+    for primary_id, members in clusters.items():
+        oldest = min(members, key=lambda c: (c.createdAt, c.id))
+        if oldest.id != primary_id:
+            problems.append(f"cluster of {primary_id}: older member {oldest.id} is not primary")
+        for c in members:
+            for key in (('email', c.emailKey), ('phoneNumber', c.phoneKey)):
+                if key[1] and owner.setdefault(key, primary_id) != primary_id:
+                    problems.append(f"{key[0]} {key[1]} split across clusters {owner[key]} and {primary_id}")
+    return problems
+
+
+def check_materialized(contacts, stored, keys) -> list:
+    """Compare the contact_cluster and cluster_key tables with a rebuild from the contact rows"""
+    from services.contact_service import ContactService
+
+    service = ContactService(cache=None)
+    problems = []
+    clusters = {}
+    for c in sorted(contacts, key=lambda c: c.id):
+        clusters.setdefault(c.linkedId if c.linkedId is not None else c.id, []).append(c)
+    by_id = {c.id: c for c in contacts}
+    stored = {row.primaryId: row for row in stored}
+    for primary_id in set(stored) - set(clusters):
+        problems.append(f"contact_cluster row {primary_id} is not a primary")
+    for primary_id, members in clusters.items():
+        expected = service.build_consolidated(by_id[primary_id], [c for c in members if c.id != primary_id])['contact']
+        row = stored.get(primary_id)
+        actual = row and {'primaryContatctId': row.primaryId, 'emails': row.emails,
+                          'phoneNumbers': row.phoneNumbers, 'secondaryContactIds': row.secondaryContactIds}
+        if actual != expected:
+            problems.append(f"contact_cluster row {primary_id}: {actual} != {expected}")
+    keys = {(row.kind, row.key): row.primaryId for row in keys}
+    for primary_id, members in clusters.items():
+        for c in members:
+            for key in (('email', c.emailKey), ('phone', c.phoneKey)):
+                if key[1] and keys.get(key) != primary_id:
+                    problems.append(f"cluster_key {key}: points at {keys.get(key)}, not {primary_id}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000, help='total requests across all threads')
+    parser.add_argument('--keys', type=int, default=60, help='size of the shared email and phone pools')
+    parser.add_argument('--batch-ratio', type=float, default=0.1,
+                        help='share of requests sent as small /identify/batch calls')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['CLUSTER_CACHE_SIZE'] = '0'
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from database import db_session, init_db
+    from models import ClusterKey, Contact, ContactCluster
+    from services.contact_service import ContactService
+    from services.key_locks import LockContention
+
+    init_db()
+    service = ContactService(cache=None)
+    per_thread = args.requests // args.threads
+    errors = []
+    contended = []
+
+    def send(call, payload) -> None:
+        # Running out of lock attempts is the routes' 503: nothing was written, so retry like a client would
+        while True:
+            try:
+                return call(payload)
+            except LockContention:
+                contended.append(1)
+                time.sleep(0.01)
+
+    def record(rng):
+        return {
+            'email': f'u{rng.randrange(args.keys)}@stress.io' if rng.random() < 0.8 else None,
+            'phoneNumber': f'7{rng.randrange(args.keys):05d}' if rng.random() < 0.8 else None
+        }
+
+    def worker(n: int) -> None:
+        rng = random.Random(args.seed * 1000 + n)
+        try:
+            for _ in range(per_thread):
+                if rng.random() < args.batch_ratio:
+                    records = [r for r in (record(rng) for _ in range(4)) if r['email'] or r['phoneNumber']]
+                    if records:
+                        send(service.identify_batch, records)
+                    continue
+                payload = record(rng)
+                if payload['email'] or payload['phoneNumber']:
+                    send(service.identify_contact, payload)
+        except Exception as e:
+            errors.append(f"thread {n}: {e!r}")
+        finally:
+            db_session.remove()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    contacts = db_session.query(Contact).filter(Contact.deletedAt.is_(None)).all()
+    problems = errors + check_invariants(contacts)
+    if not problems:
+        problems = check_materialized(contacts, db_session.query(ContactCluster).all(), db_session.query(ClusterKey).all())
+    print(f"{args.threads} threads, {per_thread * args.threads} requests in {elapsed:.2f}s, "
+          f"{len(contacts)} contacts, {service.key_locks.retries} lock retries, "
+          f"{len(contended)} requests retried after LockContention")
+    for problem in problems[:20]:
+        print(f"  {problem}")
+    if problems:
+        print(f"FAILED: {len(problems)} problems")
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+"""Offline bulk import and re-reconciliation of the contact table
+
+    python bulk_import.py import contacts.csv [--format jsonl] [--chunk-size 5000]
+    python bulk_import.py rebuild [--chunk-size 5000]
+    python bulk_import.py refresh [--chunk-size 5000]
+
+Input files carry email, phoneNumber and an optional ISO-8601 createdAt per
+record (CSV header or JSONL keys). Identity clusters are computed in memory with
+union-find over the emails and phone numbers, and the oldest contact of each
+cluster by createdAt becomes its primary. Rows are streamed in chunks, so memory
+grows with the number of distinct emails and phone numbers, never with rows.
+
+import and rebuild append change-feed events (cluster_event) in the transactions
+that write the contacts: 'created' and 'secondary_added' for imported rows,
+'primary_demoted' for primaries a rebuild merges away and 'resync' for every
+other cluster it relinks. Both finish by refreshing the materialized
+contact_cluster and cluster_key tables, which refresh also does on its own (for
+example to backfill them on a database created before they existed).
+
+import and rebuild expect exclusive access to the contact table while they run.
+refresh takes the service's own cluster locks and is safe to run against a live
+PostgreSQL database. On SQLite those locks only cover one process, so stop the
+service first.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+import argparse
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import delete, func, select, update, bindparam, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db_session, engine, init_db
+from models import ClusterKey, Contact, ContactCluster
+from services.cluster_cache import cluster_cache
+from services.contact_service import ContactService, record_events, resync_events
+from services.key_locks import key_locks
+from services.normalize import normalize_email, normalize_phone
+from services.union_find import UnionFind
+
+contact_table = Contact.__table__
+
+# INSERT ... ON CONFLICT for refreshing the materialized cluster tables
+upsert = (postgresql if engine.dialect.name == 'postgresql' else sqlite).insert
+
+
+class ClusterIndex:
+    """Union-find over email/phone tokens that remembers the oldest contact of each cluster"""
+
+    def __init__(self):
+        self.forest = UnionFind()
+        self.oldest: Dict[str, Tuple] = {}
+
+    def add(self, tokens: List[str], age: Tuple, ident: Any) -> None:
+        roots = set()
+        for token in tokens:
+            self.forest.add(token)
+            roots.add(self.forest.find(token))
+
+        winner = roots.pop()
+        for root in roots:
+            self.forest.union(winner, root)
+
+        oldest = (age, ident)
+        for root in (winner, *roots):
+            current = self.oldest.pop(root, None)
+            if current is not None and current[0] < oldest[0]:
+                oldest = current
+        self.oldest[winner] = oldest
+
+    def primary_of(self, tokens: List[str]) -> Any:
+        return self.oldest[self.forest.find(tokens[0])][1]
+
+
+def tokens_for(email: Optional[str], phone_number: Optional[str], ident: Any) -> List[str]:
+    """Union-find tokens for a contact's normalized keys; contacts with neither key form their own cluster"""
+    tokens = []
+    if email:
+        tokens.append(f"e:{normalize_email(email)}")
+    if phone_number:
+        tokens.append(f"p:{normalize_phone(phone_number)}")
+    return tokens or [f"row:{ident}"]
+
+
+def parse_timestamp(value: Optional[str], default: datetime) -> datetime:
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def iter_records(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Stream {email, phoneNumber, createdAt} records from a CSV or JSONL file"""
+    with open(path, newline='') as f:
+        rows = csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            phone_number = row.get('phoneNumber')
+            yield {
+                'email': row.get('email') or None,
+                'phoneNumber': str(phone_number) if phone_number not in (None, '') else None,
+                'createdAt': row.get('createdAt') or None
+            }
+
+
+def chunked(items: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def report(phase: str, rows: int, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"{phase}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+
+def write_rows(conn, rows: List[Dict[str, Any]]) -> None:
+    """Insert one chunk of contacts with COPY on PostgreSQL and executemany elsewhere"""
+    if conn.dialect.name != 'postgresql':
+        conn.execute(contact_table.insert(), rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            row['id'], row['email'], row['phoneNumber'], row['emailKey'], row['phoneKey'], row['linkedId'],
+            row['linkPrecedence'], row['createdAt'].isoformat(), row['updatedAt'].isoformat()
+        ])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert(
+        'COPY contact (id, email, "phoneNumber", "emailKey", "phoneKey", "linkedId", "linkPrecedence", '
+        '"createdAt", "updatedAt") '
+        'FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+
+
+def import_file(path: str, fmt: str, chunk_size: int) -> None:
+    """Load a file of historical contacts, linking them into clusters as they are written
+
+    Ids are assigned up front from max(id), so each row's linkedId is known before
+    it is written. Primaries are written before secondaries to satisfy the
+    foreign key, then the id sequence is moved past the imported rows. If the table
+    already held contacts, the whole table is re-reconciled afterwards.
+    """
+    imported_at = datetime.now(timezone.utc)
+
+    with engine.connect() as conn:
+        start_id = (conn.execute(select(func.max(Contact.id))).scalar() or 0) + 1
+        had_rows = start_id > 1
+
+    # Pass 1: build clusters over the file
+    started = time.perf_counter()
+    index = ClusterIndex()
+    total = 0
+    for line, record in enumerate(iter_records(path, fmt)):
+        created_at = parse_timestamp(record['createdAt'], imported_at)
+        index.add(tokens_for(record['email'], record['phoneNumber'], line), (created_at, line), line)
+        total += 1
+    report('cluster', total, started)
+
+    def rows_for(primaries: bool) -> Iterator[Dict[str, Any]]:
+        for line, record in enumerate(iter_records(path, fmt)):
+            primary_line = index.primary_of(tokens_for(record['email'], record['phoneNumber'], line))
+            if (primary_line == line) != primaries:
+                continue
+            created_at = parse_timestamp(record['createdAt'], imported_at)
+            yield {
+                'id': start_id + line,
+                'email': record['email'],
+                'phoneNumber': record['phoneNumber'],
+                'emailKey': normalize_email(record['email']),
+                'phoneKey': normalize_phone(record['phoneNumber']),
+                'linkedId': None if primaries else start_id + primary_line,
+                'linkPrecedence': 'primary' if primaries else 'secondary',
+                'createdAt': created_at,
+                'updatedAt': imported_at
+            }
+
+    # Passes 2 and 3: write primaries, then the secondaries that reference them
+    for phase, primaries in (('write primaries', True), ('write secondaries', False)):
+        started = time.perf_counter()
+        written = 0
+        for chunk in chunked(rows_for(primaries), chunk_size):
+            with engine.begin() as conn:
+                write_rows(conn, chunk)
+                record_events(conn, [
+                    {'kind': 'created' if primaries else 'secondary_added', 'contactId': row['id'],
+                     'primaryId': row['linkedId'] or row['id'], 'previousPrimaryId': None}
+                    for row in chunk
+                ])
+            written += len(chunk)
+        report(phase, written, started)
+
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('contact', 'id'), (SELECT MAX(id) FROM contact))"))
+
+    if had_rows:
+        rebuild(chunk_size)
+    else:
+        refresh(chunk_size)
+        cluster_cache.clear()
+
+
+def iter_table(chunk_size: int) -> Iterator[Tuple]:
+    """Stream live contacts in id order with keyset pagination, one short query per chunk"""
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(Contact.id, Contact.email, Contact.phoneNumber, Contact.linkedId,
+                       Contact.linkPrecedence, Contact.createdAt)
+                .where(Contact.deletedAt.is_(None), Contact.id > last_id)
+                .order_by(Contact.id)
+                .limit(chunk_size)
+            ).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+
+def relink_events(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Change-feed rows for one chunk of rebuild's linkage changes
+
+    A primary that becomes a secondary is a 'primary_demoted' event, as when
+    /identify merges it. Any other change is reported as a 'resync' of the
+    clusters the contact left and joined.
+    """
+    demoted = [c for c in chunk if c['previous_linked_id'] is None and c['linked_id'] is not None]
+    events = [
+        {'kind': 'primary_demoted', 'contactId': c['contact_id'], 'primaryId': c['linked_id'],
+         'previousPrimaryId': c['contact_id']}
+        for c in demoted
+    ]
+    demoted_ids = {c['contact_id'] for c in demoted}
+    touched = set()
+    for c in chunk:
+        if c['contact_id'] not in demoted_ids:
+            touched.add(c['linked_id'] or c['contact_id'])
+            if c['previous_linked_id'] is not None:
+                touched.add(c['previous_linked_id'])
+    return events + resync_events(touched - demoted_ids)
+
+
+def rebuild(chunk_size: int) -> None:
+    """Recompute linkedId/linkPrecedence for every live contact in place
+
+    Clusters are rebuilt from scratch over emails and phone numbers, the oldest
+    contact of each cluster becomes primary and every other member links straight
+    to it. Only rows whose linkage changes are updated.
+    """
+    started = time.perf_counter()
+    index = ClusterIndex()
+    total = 0
+    for row in iter_table(chunk_size):
+        index.add(tokens_for(row.email, row.phoneNumber, row.id), (row.createdAt, row.id), row.id)
+        total += 1
+    report('cluster', total, started)
+
+    def changes() -> Iterator[Dict[str, Any]]:
+        for row in iter_table(chunk_size):
+            primary_id = index.primary_of(tokens_for(row.email, row.phoneNumber, row.id))
+            linked_id, precedence = (None, 'primary') if primary_id == row.id else (primary_id, 'secondary')
+            if (row.linkedId, row.linkPrecedence) != (linked_id, precedence):
+                yield {'contact_id': row.id, 'linked_id': linked_id, 'precedence': precedence,
+                       'previous_linked_id': row.linkedId}
+
+    stmt = (
+        update(contact_table)
+        .where(contact_table.c.id == bindparam('contact_id'))
+        .values(linkedId=bindparam('linked_id'), linkPrecedence=bindparam('precedence'))
+    )
+    started = time.perf_counter()
+    changed = 0
+    for chunk in chunked(changes(), chunk_size):
+        with engine.begin() as conn:
+            conn.execute(stmt, [
+                {'contact_id': c['contact_id'], 'linked_id': c['linked_id'], 'precedence': c['precedence']}
+                for c in chunk
+            ])
+            record_events(conn, relink_events(chunk))
+        changed += len(chunk)
+    report('relink', changed, started)
+
+    refresh(chunk_size)
+    cluster_cache.clear()
+
+
+def live_primary(primary_id):
+    """EXISTS condition: `primary_id` is a live primary contact"""
+    return (
+        select(Contact.id)
+        .where(Contact.id == primary_id, Contact.linkedId.is_(None), Contact.deletedAt.is_(None))
+        .exists()
+    )
+
+
+def locked(roots: List[int], write) -> None:
+    """Run write() in one transaction under the identify path's locks on the given cluster roots"""
+    locks = key_locks.acquire(db_session, [], [], set(roots))
+    try:
+        write()
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        locks.release()
+
+
+def refresh_chunk(service: ContactService, ids: List[int]) -> None:
+    """Re-read the clusters of one page of primaries and upsert their rows and keys, under their root locks"""
+    columns = (Contact.id, Contact.email, Contact.phoneNumber, Contact.emailKey, Contact.phoneKey, Contact.linkedId)
+
+    def write():
+        # Primaries demoted since the page was read are skipped; the merge that demoted them dropped their rows
+        primaries = db_session.execute(
+            select(*columns)
+            .where(Contact.id.in_(ids), Contact.linkedId.is_(None), Contact.deletedAt.is_(None))
+            .order_by(Contact.id)
+        ).all()
+        if not primaries:
+            return
+        secondaries = db_session.execute(
+            select(*columns)
+            .where(Contact.linkedId.in_([p.id for p in primaries]), Contact.deletedAt.is_(None))
+            .order_by(Contact.id)
+        ).all()
+
+        members = {p.id: [] for p in primaries}
+        for row in secondaries:
+            members[row.linkedId].append(row)
+        cluster_rows = []
+        key_rows = {}
+        for primary in primaries:
+            contact = service.build_consolidated(primary, members[primary.id])['contact']
+            cluster_rows.append({
+                'primaryId': primary.id, 'emails': contact['emails'], 'phoneNumbers': contact['phoneNumbers'],
+                'secondaryContactIds': contact['secondaryContactIds']
+            })
+            for row in (primary, *members[primary.id]):
+                for kind, key in (('email', row.emailKey), ('phone', row.phoneKey)):
+                    if key:
+                        key_rows[(kind, key)] = {'kind': kind, 'key': key, 'primaryId': primary.id}
+
+        stored = upsert(ContactCluster)
+        db_session.execute(stored.on_conflict_do_update(
+            index_elements=[ContactCluster.primaryId],
+            set_={
+                'emails': stored.excluded.emails,
+                'phoneNumbers': stored.excluded.phoneNumbers,
+                'secondaryContactIds': stored.excluded.secondaryContactIds,
+                'updatedAt': func.now()
+            }
+        ), cluster_rows)
+        # Keys of contacts deleted since the last refresh go; the live ones are written back below
+        db_session.execute(
+            delete(ClusterKey)
+            .where(ClusterKey.primaryId.in_([p.id for p in primaries]))
+            .execution_options(synchronize_session=False)
+        )
+        if key_rows:
+            pointed = upsert(ClusterKey)
+            db_session.execute(pointed.on_conflict_do_update(
+                index_elements=[ClusterKey.kind, ClusterKey.key],
+                set_={'primaryId': pointed.excluded.primaryId}
+            ), list(key_rows.values()))
+
+    locked(ids, write)
+
+
+def sweep(chunk_size: int) -> int:
+    """Delete contact_cluster and cluster_key rows of primaries that are no longer live, under their root locks"""
+    swept = 0
+    for column in (ContactCluster.primaryId, ClusterKey.primaryId):
+        while True:
+            with engine.connect() as conn:
+                stale = conn.execute(
+                    select(column).where(~live_primary(column)).distinct().limit(chunk_size)
+                ).scalars().all()
+            if not stale:
+                break
+
+            def write():
+                for table in (ContactCluster, ClusterKey):
+                    db_session.execute(
+                        delete(table)
+                        .where(table.primaryId.in_(stale), ~live_primary(table.primaryId))
+                        .execution_options(synchronize_session=False)
+                    )
+
+            locked(stale, write)
+            swept += len(stale)
+    return swept
+
+
+def refresh(chunk_size: int) -> None:
+    """Rewrite the contact_cluster and cluster_key tables from the (reconciled) contact table
+
+    Safe while the service is running on PostgreSQL. Primaries are paged in id
+    order, and each page is re-read and upserted in one transaction holding the
+    advisory locks on its cluster roots that every identify write takes, so a
+    concurrent merge either commits before the page is read or waits for it.
+    Rows of primaries that were demoted or deleted are then swept the same way.
+    Memory grows with the page, not the table.
+    """
+    started = time.perf_counter()
+    service = ContactService(cache=None)
+    last_id = 0
+    clusters = 0
+    while True:
+        with engine.connect() as conn:
+            ids = conn.execute(
+                select(Contact.id)
+                .where(Contact.linkedId.is_(None), Contact.deletedAt.is_(None), Contact.id > last_id)
+                .order_by(Contact.id)
+                .limit(chunk_size)
+            ).scalars().all()
+        if not ids:
+            break
+        refresh_chunk(service, ids)
+        last_id = ids[-1]
+        clusters += len(ids)
+    report('refresh clusters', clusters, started)
+
+    started = time.perf_counter()
+    report('sweep stale primaries', sweep(chunk_size), started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='Load contacts from a CSV or JSONL file')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'])
+    import_parser.add_argument('--chunk-size', type=int, default=5000)
+
+    rebuild_parser = commands.add_parser('rebuild', help='Re-reconcile the existing contact table in place')
+    rebuild_parser.add_argument('--chunk-size', type=int, default=5000)
+
+    refresh_parser = commands.add_parser('refresh', help='Rewrite the materialized cluster tables')
+    refresh_parser.add_argument('--chunk-size', type=int, default=5000)
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.command == 'import':
+        fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        import_file(args.path, fmt, args.chunk_size)
+    elif args.command == 'rebuild':
+        rebuild(args.chunk_size)
+    else:
+        refresh(args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
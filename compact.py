@@ -0,0 +1,303 @@
+"""Online compaction of the contact table
+
+    python compact.py [--chunk-size 500] [--pause 0.05] [--lock-timeout 2] [--event-retention-days 7] [--vacuum]
+
+Nothing in the service removes contacts, so soft-deleted rows and secondaries
+that repeat what their cluster already holds stay in the table and its indexes
+for good. This job moves both into contact_archive:
+
+  archive   soft-deleted contacts no other contact links to (reason 'deleted')
+  collapse  secondaries whose email and phone number both already appear on a
+            contact ahead of them in their cluster's response (reason 'collapsed')
+
+With --event-retention-days it also deletes change-feed events (cluster_event)
+older than that, which consumers of GET /changes must have read by then.
+Collapsing a cluster appends a 'resync' event for its primary in the same
+transaction, since its secondaryContactIds shrink.
+
+Collapsing leaves each response's emails and phoneNumbers exactly as they were;
+the collapsed ids drop out of secondaryContactIds and the materialized cluster
+row is rewritten in the same transaction. Unlike bulk_import.py it runs next to
+live traffic: each transaction covers one chunk, takes the per-cluster locks
+/identify writers take (giving up on PostgreSQL after --lock-timeout and leaving
+that chunk for the next run) and is followed by a pause. Per-worker memory
+caches keep the old secondaryContactIds until CLUSTER_CACHE_TTL. Reports rows
+reclaimed and the size of the table and each index before and after.
+"""
+from typing import Dict, Iterable, List, Set, Tuple
+from datetime import datetime, timedelta, timezone
+import argparse
+import time
+
+from sqlalchemy import and_, delete, insert, literal, or_, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased
+
+from bulk_import import report
+from database import db_session, engine, init_db
+from models import ClusterEvent, Contact, ContactArchive
+from services.cluster_cache import cluster_cache
+from services.contact_service import CONTACT_ROW_COLUMNS, ContactRow, ContactService, record_events, resync_events
+from services.key_locks import key_locks
+
+# Columns copied from contact into contact_archive
+ARCHIVED_COLUMNS = ('id', 'phoneNumber', 'email', 'emailKey', 'phoneKey', 'linkedId', 'linkPrecedence',
+                    'createdAt', 'updatedAt', 'deletedAt')
+
+
+def archive_statements(ids: List[int], reason: str) -> List:
+    """Copy the contacts into contact_archive and delete them from contact"""
+    source = (
+        select(*(getattr(Contact, name) for name in ARCHIVED_COLUMNS), literal(reason, ContactArchive.reason.type))
+        .where(Contact.id.in_(ids))
+    )
+    return [
+        insert(ContactArchive).from_select([*ARCHIVED_COLUMNS, 'reason'], source),
+        delete(Contact).where(Contact.id.in_(ids)).execution_options(synchronize_session=False)
+    ]
+
+
+def set_lock_timeout(seconds: float) -> None:
+    """Bound lock waits for the rest of the current transaction (PostgreSQL only)"""
+    if engine.dialect.name == 'postgresql':
+        db_session.execute(text(f"SET LOCAL lock_timeout = '{int(seconds * 1000)}ms'"))
+
+
+def redundant(primary: ContactRow, secondaries: Iterable[ContactRow], keep: Set[int] = frozenset()) -> List[int]:
+    """Ids of secondaries that add no email or phone number to the response ahead of them
+
+    Walks the contacts in build_consolidated's order (primary, then secondaries by
+    id), so removing the returned ones leaves emails and phoneNumbers unchanged.
+    Ids in `keep` are never returned.
+    """
+    emails = {primary.email}
+    phone_numbers = {primary.phoneNumber}
+    ids = []
+    for contact in secondaries:
+        if contact.id not in keep and (not contact.email or contact.email in emails) \
+                and (not contact.phoneNumber or contact.phoneNumber in phone_numbers):
+            ids.append(contact.id)
+        else:
+            emails.add(contact.email)
+            phone_numbers.add(contact.phoneNumber)
+    return ids
+
+
+def load_clusters(primary_ids: List[int]) -> Dict[int, Tuple[ContactRow, List[ContactRow]]]:
+    """Load live primaries among the ids with their live secondaries in id order"""
+    rows = db_session.execute(
+        select(*CONTACT_ROW_COLUMNS)
+        .where(
+            or_(and_(Contact.id.in_(primary_ids), Contact.linkedId.is_(None)), Contact.linkedId.in_(primary_ids)),
+            Contact.deletedAt.is_(None)
+        )
+        .order_by(Contact.id)
+    ).all()
+    primaries = {row.id: ContactRow(*row) for row in rows if row.linkedId is None}
+    clusters = {primary_id: (primary, []) for primary_id, primary in primaries.items()}
+    for row in rows:
+        if row.linkedId in clusters:
+            clusters[row.linkedId][1].append(ContactRow(*row))
+    return clusters
+
+
+def archive_deleted(chunk_size: int, pause: float, lock_timeout: float) -> Tuple[int, int]:
+    """Move soft-deleted contacts that nothing links to into the archive; returns (archived, skipped)"""
+    started = time.perf_counter()
+    child = aliased(Contact)
+    archived = skipped = 0
+    last_id = 0
+    while True:
+        # Deleted rows still linked to are kept: cluster walks pass through them
+        ids = db_session.execute(
+            select(Contact.id)
+            .where(
+                Contact.deletedAt.isnot(None), Contact.id > last_id,
+                ~select(child.id).where(child.linkedId == Contact.id).exists()
+            )
+            .order_by(Contact.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            db_session.rollback()
+            break
+        last_id = ids[-1]
+        try:
+            set_lock_timeout(lock_timeout)
+            for stmt in archive_statements(ids, 'deleted'):
+                db_session.execute(stmt)
+            db_session.commit()
+            archived += len(ids)
+        except OperationalError as e:
+            db_session.rollback()
+            skipped += len(ids)
+            print(f"archive: skipped {len(ids)} rows after id {ids[0] - 1}: {str(e).splitlines()[0]}")
+        time.sleep(pause)
+    report('archive deleted', archived, started)
+    return archived, skipped
+
+
+def collapse_clusters(service: ContactService, primary_ids: List[int], lock_timeout: float) -> int:
+    """Collapse the redundant secondaries of these clusters in one transaction under their locks"""
+    set_lock_timeout(lock_timeout)
+    locks = key_locks.acquire(db_session, [], [], set(primary_ids))
+    try:
+        # Re-read under the locks: writers may have changed the clusters since the scan
+        clusters = load_clusters(primary_ids)
+        members = [c.id for _, secondaries in clusters.values() for c in secondaries]
+        linked_to = set(db_session.execute(
+            select(Contact.linkedId).where(Contact.linkedId.in_(members))
+        ).scalars()) if members else set()
+
+        collapsed = []
+        changed = []
+        for primary, secondaries in clusters.values():
+            ids = set(redundant(primary, secondaries, linked_to))
+            if not ids:
+                continue
+            collapsed.extend(ids)
+            changed.append(primary.id)
+            kept = [c for c in secondaries if c.id not in ids]
+            service.store_consolidated(db_session, service.build_consolidated(primary, kept), [],
+                                       [primary.email, *(c.email for c in kept)],
+                                       [primary.phoneNumber, *(c.phoneNumber for c in kept)])
+        if collapsed:
+            for stmt in archive_statements(sorted(collapsed), 'collapsed'):
+                db_session.execute(stmt)
+            record_events(db_session, resync_events(changed))
+        db_session.commit()
+    except BaseException:
+        db_session.rollback()
+        raise
+    finally:
+        locks.release()
+    service.invalidate_clusters(*primary_ids)
+    return len(collapsed)
+
+
+def collapse_redundant(chunk_size: int, pause: float, lock_timeout: float) -> Tuple[int, int]:
+    """Page through clusters by primary id and collapse redundant secondaries; returns (collapsed, skipped)"""
+    started = time.perf_counter()
+    service = ContactService(cache=cluster_cache)
+    collapsed = skipped = 0
+    last_id = 0
+    while True:
+        primary_ids = db_session.execute(
+            select(Contact.id)
+            .where(Contact.linkedId.is_(None), Contact.deletedAt.is_(None), Contact.id > last_id)
+            .order_by(Contact.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not primary_ids:
+            db_session.rollback()
+            break
+        last_id = primary_ids[-1]
+
+        # Scan without locks; only clusters with something to collapse are locked and re-read
+        candidates = [
+            primary_id for primary_id, (primary, secondaries) in load_clusters(primary_ids).items()
+            if redundant(primary, secondaries)
+        ]
+        db_session.rollback()
+        if not candidates:
+            continue
+        try:
+            collapsed += collapse_clusters(service, candidates, lock_timeout)
+        except OperationalError as e:
+            skipped += len(candidates)
+            print(f"collapse: skipped {len(candidates)} clusters up to id {last_id}: {str(e).splitlines()[0]}")
+        time.sleep(pause)
+    report('collapse secondaries', collapsed, started)
+    return collapsed, skipped
+
+
+def prune_events(retention_days: float, chunk_size: int, pause: float) -> int:
+    """Delete change-feed events older than the retention period, oldest first; returns the count"""
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    pruned = 0
+    while True:
+        # Ids grow with createdAt, so the old events are the front of the primary key
+        ids = db_session.execute(
+            select(ClusterEvent.id).where(ClusterEvent.createdAt < cutoff).order_by(ClusterEvent.id).limit(chunk_size)
+        ).scalars().all()
+        if ids:
+            db_session.execute(delete(ClusterEvent).where(ClusterEvent.id.in_(ids)))
+        db_session.commit()
+        pruned += len(ids)
+        if len(ids) < chunk_size:
+            break
+        time.sleep(pause)
+    report('prune events', pruned, started)
+    return pruned
+
+
+def relation_sizes() -> Dict[str, int]:
+    """Bytes used by the contact table and each of its indexes, where the database can tell"""
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            rows = conn.execute(text(
+                "SELECT c.relname, pg_relation_size(c.oid) FROM pg_class c "
+                "WHERE c.oid = 'contact'::regclass "
+                "OR c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = 'contact'::regclass)"
+            ))
+        elif conn.dialect.name == 'sqlite':
+            try:
+                rows = conn.execute(text(
+                    "SELECT name, SUM(pgsize) FROM dbstat "
+                    "WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'contact') GROUP BY name"
+                ))
+            except OperationalError:
+                # SQLite built without the dbstat virtual table
+                return {}
+        else:
+            return {}
+        return {name: size for name, size in rows}
+
+
+def vacuum() -> None:
+    """Make the freed pages reusable (PostgreSQL) or give them back to the file system (SQLite)"""
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM (ANALYZE) contact' if conn.dialect.name == 'postgresql' else 'VACUUM'))
+    print(f"vacuum: {time.perf_counter() - started:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunk-size', type=int, default=500, help='rows or clusters per transaction')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep after each chunk written')
+    parser.add_argument('--lock-timeout', type=float, default=2.0, help='seconds to wait for locks (PostgreSQL)')
+    parser.add_argument('--skip-archive', action='store_true', help='leave soft-deleted contacts in place')
+    parser.add_argument('--skip-collapse', action='store_true', help='leave redundant secondaries in place')
+    parser.add_argument('--event-retention-days', type=float, default=0,
+                        help='delete change-feed events older than this (0 keeps them all)')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards')
+    args = parser.parse_args()
+    init_db()
+
+    before = relation_sizes()
+    archived = collapsed = skipped = 0
+    if not args.skip_archive:
+        archived, skipped_rows = archive_deleted(args.chunk_size, args.pause, args.lock_timeout)
+        skipped += skipped_rows
+    if not args.skip_collapse:
+        collapsed, skipped_clusters = collapse_redundant(args.chunk_size, args.pause, args.lock_timeout)
+        skipped += skipped_clusters
+    if args.event_retention_days > 0:
+        prune_events(args.event_retention_days, args.chunk_size, args.pause)
+    if args.vacuum:
+        vacuum()
+    after = relation_sizes()
+    db_session.remove()
+
+    print(f"reclaimed: {archived + collapsed} rows ({archived} deleted, {collapsed} collapsed)"
+          + (f", {skipped} left for the next run" if skipped else ''))
+    if before:
+        print(f"{'relation':<24} {'before KiB':>12} {'after KiB':>12}")
+        for name in sorted(before):
+            print(f"{name:<24} {before[name] / 1024:>12,.0f} {after.get(name, 0) / 1024:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -30,8 +30,23 @@ else:
     # Fallback to SQLite for local development if Supabase credentials aren't set
     SQLALCHEMY_DATABASE_URI = os.environ.get('FALLBACK_DATABASE_URL', 'sqlite:///bitespeed.db')
 
+# Optional read replica: lookup-only /identify requests are served from it
+replica_database_url = re.sub(r'[?&]pgbouncer=true', '', os.environ.get('DATABASE_REPLICA_URL', ''))
+SQLALCHEMY_REPLICA_URI = replica_database_url or None
+# Keys and clusters a worker wrote are read from the primary for this many seconds
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+
+# Startup: schema DDL only runs when asked for (or via `flask --app app init-db`), and
+# DB_POOL_PREWARM pooled connections are opened in the background once the app is created
+INIT_DB_ON_STARTUP = os.environ.get('INIT_DB_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+DB_POOL_PREWARM = int(os.environ.get('DB_POOL_PREWARM', 0))
+
+# Hash partitioning (PostgreSQL): with DB_HASH_PARTITIONS > 0, init_db creates contact (by id),
+# contact_cluster (by primaryId) and cluster_key (by key) as that many partitions each, and the
+# identify path matches keys through cluster_key so every key probe touches a single partition
+DB_HASH_PARTITIONS = int(os.environ.get('DB_HASH_PARTITIONS', 0))
+
 # SQLAlchemy settings
-SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_ENGINE_OPTIONS = {
     'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
     'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
@@ -40,6 +55,19 @@ SQLALCHEMY_ENGINE_OPTIONS = {
     'pool_pre_ping': True,  # Verify connections before using
 }
 
+# Admission control: each worker runs at most ADMISSION_CONCURRENCY /identify requests at once
+# (0 matches the pool, pool_size + max_overflow) and queues up to ADMISSION_QUEUE_SIZE more, lookups
+# first, for at most ADMISSION_QUEUE_TIMEOUT_MS; the rest are shed with 503 and Retry-After
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_CONCURRENCY = int(os.environ.get('ADMISSION_CONCURRENCY', 0))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 64))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 2000))
+
+# Group commit: insert-only /identify requests wait up to GROUP_COMMIT_WINDOW_MS (0 disables)
+# for others to join, then share one multi-row INSERT and commit of at most GROUP_COMMIT_MAX_ROWS
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 0))
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', 64))
+
 # Add special pgbouncer settings if enabled
 if pgbouncer_enabled:
     SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
@@ -48,6 +76,54 @@ if pgbouncer_enabled:
         'options': '-c statement_timeout=60000'  # 60 second timeout
     }
 
+# Async engine for the ASGI serving mode (asgi.py): the same database through an asyncio driver
+ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL') or re.sub(
+    r'^postgres(ql)?(\+\w+)?://', 'postgresql+asyncpg://', SQLALCHEMY_DATABASE_URI
+)
+ASYNC_DATABASE_URI = re.sub(r'^sqlite(\+\w+)?://', 'sqlite+aiosqlite://', ASYNC_DATABASE_URI)
+ASYNC_ENGINE_OPTIONS = {key: value for key, value in SQLALCHEMY_ENGINE_OPTIONS.items() if key != 'connect_args'}
+if pgbouncer_enabled:
+    # asyncpg caches prepared statements per connection, which PgBouncer cannot route
+    ASYNC_ENGINE_OPTIONS['connect_args'] = {'statement_cache_size': 0}
+
+# Identity-cluster cache settings (a size of 0 disables the cache)
+CLUSTER_CACHE_SIZE = int(os.environ.get('CLUSTER_CACHE_SIZE', 10000))
+CLUSTER_CACHE_TTL = float(os.environ.get('CLUSTER_CACHE_TTL', 60))
+# 'memory' is per worker; 'sqlite' (file path) and 'redis' (URL) are shared by all workers
+CLUSTER_CACHE_BACKEND = os.environ.get('CLUSTER_CACHE_BACKEND', 'memory')
+CLUSTER_CACHE_URL = os.environ.get('CLUSTER_CACHE_URL')
+
+# Bloom filter of known emails and phone numbers that lets brand-new contacts skip the match query.
+# Sized for KEY_FILTER_CAPACITY keys at KEY_FILTER_ERROR_RATE false positives; with a snapshot path,
+# workers load it instead of reading the whole table and rewrite it every KEY_FILTER_REFRESH_SECONDS
+KEY_FILTER_ENABLED = os.environ.get('KEY_FILTER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+KEY_FILTER_CAPACITY = int(os.environ.get('KEY_FILTER_CAPACITY', 1000000))
+KEY_FILTER_ERROR_RATE = float(os.environ.get('KEY_FILTER_ERROR_RATE', 0.01))
+KEY_FILTER_SNAPSHOT = os.environ.get('KEY_FILTER_SNAPSHOT') or None
+KEY_FILTER_REFRESH_SECONDS = float(os.environ.get('KEY_FILTER_REFRESH_SECONDS', 60))
+
+# Change feed: every write also appends its cluster events to the cluster_event outbox, which
+# GET /changes pages through CHANGES_PAGE_SIZE (at most CHANGES_PAGE_MAX_SIZE) events at a time
+CHANGE_FEED_ENABLED = os.environ.get('CHANGE_FEED_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+CHANGES_PAGE_MAX_SIZE = int(os.environ.get('CHANGES_PAGE_MAX_SIZE', 5000))
+
+# JSON bodies are parsed and encoded with orjson when it is installed (FAST_JSON_ENABLED=false
+# keeps the standard library); each worker keeps the encoded /identify bodies of up to
+# RESPONSE_BODY_CACHE_SIZE clusters served from the cluster cache (0 disables)
+FAST_JSON_ENABLED = os.environ.get('FAST_JSON_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RESPONSE_BODY_CACHE_SIZE = int(os.environ.get('RESPONSE_BODY_CACHE_SIZE', 1024))
+
+# Largest number of records accepted by POST /identify/batch
+IDENTIFY_BATCH_MAX_SIZE = int(os.environ.get('IDENTIFY_BATCH_MAX_SIZE', 5000))
+# Longest emails/phoneNumbers/secondaryContactIds array an /identify response returns (0, the default, for
+# no cap); opt-in, since a capped response is cut and gains a 'truncated' field
+IDENTIFY_MAX_ARRAY_ITEMS = int(os.environ.get('IDENTIFY_MAX_ARRAY_ITEMS', 0))
+# Default and largest page of GET /contacts/<id>, and rows fetched per round trip when streaming it
+CONTACTS_PAGE_SIZE = int(os.environ.get('CONTACTS_PAGE_SIZE', 100))
+CONTACTS_PAGE_MAX_SIZE = int(os.environ.get('CONTACTS_PAGE_MAX_SIZE', 1000))
+CONTACTS_STREAM_BATCH_SIZE = int(os.environ.get('CONTACTS_STREAM_BATCH_SIZE', 1000))
+
 # App settings
 DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
 PORT = int(os.environ.get('PORT', 5001))
@@ -1,14 +1,23 @@
-from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS  # Fixed import
+from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS, SQLALCHEMY_REPLICA_URI  # Fixed import
+from services import boot
+from services.metrics import TimedQueuePool, instrument_engine
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 # Create SQLAlchemy engine with connection pooling
 engine = create_engine(
     SQLALCHEMY_DATABASE_URI,  # Using SQLALCHEMY_DATABASE_URI instead of DATABASE_URL
+    poolclass=TimedQueuePool,
     **SQLALCHEMY_ENGINE_OPTIONS
 )
+instrument_engine(engine, 'sync')
 
 # Create session factory
 db_session = scoped_session(
@@ -19,13 +28,28 @@ db_session = scoped_session(
     )
 )
 
+# Read replica for lookup-only requests (services/read_routing.py), when configured
+replica_engine = None
+replica_session = None
+if SQLALCHEMY_REPLICA_URI:
+    replica_engine = create_engine(
+        SQLALCHEMY_REPLICA_URI,
+        poolclass=TimedQueuePool,
+        **SQLALCHEMY_ENGINE_OPTIONS
+    )
+    instrument_engine(replica_engine, 'replica')
+    replica_session = scoped_session(
+        sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=replica_engine
+        )
+    )
+
 # Base class for all models
 Base = declarative_base()
 Base.query = db_session.query_property()
 
-# SQLAlchemy instance for Flask integration
-db = SQLAlchemy()
-
 def init_db():
     """Initialize the database and create all tables"""
     # Import models to ensure they're registered with Base
@@ -33,6 +57,32 @@ def init_db():
     Base.metadata.create_all(bind=engine)
     print("Database initialized successfully")
 
+def prewarm_pool(count: int) -> threading.Thread:
+    """Open up to `count` pooled connections on a background thread and return them to the pool
+
+    Capped at pool_size, since connections beyond it would be closed again on
+    return. Do not combine with gunicorn --preload: connections opened before the
+    fork would be shared by every worker.
+    """
+    def warm():
+        started = time.perf_counter()
+        connections = []
+        try:
+            for _ in range(min(count, engine.pool.size())):
+                connections.append(engine.connect())
+        except SQLAlchemyError as e:
+            logger.warning(f"Pool pre-warm stopped after {len(connections)} connections: {str(e)}")
+        finally:
+            for connection in connections:
+                connection.close()
+        boot.record('pool_prewarm', time.perf_counter() - started)
+    
+    thread = threading.Thread(target=warm, name='pool-prewarm', daemon=True)
+    thread.start()
+    return thread
+
 def shutdown_session(exception=None):
     """Remove the session after each request"""
-    db_session.remove()
\ No newline at end of file
+    db_session.remove()
+    if replica_session is not None:
+        replica_session.remove()
\ No newline at end of file
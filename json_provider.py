@@ -0,0 +1,38 @@
+"""Flask JSON provider backed by services.json_codec (orjson when it is installed)"""
+from typing import Any, Union
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+from services.json_codec import JSONCodec, codec
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """request.json, jsonify and flask.json through the shared codec
+
+    Calls with extra json.dumps/json.loads arguments, debug-mode pretty printing
+    and providers configured away from sorted keys keep the standard library
+    behaviour of DefaultJSONProvider.
+    """
+
+    codec: JSONCodec = codec
+
+    def _fast(self) -> bool:
+        return self.sort_keys and not ((self.compact is None and self._app.debug) or self.compact is False)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs or not self._fast():
+            return super().dumps(obj, **kwargs)
+        return self.codec.dumps(obj, default=self.default).decode()
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self.codec.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if not self._fast():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.codec.dumps(obj, default=self.default, newline=True),
+                                        mimetype=self.mimetype)
@@ -0,0 +1,34 @@
+-- Normalized lookup keys for contact (PostgreSQL)
+--
+-- Adds "emailKey"/"phoneKey", backfills them with the same rules as
+-- services/normalize.py (emails trimmed and lower-cased, phone numbers reduced
+-- to their digits) and replaces the raw-column indexes with partial covering
+-- indexes over live rows. Run each statement on its own, outside a
+-- transaction block, so the indexes can be built CONCURRENTLY.
+--
+-- Local SQLite databases are created with the new schema by init_db(); delete
+-- an old bitespeed.db to pick it up.
+
+ALTER TABLE contact ADD COLUMN IF NOT EXISTS "emailKey" VARCHAR(255);
+ALTER TABLE contact ADD COLUMN IF NOT EXISTS "phoneKey" VARCHAR(255);
+
+-- Backfill in id ranges on large tables to keep each transaction short
+UPDATE contact SET
+  "emailKey" = NULLIF(lower(btrim(email, E' \t\r\n')), ''),
+  "phoneKey" = COALESCE(
+    NULLIF(regexp_replace("phoneNumber", '[^0-9]', '', 'g'), ''),
+    NULLIF(btrim("phoneNumber", E' \t\r\n'), '')
+  )
+WHERE ("emailKey" IS NULL AND email IS NOT NULL)
+   OR ("phoneKey" IS NULL AND "phoneNumber" IS NOT NULL);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_email_key
+  ON contact ("emailKey", "linkedId") INCLUDE (id) WHERE "deletedAt" IS NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_phone_key
+  ON contact ("phoneKey", "linkedId") INCLUDE (id) WHERE "deletedAt" IS NULL;
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_email;
+DROP INDEX CONCURRENTLY IF EXISTS idx_phone;
+
+-- Refresh the visibility map so lookups can skip the heap
+VACUUM (ANALYZE) contact;
@@ -0,0 +1,37 @@
+-- Materialized cluster tables (PostgreSQL)
+--
+-- contact_cluster holds the consolidated /identify response of every cluster,
+-- keyed by its primary; cluster_key maps each normalized email and phone number
+-- to that primary. The service keeps both up to date in the transaction that
+-- changes a cluster. After creating them, backfill with
+--
+--     python bulk_import.py refresh
+--
+-- which may run while the service is live: each page of clusters is upserted
+-- under the same advisory locks on its cluster roots that identify writes take.
+-- Until it has run, lookups of clusters not written since fall back to the
+-- full cluster query, so the service stays correct meanwhile.
+--
+-- Local SQLite databases get both tables from init_db().
+
+CREATE TABLE IF NOT EXISTS contact_cluster (
+  "primaryId" INTEGER PRIMARY KEY,
+  emails JSON NOT NULL,
+  "phoneNumbers" JSON NOT NULL,
+  "secondaryContactIds" JSON NOT NULL,
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+DO $$ BEGIN
+  CREATE TYPE cluster_key_kind_enum AS ENUM ('email', 'phone');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS cluster_key (
+  kind cluster_key_kind_enum NOT NULL,
+  key VARCHAR(255) NOT NULL,
+  "primaryId" INTEGER NOT NULL,
+  PRIMARY KEY (kind, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cluster_key_primary ON cluster_key("primaryId");
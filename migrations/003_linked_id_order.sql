@@ -0,0 +1,15 @@
+-- Cluster pages in id order (PostgreSQL)
+--
+-- GET /contacts/<id> reads a cluster's secondaries by keyset on
+-- ("linkedId", id). Rebuilding idx_linked on both columns turns each page into
+-- one range scan of the index instead of a scan and sort of the whole cluster.
+-- Run each statement on its own, outside a transaction block, so the index can
+-- be built CONCURRENTLY; lookups by "linkedId" keep using the old index until
+-- the new one is valid.
+--
+-- Local SQLite databases are created with the new schema by init_db(); delete
+-- an old bitespeed.db to pick it up.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_linked_id ON contact ("linkedId", id);
+DROP INDEX CONCURRENTLY IF EXISTS idx_linked;
+ALTER INDEX idx_linked_id RENAME TO idx_linked;
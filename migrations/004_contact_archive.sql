@@ -0,0 +1,34 @@
+-- Archive table for compact.py (PostgreSQL)
+--
+-- compact.py moves soft-deleted contacts and secondaries that add no email or
+-- phone number to their cluster into contact_archive, in short chunked
+-- transactions. idx_deleted lets it find soft-deleted rows without scanning the
+-- table; it stays near empty once the job runs regularly. Run the index
+-- statement on its own, outside a transaction block, so it can be built
+-- CONCURRENTLY.
+--
+-- Local SQLite databases get both from init_db().
+
+DO $$ BEGIN
+  CREATE TYPE archive_reason_enum AS ENUM ('deleted', 'collapsed');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS contact_archive (
+  id INTEGER PRIMARY KEY,
+  "phoneNumber" VARCHAR(255),
+  email VARCHAR(255),
+  "emailKey" VARCHAR(255),
+  "phoneKey" VARCHAR(255),
+  "linkedId" INTEGER,
+  "linkPrecedence" link_precedence_enum NOT NULL,
+  "createdAt" TIMESTAMP WITH TIME ZONE NOT NULL,
+  "updatedAt" TIMESTAMP WITH TIME ZONE NOT NULL,
+  "deletedAt" TIMESTAMP WITH TIME ZONE,
+  reason archive_reason_enum NOT NULL,
+  "archivedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_archive_linked ON contact_archive ("linkedId");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deleted ON contact (id) WHERE "deletedAt" IS NOT NULL;
@@ -0,0 +1,73 @@
+-- Hash-partitioned contact tables (PostgreSQL 12+)
+--
+-- Rebuilds contact (by id), contact_cluster (by "primaryId") and cluster_key
+-- (by key) as hash-partitioned tables with the same columns, indexes and
+-- constraints, so each partition's indexes stay small and is vacuumed on its
+-- own. Set `partitions` below, then start the service with DB_HASH_PARTITIONS
+-- set to the same count: it then matches keys through cluster_key, where each
+-- key lives in exactly one partition.
+--
+-- The whole script is one transaction holding ACCESS EXCLUSIVE locks while it
+-- copies every row, so run it in a maintenance window with the service stopped;
+-- any error rolls everything back. Backfill the cluster tables first if they
+-- are not (python bulk_import.py refresh): with partitioning on, contacts whose
+-- keys are missing from cluster_key are not matched.
+--
+-- Local SQLite databases have no partitions; DB_HASH_PARTITIONS only switches
+-- the key routing there.
+
+BEGIN;
+
+LOCK TABLE contact, contact_cluster, cluster_key IN ACCESS EXCLUSIVE MODE;
+
+DO $$
+DECLARE
+  partitions CONSTANT INTEGER := 16;
+  tables CONSTANT TEXT[][] := ARRAY[
+    ['contact', 'id'],
+    ['contact_cluster', '"primaryId"'],
+    ['cluster_key', 'key']
+  ];
+  tbl TEXT;
+BEGIN
+  -- The id sequence must outlive the old contact table it belongs to
+  ALTER SEQUENCE contact_id_seq OWNED BY NONE;
+
+  FOR t IN 1 .. array_length(tables, 1) LOOP
+    tbl := tables[t][1];
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, tbl || '_unpartitioned');
+    EXECUTE format(
+      'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY HASH (%s)',
+      tbl, tbl || '_unpartitioned', tables[t][2]
+    );
+    FOR i IN 0 .. partitions - 1 LOOP
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+        tbl || '_p' || i, tbl, partitions, i
+      );
+    END LOOP;
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, tbl || '_unpartitioned');
+    EXECUTE format('DROP TABLE %I', tbl || '_unpartitioned');
+  END LOOP;
+END $$;
+
+ALTER SEQUENCE contact_id_seq OWNED BY contact.id;
+
+-- Constraints and indexes are declared on the parents and created in every partition
+ALTER TABLE contact ADD PRIMARY KEY (id);
+ALTER TABLE contact ADD FOREIGN KEY ("linkedId") REFERENCES contact (id);
+CREATE INDEX idx_email_key ON contact("emailKey", "linkedId") INCLUDE (id) WHERE "deletedAt" IS NULL;
+CREATE INDEX idx_phone_key ON contact("phoneKey", "linkedId") INCLUDE (id) WHERE "deletedAt" IS NULL;
+CREATE INDEX idx_linked ON contact("linkedId", id);
+CREATE INDEX idx_deleted ON contact(id) WHERE "deletedAt" IS NOT NULL;
+
+ALTER TABLE contact_cluster ADD PRIMARY KEY ("primaryId");
+
+ALTER TABLE cluster_key ADD PRIMARY KEY (kind, key);
+CREATE INDEX idx_cluster_key_primary ON cluster_key("primaryId");
+
+COMMIT;
+
+ANALYZE contact;
+ANALYZE contact_cluster;
+ANALYZE cluster_key;
@@ -0,0 +1,32 @@
+-- Change-feed outbox (PostgreSQL)
+--
+-- Every /identify and /identify/batch write appends the clusters it changed to
+-- cluster_event in the same transaction: 'created' for a new primary,
+-- 'secondary_added' for a new secondary and 'primary_demoted' for a primary
+-- merged into an older cluster. GET /changes pages through it in (txid, id)
+-- order, only serving transactions that have finished, so a consumer polling
+-- with the last nextCursor never misses an event. compact.py
+-- --event-retention-days deletes old events.
+--
+-- Contacts written before this migration have no events: consumers start from
+-- a snapshot of contact_cluster, then follow the feed. Set CHANGE_FEED_ENABLED
+-- to false to stop writing events.
+--
+-- Local SQLite databases get the table from init_db().
+
+DO $$ BEGIN
+  CREATE TYPE cluster_event_kind_enum AS ENUM ('created', 'secondary_added', 'primary_demoted');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS cluster_event (
+  id SERIAL PRIMARY KEY,
+  kind cluster_event_kind_enum NOT NULL,
+  "contactId" INTEGER NOT NULL,
+  "primaryId" INTEGER NOT NULL,
+  "previousPrimaryId" INTEGER,
+  txid BIGINT NOT NULL DEFAULT 0,
+  "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_cluster_event_order ON cluster_event (txid, id);
@@ -0,0 +1,13 @@
+-- Change-feed events from the offline tools (PostgreSQL)
+--
+-- bulk_import.py and compact.py now write cluster_event rows in the
+-- transactions that change contacts: 'created' and 'secondary_added' for
+-- imported contacts, 'primary_demoted' for primaries a rebuild merges away,
+-- and the new 'resync' kind for any other cluster they change (members relinked
+-- by a rebuild, secondaries collapsed by compaction). A 'resync' event carries
+-- the cluster's primary as both contactId and primaryId; consumers re-read that
+-- cluster, e.g. from GET /contacts/<primaryId>.
+--
+-- ADD VALUE cannot run inside a transaction block before PostgreSQL 12.
+
+ALTER TYPE cluster_event_kind_enum ADD VALUE IF NOT EXISTS 'resync';
@@ -1,9 +1,37 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, func, Index
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Enum, JSON, TIMESTAMP, func, Index, DDL, event
 from sqlalchemy.sql import expression
-from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from config import DB_HASH_PARTITIONS
 from database import Base
+from services.normalize import normalize_email, normalize_phone
+
+
+def _email_key(context):
+    return normalize_email(context.get_current_parameters().get('email'))
+
+
+def _phone_key(context):
+    return normalize_phone(context.get_current_parameters().get('phoneNumber'))
+
+
+def _partition_by(column: str) -> dict:
+    """Table options hash-partitioning the table on `column` when DB_HASH_PARTITIONS is set (PostgreSQL only)"""
+    return {'postgresql_partition_by': f'HASH ("{column}")'} if DB_HASH_PARTITIONS > 0 else {}
+
+
+def hash_partition_ddl(table: str, count: int):
+    """CREATE TABLE statements for the `count` hash partitions <table>_p0 ... of a partitioned table"""
+    return [
+        f'CREATE TABLE IF NOT EXISTS {table}_p{i} PARTITION OF {table} FOR VALUES WITH (MODULUS {count}, REMAINDER {i})'
+        for i in range(count)
+    ]
+
+
+def _create_partitions(table) -> None:
+    for statement in hash_partition_ddl(table.name, DB_HASH_PARTITIONS):
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
 
 class Contact(Base):
     """Contact model for SQLAlchemy"""
@@ -12,6 +40,9 @@ class Contact(Base):
     id = Column(Integer, primary_key=True)
     phoneNumber = Column(String(255))
     email = Column(String(255))
+    # Normalized lookup keys, filled in from email/phoneNumber on insert
+    emailKey = Column(String(255), default=_email_key)
+    phoneKey = Column(String(255), default=_phone_key)
     linkedId = Column(Integer, ForeignKey('contact.id'), nullable=True)
     linkPrecedence = Column(Enum('primary', 'secondary', name='link_precedence_enum'), nullable=False)
     
@@ -38,16 +69,25 @@ class Contact(Base):
     )
     
     # Define indexes properly as Table arguments
+    # Partial covering indexes over live rows, so key lookups are index-only scans
     __table_args__ = (
-        Index('idx_email', 'email'),
-        Index('idx_phone', 'phoneNumber'),
-        Index('idx_linked', 'linkedId'),
+        Index('idx_email_key', emailKey, linkedId, postgresql_include=['id'],
+              postgresql_where=deletedAt.is_(None), sqlite_where=deletedAt.is_(None)),
+        Index('idx_phone_key', phoneKey, linkedId, postgresql_include=['id'],
+              postgresql_where=deletedAt.is_(None), sqlite_where=deletedAt.is_(None)),
+        # (linkedId, id) so a cluster's secondaries are read in id order for keyset pages
+        Index('idx_linked', linkedId, id),
+        # Soft-deleted rows waiting to be archived by compact.py; empty once it has run
+        Index('idx_deleted', id, postgresql_where=deletedAt.isnot(None), sqlite_where=deletedAt.isnot(None)),
+        _partition_by('id'),
     )
     
     def __init__(self, email=None, phone_number=None, linked_id=None, link_precedence='primary'):
         """Initialize a new Contact"""
         self.email = email
         self.phoneNumber = phone_number
+        self.emailKey = normalize_email(email)
+        self.phoneKey = normalize_phone(phone_number)
         self.linkedId = linked_id
         self.linkPrecedence = link_precedence
     
@@ -62,4 +102,98 @@ class Contact(Base):
             'createdAt': self.createdAt.isoformat() if self.createdAt else None,
             'updatedAt': self.updatedAt.isoformat() if self.updatedAt else None,
             'deletedAt': self.deletedAt.isoformat() if self.deletedAt else None
-        }
\ No newline at end of file
+        }
+
+
+class ContactCluster(Base):
+    """Consolidated response of one cluster, kept up to date by every write path"""
+    __tablename__ = 'contact_cluster'
+    
+    primaryId = Column(Integer, primary_key=True, autoincrement=False)
+    # Ordered exactly as ContactService.build_consolidated returns them
+    emails = Column(JSON, nullable=False)
+    phoneNumbers = Column(JSON, nullable=False)
+    secondaryContactIds = Column(JSON, nullable=False)
+    updatedAt = Column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+    
+    __table_args__ = (
+        _partition_by('primaryId'),
+    )
+
+
+class ClusterKey(Base):
+    """Maps a normalized email or phone number to the primary of the cluster that holds it"""
+    __tablename__ = 'cluster_key'
+    
+    kind = Column(Enum('email', 'phone', name='cluster_key_kind_enum'), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    primaryId = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_cluster_key_primary', 'primaryId'),
+        _partition_by('key'),
+    )
+
+
+class ClusterEvent(Base):
+    """Append-only outbox of cluster changes, written in the transaction that made them and read by GET /changes"""
+    __tablename__ = 'cluster_event'
+    
+    id = Column(Integer, primary_key=True)
+    # 'created' (a new primary), 'secondary_added', 'primary_demoted' (a primary merged into an older cluster)
+    # or 'resync' (the cluster of primaryId was changed by bulk_import.py or compact.py; re-read it)
+    kind = Column(Enum('created', 'secondary_added', 'primary_demoted', 'resync', name='cluster_event_kind_enum'),
+                  nullable=False)
+    contactId = Column(Integer, nullable=False)
+    # The cluster's primary after the change; for a demotion also the primary it had before
+    primaryId = Column(Integer, nullable=False)
+    previousPrimaryId = Column(Integer, nullable=True)
+    # Id of the writing transaction on PostgreSQL (0 elsewhere); the feed is ordered by (txid, id)
+    txid = Column(BigInteger, nullable=False, default=0)
+    createdAt = Column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+    
+    __table_args__ = (
+        Index('idx_cluster_event_order', 'txid', 'id'),
+    )
+
+
+if DB_HASH_PARTITIONS > 0:
+    _create_partitions(Contact.__table__)
+    _create_partitions(ContactCluster.__table__)
+    _create_partitions(ClusterKey.__table__)
+
+
+class ContactArchive(Base):
+    """Contacts moved out of the contact table by compact.py, with the reason they were moved"""
+    __tablename__ = 'contact_archive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    phoneNumber = Column(String(255))
+    email = Column(String(255))
+    emailKey = Column(String(255))
+    phoneKey = Column(String(255))
+    linkedId = Column(Integer, nullable=True)
+    # The contact table's enum type, so PostgreSQL has one link_precedence_enum
+    linkPrecedence = Column(Contact.linkPrecedence.type, nullable=False)
+    createdAt = Column(TIMESTAMP(timezone=True), nullable=False)
+    updatedAt = Column(TIMESTAMP(timezone=True), nullable=False)
+    deletedAt = Column(TIMESTAMP(timezone=True), nullable=True)
+    # 'deleted' (soft-deleted rows) or 'collapsed' (secondaries that added no email or phone number)
+    reason = Column(Enum('deleted', 'collapsed', name='archive_reason_enum'), nullable=False)
+    archivedAt = Column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+    
+    __table_args__ = (
+        Index('idx_archive_linked', 'linkedId'),
+    )
@@ -0,0 +1,40 @@
+from flask import Blueprint, request, jsonify
+from services.contact_service import ContactService
+from sqlalchemy.exc import SQLAlchemyError
+from database import db_session
+from config import CHANGES_PAGE_SIZE, CHANGES_PAGE_MAX_SIZE
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+changes_bp = Blueprint('changes', __name__)
+
+# A nextCursor is "<txid>-<event id>" of the last event a consumer has seen
+CURSOR = re.compile(r'(\d+)-(\d+)')
+
+@changes_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Endpoint for consuming cluster events in commit order, page by page (?cursor=&limit=)"""
+    try:
+        # Validate the cursor and page size
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', str(CHANGES_PAGE_SIZE))
+        match = CURSOR.fullmatch(cursor) if cursor is not None else None
+        if cursor is not None and match is None:
+            return jsonify({'error': 'cursor must be the nextCursor of a previous page'}), 400
+        if not limit.isdigit() or not 1 <= int(limit) <= CHANGES_PAGE_MAX_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {CHANGES_PAGE_MAX_SIZE}'}), 400
+
+        after = (int(match.group(1)), int(match.group(2))) if match else None
+        page = ContactService().get_changes(after, int(limit))
+        return jsonify(page), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        db_session.rollback()
+        return jsonify({'error': 'A database error occurred'}), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
@@ -0,0 +1,67 @@
+from flask import Blueprint, Response, request, jsonify
+from services.contact_service import ContactService, contact_dict
+from sqlalchemy.exc import SQLAlchemyError
+from database import db_session
+from config import CONTACTS_PAGE_SIZE, CONTACTS_PAGE_MAX_SIZE, CONTACTS_STREAM_BATCH_SIZE
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+contacts_bp = Blueprint('contacts', __name__)
+
+NDJSON = 'application/x-ndjson'
+
+def ndjson_lines(items) -> str:
+    return ''.join(json.dumps(item) + '\n' for item in items)
+
+def stream_cluster(service: ContactService, primary) -> Response:
+    """Stream the primary and then every secondary as one JSON object per line"""
+    def generate():
+        yield ndjson_lines([contact_dict(primary)])
+        try:
+            for batch in service.stream_cluster(primary.id, CONTACTS_STREAM_BATCH_SIZE):
+                yield ndjson_lines(batch)
+        except SQLAlchemyError as e:
+            # The status line is already sent, so the error ends the stream as its last line
+            logger.error(f"Database error while streaming cluster {primary.id}: {str(e)}")
+            yield ndjson_lines([{'error': 'A database error occurred'}])
+
+    return Response(generate(), mimetype=NDJSON)
+
+@contacts_bp.route('/contacts/<int:primary_id>', methods=['GET'])
+def get_contacts(primary_id):
+    """Endpoint for reading a cluster page by page (?cursor=&limit=) or as an NDJSON stream"""
+    try:
+        stream = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON
+
+        # Validate the cursor and page size
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', str(CONTACTS_PAGE_SIZE))
+        if cursor is not None and not cursor.isdigit():
+            return jsonify({'error': 'cursor must be the nextCursor of a previous page'}), 400
+        if not limit.isdigit() or not 1 <= int(limit) <= CONTACTS_PAGE_MAX_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {CONTACTS_PAGE_MAX_SIZE}'}), 400
+
+        service = ContactService()
+        primary = service.get_primary_row(primary_id)
+        if primary is None:
+            return jsonify({'error': f'No primary contact with id {primary_id}'}), 404
+
+        if stream:
+            return stream_cluster(service, primary)
+        page = service.get_cluster_page(primary, int(cursor) if cursor is not None else None, int(limit))
+        return jsonify(page), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        db_session.rollback()
+        return jsonify({'error': 'A database error occurred'}), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+    finally:
+        # The stream reads on its own connection, so the session can go now
+        db_session.remove()
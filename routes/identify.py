@@ -1,40 +1,109 @@
-from flask import Blueprint, request, jsonify
-from services.contact_service import ContactService
-from sqlalchemy.exc import SQLAlchemyError
+from flask import Blueprint, current_app, request, jsonify
+from services.admission import LOOKUP, WRITE, Overloaded, admit
+from services.contact_service import ContactService, cap_response
+from services.key_locks import LockContention
+from services.json_codec import codec, parse_batch, parse_identify, response_bodies
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from database import db_session
+from config import IDENTIFY_BATCH_MAX_SIZE, IDENTIFY_MAX_ARRAY_ITEMS
 import logging
 
 logger = logging.getLogger(__name__)
 
 identify_bp = Blueprint('identify', __name__)
 
+def overloaded(retry_after: int):
+    """A fast 503 telling the client when to try again"""
+    return jsonify({'error': 'The service is overloaded, retry later'}), 503, {'Retry-After': str(retry_after)}
+
+def identify_response(service: ContactService, result):
+    """The 200 response; a response answered from a cluster cache entry reuses that entry's encoded body"""
+    body = response_bodies.get(service.cached_stamp)
+    if body is None:
+        body = codec.dumps(cap_response(result, IDENTIFY_MAX_ARRAY_ITEMS), newline=True)
+        response_bodies.put(service.cached_stamp, body)
+    return current_app.response_class(body, mimetype='application/json')
+
 @identify_bp.route('/identify', methods=['POST'])
 def identify():
     """Endpoint for contact identification"""
     try:
-        # Get request data
-        request_data = request.json
+        # Decode and validate the request body straight from the raw bytes
+        request_data = parse_identify(request.get_data(cache=False))
         
-        # Validate request data
-        if not request_data:
-            return jsonify({'error': 'Request body is required'}), 400
+        # Process the request: its read is admitted ahead of waiting writes, and it only
+        # queues again, behind other lookups, if it has to write
+        service = ContactService()
+        with admit(LOOKUP):
+            result = service.lookup(request_data)
+        if result is None:
+            with admit(WRITE):
+                result = service.identify_contact(request_data, looked_up=True)
         
-        email = request_data.get('email')
-        phone_number = request_data.get('phoneNumber')
+        return identify_response(service, result), 200
+    
+    except ValueError as e:
+        logger.warning(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    
+    except Overloaded as e:
+        logger.warning(f"Shed request: {str(e)}")
+        return overloaded(e.retry_after)
+    
+    except PoolTimeoutError as e:
+        logger.error(f"Connection pool exhausted: {str(e)}")
+        return overloaded(1)
+    
+    except LockContention as e:
+        logger.warning(f"Gave up locking: {str(e)}")
+        return overloaded(1)
+    
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        db_session.rollback()
+        return jsonify({'error': 'A database error occurred'}), 500
+    
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+    
+    finally:
+        # Ensure the session is removed after each request
+        db_session.remove()
+
+@identify_bp.route('/identify/batch', methods=['POST'])
+def identify_batch():
+    """Endpoint for identifying an array of contacts in one request"""
+    try:
+        # Decode the raw body like /identify, so a malformed one is a 400
+        request_data = parse_batch(request.get_data(cache=False))
         
-        if email is None and phone_number is None:
-            return jsonify({'error': 'At least one of email or phoneNumber must be provided'}), 400
+        if len(request_data) > IDENTIFY_BATCH_MAX_SIZE:
+            return jsonify({'error': f'A batch may contain at most {IDENTIFY_BATCH_MAX_SIZE} contacts'}), 400
         
-        # Process the request
+        # Process the batch; results are returned in input order
         service = ContactService()
-        result = service.identify_contact(request_data)
+        with admit(WRITE):
+            results = service.identify_batch(request_data)
         
-        return jsonify(result), 200
+        return jsonify([cap_response(result, IDENTIFY_MAX_ARRAY_ITEMS) for result in results]), 200
     
     except ValueError as e:
         logger.warning(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
     
+    except Overloaded as e:
+        logger.warning(f"Shed request: {str(e)}")
+        return overloaded(e.retry_after)
+    
+    except PoolTimeoutError as e:
+        logger.error(f"Connection pool exhausted: {str(e)}")
+        return overloaded(1)
+    
+    except LockContention as e:
+        logger.warning(f"Gave up locking: {str(e)}")
+        return overloaded(1)
+    
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
         db_session.rollback()
@@ -46,4 +115,4 @@ def identify():
     
     finally:
         # Ensure the session is removed after each request
-        db_session.remove()
\ No newline at end of file
+        db_session.remove()
@@ -0,0 +1,155 @@
+from typing import List
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+from config import (ADMISSION_CONCURRENCY, ADMISSION_ENABLED, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_MS,
+                    SQLALCHEMY_ENGINE_OPTIONS)
+from services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED, ADMISSION_WAIT
+
+# Admission priorities, most urgent first: a request's read-only lookup goes ahead of the
+# writes (inserts and merges) of requests that were not pure lookups
+LOOKUP = 0
+WRITE = 1
+PRIORITY_NAMES = ('lookup', 'write')
+
+# Weight of the newest request in the running average of time spent admitted
+SERVICE_TIME_SMOOTHING = 0.1
+
+
+class Overloaded(Exception):
+    """Raised instead of admitting a request; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'state', 'event')
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.state = 'waiting'  # -> 'admitted' or 'shed'
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """Bounds the requests a worker runs at once and sheds the excess early
+
+    At most `limit` requests run at the same time, matching the connections the
+    pool can hand out, so requests wait here rather than inside the pool. Up to
+    `queue_size` more wait in priority order (then arrival order) for at most
+    `timeout` seconds. A request is turned away at once, rather than after
+    waiting, when the queue is full of requests at its priority or better, or when
+    the queue ahead of it would take longer than `timeout` to drain at the recent
+    service time. A full queue makes room for a more urgent arrival by shedding its
+    newest least urgent waiter.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = max(limit, 1)
+        self.queue_size = max(queue_size, 0)
+        self.timeout = timeout
+        self.in_flight = 0
+        self.service_time = 0.0
+        self._lock = threading.Lock()
+        self._waiting: List[_Waiter] = []
+        self._seq = 0
+
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def _drain_time(self, ahead: int) -> float:
+        """Seconds until a request with `ahead` waiters in front of it would be admitted"""
+        return (ahead + 1) * self.service_time / self.limit
+
+    def _retry_after(self) -> int:
+        return max(math.ceil(self._drain_time(len(self._waiting))), 1)
+
+    def _shed(self, priority: int, reason: str) -> Overloaded:
+        ADMISSION_SHED.inc(priority=PRIORITY_NAMES[priority], reason=reason)
+        return Overloaded(reason, self._retry_after())
+
+    def acquire(self, priority: int) -> float:
+        """Wait for a slot; returns the admission time for release() or raises Overloaded"""
+        started = time.perf_counter()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiting:
+                self.in_flight += 1
+                ADMISSION_WAIT.observe(0, priority=PRIORITY_NAMES[priority])
+                return started
+
+            ahead = sum(1 for w in self._waiting if w.priority <= priority)
+            if self._drain_time(ahead) > self.timeout:
+                raise self._shed(priority, 'deadline')
+            if len(self._waiting) >= self.queue_size:
+                victims = [w for w in self._waiting if w.priority > priority]
+                if not victims:
+                    raise self._shed(priority, 'queue_full')
+                victim = max(victims, key=lambda w: (w.priority, w.seq))
+                self._waiting.remove(victim)
+                victim.state = 'shed'
+                victim.event.set()
+            self._seq += 1
+            waiter = _Waiter(priority, self._seq)
+            self._waiting.append(waiter)
+
+        waiter.event.wait(self.timeout)
+        with self._lock:
+            if waiter.state == 'waiting':
+                self._waiting.remove(waiter)
+                raise self._shed(priority, 'timeout')
+            if waiter.state == 'shed':
+                raise self._shed(priority, 'displaced')
+        now = time.perf_counter()
+        ADMISSION_WAIT.observe(now - started, priority=PRIORITY_NAMES[priority])
+        return now
+
+    def release(self, admitted: float) -> None:
+        """Free the slot, handing it straight to the most urgent waiter if there is one"""
+        elapsed = time.perf_counter() - admitted
+        with self._lock:
+            self.service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+            if self._waiting:
+                waiter = min(self._waiting, key=lambda w: (w.priority, w.seq))
+                self._waiting.remove(waiter)
+                waiter.state = 'admitted'
+                waiter.event.set()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def admitted(self, priority: int):
+        admitted = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(admitted)
+
+
+@contextmanager
+def admit(priority: int):
+    """Run the block under the worker's admission controller, if one is configured"""
+    if admission is None:
+        yield
+        return
+    with admission.admitted(priority):
+        yield
+
+
+# Shared by every request thread in the process; None when ADMISSION_ENABLED is off.
+# By default as many requests run at once as the pool has connections, pool_size + max_overflow
+admission = (
+    AdmissionController(
+        ADMISSION_CONCURRENCY or SQLALCHEMY_ENGINE_OPTIONS['pool_size'] + SQLALCHEMY_ENGINE_OPTIONS['max_overflow'],
+        ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_MS / 1000
+    )
+    if ADMISSION_ENABLED else None
+)
+if admission is not None:
+    ADMISSION_QUEUE_DEPTH.set_function(admission.queue_depth)
+    ADMISSION_IN_FLIGHT.set_function(lambda: admission.in_flight)
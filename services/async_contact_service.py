@@ -0,0 +1,165 @@
+from typing import Dict, Any, Iterable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from models import Contact
+from config import CLUSTER_CACHE_BACKEND
+from services.cluster_cache import ClusterCache, cluster_cache
+from services.contact_service import (
+    ContactRow, ContactService, MAX_LOCK_ATTEMPTS, cluster_keys, cluster_query, consolidated_query,
+    consolidated_statements, relink_statement
+)
+from services.key_locks import LockRetry
+from services.metrics import note_branch, phase
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared cache backends do blocking I/O, so only the in-process one is used on the event loop
+default_cache = cluster_cache if CLUSTER_CACHE_BACKEND == 'memory' else None
+
+
+class AsyncContactService(ContactService):
+    """Asyncio variant of ContactService for the ASGI serving mode
+
+    identify_contact runs the same single-transaction path as the sync service
+    (a materialized-cluster probe, one cluster query, at most one relink UPDATE and
+    one INSERT, the cluster-table refresh, one commit) on an AsyncSession, so requests waiting on the database yield the event loop to each
+    other. The merge rules and response building are inherited unchanged; the
+    coroutines that replace database calls carry an _async suffix, so the
+    inherited sync methods keep their own signatures.
+    """
+
+    def __init__(self, session: AsyncSession, cache: Optional[ClusterCache] = default_cache):
+        super().__init__(cache)
+        self.session = session
+
+    async def resolve_clusters_async(self, emails: Iterable[str], phone_numbers: Iterable[str]) -> List[ContactRow]:
+        """Load every contact in the clusters touched by any of the emails or phone numbers"""
+        stmt = cluster_query(emails, phone_numbers)
+        if stmt is None:
+            return []
+        return [ContactRow(*row) for row in (await self.session.execute(stmt)).tuples()]
+
+    async def lookup_consolidated_async(self, email: Optional[str], phone_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Answer a pure lookup from the materialized cluster tables, or None when the full path is needed"""
+        stmt = consolidated_query(email, phone_number)
+        if stmt is None:
+            return None
+        return self.from_consolidated((await self.session.execute(stmt)).all(), email, phone_number)
+
+    async def store_consolidated_async(self, response: Dict[str, Any], demoted_roots: Iterable[int],
+                                 email: Optional[str], phone_number: Optional[str], added: Iterable[int] = ()) -> None:
+        """Refresh the materialized cluster and record its events in the current transaction"""
+        for stmt in consolidated_statements(response, demoted_roots, cluster_keys([email], [phone_number]), added):
+            await self.session.execute(stmt)
+
+    async def add_contact_async(self,
+                          email: Optional[str],
+                          phone_number: Optional[str],
+                          linked_id: Optional[int] = None) -> Contact:
+        """Stage a new contact and flush it so its id is known, without committing"""
+        contact = Contact(
+            email=email,
+            phone_number=phone_number,
+            linked_id=linked_id,
+            link_precedence='secondary' if linked_id else 'primary'
+        )
+        self.session.add(contact)
+        await self.session.flush()
+        return contact
+
+    async def lock_for_write_async(self, email: Optional[str], phone_number: Optional[str]):
+        """Async counterpart of ContactService.lock_for_write for a single email/phone pair, with the same LockRetry policy"""
+        emails = [email] if email else []
+        phone_numbers = [phone_number] if phone_number else []
+        retry = LockRetry(self.key_locks, lambda rows: self.needs_write(rows, email, phone_number), MAX_LOCK_ATTEMPTS)
+        try:
+            cluster = await self.resolve_clusters_async(emails, phone_numbers)
+            while not retry.settled(cluster):
+                if retry.locks is not None:
+                    await self.session.rollback()
+                retry.next_attempt()
+                retry.locks = await self.key_locks.acquire_async(self.session, emails, phone_numbers, retry.seen)
+                cluster = await self.resolve_clusters_async(emails, phone_numbers)
+        except BaseException:
+            retry.abandon()
+            raise
+        return cluster, retry.locks
+
+    async def identify_contact(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Identify and consolidate a contact without blocking the event loop"""
+        email, phone_number = self.extract_keys(request_data)
+
+        # Validate input
+        if not email and not phone_number:
+            raise ValueError('At least one of email or phoneNumber must be provided')
+
+        if self.cache is not None:
+            with phase('cache'):
+                cached = self.cache.get(email, phone_number)
+            if cached is not None:
+                note_branch('cache_hit')
+                return cached
+            generation = self.cache.generation()
+
+        locks = None
+        try:
+            # Pure lookups are answered from the materialized cluster tables with one indexed fetch
+            with phase('match'):
+                response = await self.lookup_consolidated_async(email, phone_number)
+            if response is not None:
+                note_branch('lookup')
+                if self.cache is not None:
+                    self.cache.put(response, generation)
+                return response
+
+            with phase('match'):
+                cluster, locks = await self.lock_for_write_async(email, phone_number)
+
+            # Case 1: No matching contacts found, create a new primary contact
+            if not cluster:
+                note_branch('new_primary')
+                with phase('write'):
+                    new_contact = await self.add_contact_async(email, phone_number)
+                with phase('consolidate'):
+                    response = self.format_response(new_contact)
+                    await self.store_consolidated_async(response, (), email, phone_number, [new_contact.id])
+                with phase('commit'):
+                    await self.session.commit()
+                return response
+
+            # Cases 2-4: the oldest primary of the cluster wins, every other primary is demoted
+            with phase('resolve_primary'):
+                primary_contact, relinked = self.plan_merge(cluster)
+                roots = {c.id for c in cluster if c.linkedId is None}
+            if relinked:
+                with phase('merge'):
+                    await self.session.execute(relink_statement(roots, primary_contact.id))
+
+            secondaries = [c for c in cluster if c is not primary_contact]
+            created = self.need_new_secondary(primary_contact, cluster, email, phone_number)
+            if created:
+                with phase('write'):
+                    secondaries.append(await self.add_contact_async(email, phone_number, primary_contact.id))
+            note_branch('merge' if relinked else 'new_secondary' if created else 'lookup')
+
+            with phase('consolidate'):
+                response = self.build_consolidated(primary_contact, secondaries)
+                if relinked or created:
+                    await self.store_consolidated_async(response, roots - {primary_contact.id}, email, phone_number,
+                                                  [secondaries[-1].id] if created else [])
+            if relinked or created:
+                with phase('commit'):
+                    await self.session.commit()
+                self.invalidate_clusters(*roots)
+            elif self.cache is not None:
+                self.cache.put(response, generation)
+            return response
+
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in identify_contact: {str(e)}")
+            await self.session.rollback()
+            raise
+        finally:
+            if locks is not None:
+                locks.release()
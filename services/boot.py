@@ -0,0 +1,48 @@
+"""Worker startup timing: how long imports, app creation and pool warm-up take
+
+Kept free of third-party imports so entry points can import it first and time
+everything that follows.
+"""
+from typing import Dict, Iterator
+from contextlib import contextmanager
+import logging
+import time
+
+STARTED = time.perf_counter()
+
+# phase name -> seconds, in the order the phases finished
+phases: Dict[str, float] = {}
+_reported = False
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def record(name: str, seconds: float) -> None:
+    phases[name] = seconds
+    if _reported:
+        _publish(name)
+
+
+def _publish(name: str) -> None:
+    from services.metrics import BOOT_PHASES
+    BOOT_PHASES.set_function(lambda: phases[name], phase=name)
+
+
+def report(logger: logging.Logger) -> None:
+    """Record the time since this module was imported as 'total', log every phase and export them
+
+    Phases recorded later (a background pool warm-up) are exported as they finish.
+    """
+    global _reported
+    record('total', time.perf_counter() - STARTED)
+    logger.info('Boot: ' + ' '.join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in phases.items()))
+    _reported = True
+    for name in phases:
+        _publish(name)
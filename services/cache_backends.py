@@ -0,0 +1,230 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CacheBackend:
+    """Key/value store used by ClusterCache
+
+    Values are JSON-compatible. Counters created with incr_many() are read back
+    through get_many() as integers, and a missing counter reads as None.
+    """
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        raise NotImplementedError
+
+    def incr_many(self, keys: List[str], ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, keys: List[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {'evictions': 0, 'size': 0}
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU store with lazy TTL expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (expires_at, value)
+            self._evict()
+
+    def incr_many(self, keys: List[str], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                self._entries[key] = (expires_at, (entry[1] if entry else 0) + 1)
+            self._evict()
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'evictions': self.evictions, 'size': len(self._entries)}
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class SQLiteBackend(CacheBackend):
+    """Store shared by every worker process on one host, kept in a WAL-mode SQLite file"""
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.evictions = 0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cluster_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross a fork or a thread boundary
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cluster_cache WHERE key IN ({placeholders}) AND expires_at > ?',
+            (*keys, time.time())
+        ).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        expires_at = time.time() + ttl
+        self._connection().executemany(
+            'INSERT OR REPLACE INTO cluster_cache (key, value, expires_at) VALUES (?, ?, ?)',
+            [(key, json.dumps(value), expires_at) for key, value in items.items()]
+        )
+        self._maybe_prune(len(items))
+
+    def incr_many(self, keys: List[str], ttl: float) -> None:
+        expires_at = time.time() + ttl
+        self._connection().executemany(
+            'INSERT INTO cluster_cache (key, value, expires_at) VALUES (?, 1, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, expires_at = excluded.expires_at',
+            [(key, expires_at) for key in keys]
+        )
+        self._maybe_prune(len(keys))
+
+    def delete_many(self, keys: List[str]) -> None:
+        self._connection().executemany('DELETE FROM cluster_cache WHERE key = ?', [(key,) for key in keys])
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM cluster_cache')
+
+    def stats(self) -> Dict[str, int]:
+        size = self._connection().execute('SELECT COUNT(*) FROM cluster_cache').fetchone()[0]
+        return {'evictions': self.evictions, 'size': size}
+
+    def _maybe_prune(self, written: int) -> None:
+        self._writes += written
+        if self._writes < self.PRUNE_EVERY:
+            return
+        self._writes = 0
+        conn = self._connection()
+        conn.execute('DELETE FROM cluster_cache WHERE expires_at <= ?', (time.time(),))
+        # Entries closest to expiry are the least recently written ones
+        cursor = conn.execute(
+            'DELETE FROM cluster_cache WHERE key IN ('
+            'SELECT key FROM cluster_cache ORDER BY expires_at '
+            'LIMIT MAX((SELECT COUNT(*) FROM cluster_cache) - ?, 0))',
+            (self.max_entries,)
+        )
+        self.evictions += max(cursor.rowcount, 0)
+
+
+class RedisBackend(CacheBackend):
+    """Store shared across hosts, spoken to through any redis-py compatible client
+
+    Pass ``client`` to use an existing connection or an in-process fake such as
+    fakeredis; otherwise the redis package is imported and connected to ``url``.
+    """
+
+    def __init__(self, url: Optional[str] = None, client: Any = None, prefix: str = 'identify:'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [json.loads(value) if value is not None else None for value in values]
+
+    def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+        pipe.execute()
+
+    def incr_many(self, keys: List[str], ttl: float) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.incr(self.prefix + key)
+            pipe.pexpire(self.prefix + key, int(ttl * 1000))
+        pipe.execute()
+
+    def delete_many(self, keys: List[str]) -> None:
+        self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            evictions = int(self.client.info('stats').get('evicted_keys', 0))
+        except Exception:
+            # Fakes and some managed services do not implement INFO
+            evictions = 0
+        # DBSIZE would count every key in the database, not just this cache's prefix
+        size = sum(1 for _ in self.client.scan_iter(match=self.prefix + '*', count=1000))
+        return {'evictions': evictions, 'size': size}
+
+
+def create_backend(name: str, url: Optional[str], max_entries: int) -> CacheBackend:
+    """Build the backend selected by CLUSTER_CACHE_BACKEND"""
+    if name == 'memory':
+        return MemoryBackend(max_entries)
+    if name == 'sqlite':
+        return SQLiteBackend(url or 'cluster_cache.db', max_entries)
+    if name == 'redis':
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cluster cache backend: {name}")
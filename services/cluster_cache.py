@@ -0,0 +1,235 @@
+from typing import Dict, Any, Optional, Tuple
+import logging
+import threading
+import uuid
+
+from config import CLUSTER_CACHE_SIZE, CLUSTER_CACHE_TTL, CLUSTER_CACHE_BACKEND, CLUSTER_CACHE_URL
+from services.cache_backends import CacheBackend, create_backend
+from services.normalize import normalize_email, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Counter bumped by every invalidation, in the shared backend
+EPOCH_KEY = 'epoch'
+# Counter bumped by clear(); entries written under an older value read as misses
+RESET_KEY = 'reset'
+
+
+def cache_key(kind: str, value: Any) -> str:
+    """Build a cache key for an email or phone number from the normalized key the database matches on"""
+    return f"{kind}:{normalize_email(value) if kind == 'email' else normalize_phone(value)}"
+
+
+def cluster_key(primary_id: int) -> str:
+    return f"cluster:{primary_id}"
+
+
+def version_key(primary_id: int) -> str:
+    return f"version:{primary_id}"
+
+
+class ClusterCache:
+    """Bounded TTL cache mapping emails and phone numbers to their consolidated cluster
+
+    Each email and phone number maps to a primary id, and each primary id maps to
+    its cluster (emails, phone numbers, secondary ids) stamped with the cluster's
+    version. Writes bump the version of every primary they touch, and a shared
+    epoch counter, so with a shared backend a merge in one worker invalidates the
+    cluster for all workers at once. A reader takes a generation() token before it
+    reads the database and put() drops its result if any worker invalidated a
+    cluster since. Backend errors are logged and treated as misses, so an outage
+    of a shared store sends requests to the database instead of failing them.
+    """
+
+    def __init__(self,
+                 backend: Optional[CacheBackend] = None,
+                 max_entries: int = CLUSTER_CACHE_SIZE,
+                 ttl: float = CLUSTER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._backend = backend
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def backend(self) -> CacheBackend:
+        # Created on first use so forked workers never share a connection
+        if self._backend is None:
+            self._backend = create_backend(CLUSTER_CACHE_BACKEND, CLUSTER_CACHE_URL, self.max_entries)
+        return self._backend
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+        logger.warning(f"Cluster cache {operation} failed, falling back to the database: {str(error)}")
+
+    def generation(self) -> Optional[Tuple[int, int]]:
+        """Return a token to take before reading the database and pass to put()
+
+        put() drops the result if a cluster was invalidated, in this process or
+        any other sharing the backend, after the token was taken.
+        """
+        if not self.enabled:
+            return None
+        local = self._generation
+        try:
+            epoch = self.backend.get_many([EPOCH_KEY])[0] or 0
+        except Exception as e:
+            self._failed('read', e)
+            return None
+        return local, epoch
+
+    def get(self, email: Optional[str], phone_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return the consolidated response if every given key is cached for the same current cluster"""
+        found = self.get_stamped(email, phone_number)
+        return found[0] if found is not None else None
+
+    def get_stamped(self, email: Optional[str],
+                    phone_number: Optional[str]) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """Like get(), also returning the stamp of the cached entry
+
+        Every put() writes a new stamp, so one stamp always stands for the same
+        response; entries written without one return None.
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            cluster = self._lookup(email, phone_number)
+        except Exception as e:
+            self._failed('read', e)
+            return None
+        with self._lock:
+            if cluster is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        _, primary_id, emails, phone_numbers, secondary_ids = cluster[:5]
+        response = {
+            'contact': {
+                'primaryContatctId': primary_id,
+                'emails': list(emails),
+                'phoneNumbers': list(phone_numbers),
+                'secondaryContactIds': list(secondary_ids)
+            }
+        }
+        return response, cluster[5] if len(cluster) > 5 else None
+
+    def _lookup(self, email: Optional[str], phone_number: Optional[str]) -> Optional[list]:
+        keys = []
+        if email:
+            keys.append(cache_key('email', email))
+        if phone_number:
+            keys.append(cache_key('phone', phone_number))
+
+        primary_ids = set(self.backend.get_many(keys))
+        if len(primary_ids) != 1 or None in primary_ids:
+            return None
+
+        primary_id = primary_ids.pop()
+        cluster, version, reset = self.backend.get_many([cluster_key(primary_id), version_key(primary_id), RESET_KEY])
+        if cluster is None or cluster[0] != (version or 0) or cluster[6:] != [reset or 0]:
+            return None
+
+        # A key may still point at a cluster it has since been merged out of
+        if email and normalize_email(email) not in map(normalize_email, cluster[2]):
+            return None
+        if phone_number and normalize_phone(phone_number) not in map(normalize_phone, cluster[3]):
+            return None
+        return cluster
+
+    def put(self, response: Dict[str, Any], generation: Optional[Tuple[int, int]]) -> None:
+        """Cache a consolidated response under all of its emails and phone numbers
+
+        `generation` is the token taken before the response was read from the
+        database; nothing is cached if a cluster has been invalidated since.
+        """
+        if not self.enabled or generation is None or generation[0] != self._generation:
+            return
+        try:
+            self._put(response, generation[1])
+        except Exception as e:
+            self._failed('write', e)
+
+    def _put(self, response: Dict[str, Any], epoch: int) -> None:
+        contact = response['contact']
+        primary_id = contact['primaryContatctId']
+        # invalidate() bumps the epoch before the versions, so a version read
+        # together with an unchanged epoch is the one the response was read under
+        version, current_epoch, reset = self.backend.get_many([version_key(primary_id), EPOCH_KEY, RESET_KEY])
+        if (current_epoch or 0) != epoch:
+            return
+        version = version or 0
+
+        items = {cache_key('email', e): primary_id for e in contact['emails']}
+        items.update({cache_key('phone', p): primary_id for p in contact['phoneNumbers']})
+        items[cluster_key(primary_id)] = [
+            version,
+            primary_id,
+            contact['emails'],
+            contact['phoneNumbers'],
+            contact['secondaryContactIds'],
+            uuid.uuid4().hex,
+            reset or 0
+        ]
+        self.backend.set_many(items, self.ttl)
+
+    def invalidate(self, *primary_ids: int) -> None:
+        """Bump the version of, and drop, every cluster rooted at the given primary ids"""
+        if not self.enabled or not primary_ids:
+            return
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        # Versions outlive the entries stamped with them, so an expired counter reads as a miss.
+        # The epoch goes first: a reader that sees a bumped version also sees the bumped epoch
+        try:
+            self.backend.incr_many([EPOCH_KEY, *(version_key(p) for p in primary_ids)], self.ttl * 2)
+            self.backend.delete_many([cluster_key(p) for p in primary_ids])
+        except Exception as e:
+            self._failed('invalidate', e)
+
+    def clear(self) -> None:
+        """Drop every entry, in every process sharing the backend
+
+        Bumps the reset counter rather than wiping the store, so the epoch and
+        version counters only ever grow and in-flight put()s are dropped as after
+        invalidate(). An in-process memory backend is only cleared for this process.
+        """
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        try:
+            self.backend.incr_many([EPOCH_KEY, RESET_KEY], self.ttl * 2)
+        except Exception as e:
+            self._failed('clear', e)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and the current size"""
+        with self._lock:
+            counters = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'errors': self.errors
+            }
+        try:
+            counters.update(self.backend.stats() if self.enabled else {'evictions': 0, 'size': 0})
+        except Exception as e:
+            self._failed('stats', e)
+            counters.update({'evictions': 0, 'size': 0})
+        return counters
+
+
+# Process-wide cache shared by every ContactService instance
+cluster_cache = ClusterCache()
@@ -1,118 +1,569 @@
-from typing import Dict, Any, List, Optional
-from sqlalchemy import or_, and_
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from collections import defaultdict
+from itertools import chain
+from sqlalchemy import or_, and_, select, insert, literal, union, update, delete, func, tuple_
+from importlib import import_module
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
-from database import db_session
-from models import Contact
+from config import CHANGE_FEED_ENABLED, DB_HASH_PARTITIONS
+from database import db_session, engine
+from models import ClusterEvent, ClusterKey, Contact, ContactCluster
+from services.cluster_cache import ClusterCache, cluster_cache
+from services.group_commit import GroupCommitter, group_committer
+from services.key_filter import KeyFilter, key_filter
+from services.json_codec import RequestError, validate_identify
+from services.key_locks import KeyLocks, LockContention, LockRetry, key_locks
+from services.metrics import note_branch, phase
+from services.read_routing import ReadRouter, read_router
+from services.normalize import normalize_email, normalize_phone
+from services.union_find import UnionFind
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Re-reads allowed while concurrent merges keep moving a cluster under new roots
+MAX_LOCK_ATTEMPTS = 5
+
+class PendingContact:
+    """A contact planned by identify_batch that gets its id once the batch is inserted"""
+    __slots__ = ('id', 'seq', 'email', 'phoneNumber')
+    
+    def __init__(self, seq: int, email: Optional[str], phone_number: Optional[str]):
+        self.id = None
+        self.seq = seq
+        self.email = email
+        self.phoneNumber = phone_number
+
+
+class ContactRow:
+    """Column-projected contact loaded by cluster_query, without ORM identity-map bookkeeping"""
+    __slots__ = ('id', 'email', 'phoneNumber', 'linkedId', 'linkPrecedence', 'createdAt')
+    
+    def __init__(self, id, email, phoneNumber, linkedId, linkPrecedence, createdAt):
+        self.id = id
+        self.email = email
+        self.phoneNumber = phoneNumber
+        self.linkedId = linkedId
+        self.linkPrecedence = linkPrecedence
+        self.createdAt = createdAt
+
+
+# Columns the identify path reads, in ContactRow order
+CONTACT_ROW_COLUMNS = (
+    Contact.id, Contact.email, Contact.phoneNumber,
+    Contact.linkedId, Contact.linkPrecedence, Contact.createdAt
+)
+
+
+def _age_key(contact) -> Tuple:
+    """Order contacts oldest first; contacts created by a batch are newer than any stored one"""
+    if isinstance(contact, PendingContact):
+        return (1, contact.seq, 0)
+    return (0, contact.createdAt, contact.id)
+
+
+def _id_key(contact) -> Tuple:
+    """Order contacts by id, placing contacts created by a batch after every stored one"""
+    if isinstance(contact, PendingContact):
+        return (1, contact.seq)
+    return (0, contact.id)
+
+
+def cluster_members(root_ids):
+    """Recursive CTE of the given root ids (a list or a subquery) and every live contact beneath them"""
+    members = select(Contact.id).where(Contact.id.in_(root_ids)).cte('members', recursive=True)
+    child = aliased(Contact)
+    return members.union(
+        select(child.id)
+        .join(members, child.linkedId == members.c.id)
+        .where(child.deletedAt.is_(None))
+    )
+
+
+def cluster_query(emails: Iterable[str], phone_numbers: Iterable[str]):
+    """Build the single query that loads every cluster touched by the emails or phone numbers
+
+    Emails and phone numbers are matched on their normalized keys. A recursive
+    CTE walks linkedId up from the matching rows to their roots and then back
+    down to every live descendant, so all clusters come back in one round trip,
+    ordered by id. Returns None when there is nothing to match.
+    """
+    email_keys = {normalize_email(e) for e in emails} - {None}
+    phone_keys = {normalize_phone(p) for p in phone_numbers} - {None}
+    if DB_HASH_PARTITIONS > 0:
+        return routed_cluster_query(email_keys, phone_keys)
+    lookups = []
+    if email_keys:
+        lookups.append(select(Contact.id, Contact.linkedId).where(
+            Contact.emailKey.in_(sorted(email_keys)), Contact.deletedAt.is_(None)
+        ))
+    if phone_keys:
+        lookups.append(select(Contact.id, Contact.linkedId).where(
+            Contact.phoneKey.in_(sorted(phone_keys)), Contact.deletedAt.is_(None)
+        ))
+    if not lookups:
+        return None
+
+    # One lookup per key column, each answered from its partial covering index
+    matches = (union(*lookups) if len(lookups) > 1 else lookups[0]).cte('matches')
+    ancestors = select(matches.c.id, matches.c.linkedId).cte('ancestors', recursive=True)
+    parent = aliased(Contact)
+    ancestors = ancestors.union(
+        select(parent.id, parent.linkedId).join(ancestors, parent.id == ancestors.c.linkedId)
+    )
+
+    members = cluster_members(select(ancestors.c.id).where(ancestors.c.linkedId.is_(None)))
+    return select(*CONTACT_ROW_COLUMNS).where(Contact.id.in_(select(members.c.id))).order_by(Contact.id)
+
+
+def key_roots(email_keys: Iterable[str], phone_keys: Iterable[str]):
+    """Select the primaries cluster_key maps the keys to; None when there are no keys"""
+    conditions = [
+        and_(ClusterKey.kind == kind, ClusterKey.key.in_(sorted(keys)))
+        for kind, keys in (('email', email_keys), ('phone', phone_keys)) if keys
+    ]
+    if not conditions:
+        return None
+    return select(ClusterKey.primaryId).where(or_(*conditions))
+
+
+def routed_cluster_query(email_keys: Iterable[str], phone_keys: Iterable[str]):
+    """cluster_query for hash-partitioned tables: match the keys in cluster_key instead of contact
+
+    cluster_key is partitioned by key, so each key is one primary-key probe of the
+    one partition that can hold it, where the contact key indexes would be probed
+    in every partition of contact. The keys lead straight to the roots, then the
+    cluster is loaded by id and linkedId. cluster_key is written in the same
+    transaction as the contacts, but contacts soft-deleted outside the service keep
+    their keys until `bulk_import.py refresh`.
+    """
+    roots = key_roots(email_keys, phone_keys)
+    if roots is None:
+        return None
+    members = cluster_members(roots)
+    return select(*CONTACT_ROW_COLUMNS).where(Contact.id.in_(select(members.c.id))).order_by(Contact.id)
+
+
+def relink_statement(root_ids: Iterable[int], primary_id: int):
+    """Build the UPDATE that links every contact under the given roots directly to primary_id
+
+    Descendants are found by the same recursive walk that loads a cluster, so
+    the statement's size depends on the number of merged roots, never on the
+    number of rows they carry, and rows already linked to primary_id are skipped.
+    """
+    members = cluster_members(list(root_ids))
+    return (
+        update(Contact)
+        .where(
+            Contact.id.in_(select(members.c.id)),
+            Contact.id != primary_id,
+            or_(
+                Contact.linkedId.is_(None),
+                Contact.linkedId != primary_id,
+                Contact.linkPrecedence != 'secondary'
+            )
+        )
+        .values(linkedId=primary_id, linkPrecedence='secondary')
+        .execution_options(synchronize_session=False)
+    )
+
+
+def unseen_insert(email: Optional[str], phone_number: Optional[str]):
+    """Build the INSERT ... SELECT of a new primary that writes nothing if a live contact holds either key
+
+    Each NOT EXISTS probe is answered from its partial key index (from cluster_key
+    when the tables are hash-partitioned), so a brand-new contact costs one
+    statement instead of a cluster query and an INSERT.
+    RETURNING yields the new id, or no row when a match exists.
+    """
+    email_key = normalize_email(email)
+    phone_key = normalize_phone(phone_number)
+    source = select(
+        literal(email, Contact.email.type), literal(phone_number, Contact.phoneNumber.type),
+        literal(email_key, Contact.emailKey.type), literal(phone_key, Contact.phoneKey.type),
+        literal('primary', Contact.linkPrecedence.type)
+    )
+    for kind, column, key in (('email', Contact.emailKey, email_key), ('phone', Contact.phoneKey, phone_key)):
+        if key is None:
+            continue
+        if DB_HASH_PARTITIONS > 0:
+            # One partition of cluster_key rather than the key index of every contact partition
+            taken = select(ClusterKey.primaryId).where(ClusterKey.kind == kind, ClusterKey.key == key)
+        else:
+            taken = select(Contact.id).where(column == key, Contact.deletedAt.is_(None))
+        source = source.where(~taken.exists())
+    return (
+        insert(Contact)
+        .from_select(['email', 'phoneNumber', 'emailKey', 'phoneKey', 'linkPrecedence'], source)
+        .returning(Contact.id)
+    )
+
+
+def secondaries_query(primary_id: int, after: Optional[int] = None):
+    """Build the keyset query over a cluster's live secondaries, by id, starting after `after`
+
+    Every write path links secondaries straight to their primary, so a page is one
+    range scan of idx_linked (linkedId, id) however large the cluster is.
+    """
+    query = select(*CONTACT_ROW_COLUMNS).where(Contact.linkedId == primary_id, Contact.deletedAt.is_(None))
+    if after is not None:
+        query = query.where(Contact.id > after)
+    return query.order_by(Contact.id)
+
+
+def contact_dict(row) -> Dict[str, Any]:
+    """Serialize one contact row (CONTACT_ROW_COLUMNS) for GET /contacts/<id>"""
+    return {
+        'id': row.id,
+        'email': row.email,
+        'phoneNumber': row.phoneNumber,
+        'linkedId': row.linkedId,
+        'linkPrecedence': row.linkPrecedence,
+        'createdAt': row.createdAt.isoformat() if row.createdAt else None
+    }
+
+
+# Arrays of an /identify response that grow with the cluster
+RESPONSE_ARRAYS = ('emails', 'phoneNumbers', 'secondaryContactIds')
+
+
+def cap_response(response: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """Return the response with each array cut to `limit` items and 'truncated' set if any was cut
+
+    The response itself is left alone, since it may be shared with the cluster
+    cache. A limit of 0 disables the cap; GET /contacts/<id> pages through the rest.
+    """
+    contact = response['contact']
+    if limit <= 0 or all(len(contact[name]) <= limit for name in RESPONSE_ARRAYS):
+        return response
+    capped = {name: value[:limit] if name in RESPONSE_ARRAYS else value for name, value in contact.items()}
+    return {'contact': capped, 'truncated': True}
+
+
+# INSERT ... ON CONFLICT for the materialized cluster tables, from the primary's dialect only
+_upsert = import_module(
+    'sqlalchemy.dialects.postgresql' if engine.dialect.name == 'postgresql' else 'sqlalchemy.dialects.sqlite'
+).insert
+
+
+def cluster_keys(emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]]) -> List[Tuple[str, str]]:
+    """Normalized (kind, key) pairs for the cluster_key table, deduplicated in order"""
+    keys = [('email', key) for key in map(normalize_email, emails) if key]
+    keys += [('phone', key) for key in map(normalize_phone, phone_numbers) if key]
+    return list(dict.fromkeys(keys))
+
+
+def consolidated_query(email: Optional[str], phone_number: Optional[str]):
+    """Build the query that maps the request's keys straight to their clusters' stored responses
+
+    One primary-key probe of cluster_key per key joined to contact_cluster, so
+    its cost does not depend on the size of the cluster. Returns None without keys.
+    """
+    conditions = [
+        and_(ClusterKey.kind == kind, ClusterKey.key == key)
+        for kind, key in cluster_keys([email], [phone_number])
+    ]
+    if not conditions:
+        return None
+    return (
+        select(ClusterKey.kind, ContactCluster.primaryId, ContactCluster.emails,
+               ContactCluster.phoneNumbers, ContactCluster.secondaryContactIds)
+        .join(ContactCluster, ContactCluster.primaryId == ClusterKey.primaryId)
+        .where(or_(*conditions))
+    )
+
+
+# Id of the writing transaction, stamped on change-feed events so readers can wait for it to finish
+_txid = func.txid_current() if engine.dialect.name == 'postgresql' else literal(0)
+
+
+def cluster_events(primary_id: int, demoted_roots: Iterable[int], added: Iterable[int]) -> List[Dict[str, Any]]:
+    """Change-feed rows for one cluster write: each demoted primary, then each contact it created"""
+    events = [
+        {'kind': 'primary_demoted', 'contactId': root, 'primaryId': primary_id, 'previousPrimaryId': root}
+        for root in sorted(demoted_roots)
+    ]
+    events += [
+        {'kind': 'created' if contact_id == primary_id else 'secondary_added', 'contactId': contact_id,
+         'primaryId': primary_id, 'previousPrimaryId': None}
+        for contact_id in added
+    ]
+    return events
+
+
+def resync_events(primary_ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Change-feed rows telling consumers to re-read clusters changed outside the identify path"""
+    return [
+        {'kind': 'resync', 'contactId': primary_id, 'primaryId': primary_id, 'previousPrimaryId': None}
+        for primary_id in sorted(set(primary_ids))
+    ]
+
+
+def record_events(executor, events: List[Dict[str, Any]]) -> None:
+    """Append change-feed rows in the caller's transaction (a Session or Connection), unless CHANGE_FEED_ENABLED is off"""
+    if events and CHANGE_FEED_ENABLED:
+        executor.execute(insert(ClusterEvent).values(txid=_txid), events)
+
+
+def changes_query(after: Optional[Tuple[int, int]] = None):
+    """Build the keyset query over the change feed in (txid, id) order, starting after `after`
+
+    Ids are handed out before commit, so on PostgreSQL a transaction can commit
+    events below ids a reader has already passed. Ordering by the writing
+    transaction first and serving only transactions older than every one still
+    running (the snapshot's xmin) means a page never skips an event that commits
+    later. Elsewhere txid is 0 and writers are serialized, so id order is commit order.
+    """
+    query = select(ClusterEvent)
+    if engine.dialect.name == 'postgresql':
+        query = query.where(ClusterEvent.txid < func.txid_snapshot_xmin(func.txid_current_snapshot()))
+    if after is not None:
+        query = query.where(tuple_(ClusterEvent.txid, ClusterEvent.id) > tuple_(*after))
+    return query.order_by(ClusterEvent.txid, ClusterEvent.id)
+
+
+def event_dict(event: ClusterEvent) -> Dict[str, Any]:
+    """Serialize one cluster_event row for GET /changes"""
+    return {
+        'id': event.id,
+        'kind': event.kind,
+        'contactId': event.contactId,
+        'primaryId': event.primaryId,
+        'previousPrimaryId': event.previousPrimaryId,
+        'createdAt': event.createdAt.isoformat() if event.createdAt else None
+    }
+
+
+def consolidated_statements(response: Dict[str, Any], demoted_roots: Iterable[int] = (),
+                            keys: Iterable[Tuple[str, str]] = (), added: Iterable[int] = ()) -> List[Any]:
+    """Build the statements that store a cluster's response and point keys at its primary
+
+    Runs in the transaction that changed the cluster. The rows of demoted clusters
+    are dropped and their keys follow them to the surviving primary; `keys` are
+    the (kind, key) pairs the write added or touched and `added` the ids of the
+    contacts it created. The demotions and new contacts are also appended to the
+    cluster_event outbox, unless CHANGE_FEED_ENABLED is off.
+    """
+    contact = response['contact']
+    primary_id = contact['primaryContatctId']
+    stored = _upsert(ContactCluster).values(
+        primaryId=primary_id,
+        emails=contact['emails'],
+        phoneNumbers=contact['phoneNumbers'],
+        secondaryContactIds=contact['secondaryContactIds']
+    )
+    statements = [stored.on_conflict_do_update(
+        index_elements=[ContactCluster.primaryId],
+        set_={
+            'emails': stored.excluded.emails,
+            'phoneNumbers': stored.excluded.phoneNumbers,
+            'secondaryContactIds': stored.excluded.secondaryContactIds,
+            'updatedAt': func.now()
+        }
+    )]
+    
+    demoted_roots = list(demoted_roots)
+    if demoted_roots:
+        statements.append(delete(ContactCluster).where(ContactCluster.primaryId.in_(demoted_roots)))
+        statements.append(
+            update(ClusterKey)
+            .where(ClusterKey.primaryId.in_(demoted_roots))
+            .values(primaryId=primary_id)
+            .execution_options(synchronize_session=False)
+        )
+    
+    keys = [{'kind': kind, 'key': key, 'primaryId': primary_id} for kind, key in keys]
+    if keys:
+        pointed = _upsert(ClusterKey).values(keys)
+        statements.append(pointed.on_conflict_do_update(
+            index_elements=[ClusterKey.kind, ClusterKey.key],
+            set_={'primaryId': pointed.excluded.primaryId}
+        ))
+    
+    events = cluster_events(primary_id, demoted_roots, added) if CHANGE_FEED_ENABLED else []
+    if events:
+        statements.append(insert(ClusterEvent).values([dict(event, txid=_txid) for event in events]))
+    return statements
+
+
 class ContactService:
     """Service for contact identity reconciliation using SQLAlchemy"""
     
-    def find_matching_contacts(self, email: Optional[str], phone_number: Optional[str]) -> List[Contact]:
-        """Find all contacts that match the given email or phone number"""
-        try:
-            query = Contact.query.filter(Contact.deletedAt.is_(None))
-            
-            # Build OR condition for email and phone
-            conditions = []
-            if email:
-                conditions.append(Contact.email == email)
-            if phone_number:
-                conditions.append(Contact.phoneNumber == phone_number)
-            
-            if conditions:
-                query = query.filter(or_(*conditions))
-            
-            return query.all()
-        except SQLAlchemyError as e:
-            logger.error(f"Database error in find_matching_contacts: {str(e)}")
-            db_session.rollback()
-            raise
+    def __init__(self, cache: Optional[ClusterCache] = cluster_cache, locks: KeyLocks = key_locks,
+                 group_commit: Optional[GroupCommitter] = group_committer,
+                 reads: Optional[ReadRouter] = read_router, known_keys: Optional[KeyFilter] = key_filter):
+        self.cache = cache
+        self.key_locks = locks
+        self.group_commit = group_commit
+        self.reads = reads
+        self.known_keys = known_keys
+        # Stamp of the cluster cache entry a response was answered from, to reuse its encoded body
+        self.cached_stamp: Optional[str] = None
     
-    def get_contact_by_id(self, contact_id: int) -> Contact:
-        """Get a contact by ID"""
+    def resolve_cluster(self, email: Optional[str], phone_number: Optional[str], session=db_session) -> List[ContactRow]:
+        """Load every contact in the clusters touched by email or phone number in a single query"""
+        return self.resolve_clusters([email] if email else [], [phone_number] if phone_number else [], session)
+
+    def resolve_clusters(self, emails: Iterable[str], phone_numbers: Iterable[str],
+                         session=db_session) -> List[ContactRow]:
+        """Load every contact in the clusters touched by any of the emails or phone numbers"""
+        stmt = cluster_query(emails, phone_numbers)
+        if stmt is None:
+            return []
         try:
-            contact = Contact.query.filter(Contact.id == contact_id).first()
-            if not contact:
-                raise ValueError(f"Contact with ID {contact_id} not found")
-            return contact
+            return [ContactRow(*row) for row in session.execute(stmt).tuples()]
         except SQLAlchemyError as e:
-            logger.error(f"Database error in get_contact_by_id: {str(e)}")
-            db_session.rollback()
+            logger.error(f"Database error in resolve_clusters: {str(e)}")
+            session.rollback()
             raise
     
-    def get_all_secondaries(self, primary_id: int) -> List[Contact]:
-        """Get all secondary contacts linked to a primary contact"""
+    def read_replica(self, email: Optional[str], phone_number: Optional[str]) -> Optional[List[ContactRow]]:
+        """Answer a lookup-only request from the read replica, or None when it needs the primary
+
+        Requests that would write, and keys or clusters written within the
+        read-your-writes window, go to the primary; so does everything while the
+        replica is unreachable.
+        """
+        if self.reads is None or self.reads.written_keys([email], [phone_number]):
+            return None
+        session = self.reads.session
         try:
-            return Contact.query.filter(
-                and_(
-                    Contact.linkedId == primary_id,
-                    Contact.deletedAt.is_(None)
-                )
-            ).all()
-        except SQLAlchemyError as e:
-            logger.error(f"Database error in get_all_secondaries: {str(e)}")
-            db_session.rollback()
-            raise
+            cluster = self.resolve_cluster(email, phone_number, session)
+        except SQLAlchemyError:
+            logger.warning("Read replica unavailable, reading from the primary")
+            return None
+        finally:
+            session.rollback()
+        if self.needs_write(cluster, email, phone_number) or self.reads.written_clusters(cluster):
+            return None
+        return cluster
     
-    def create_primary_contact(self, email: Optional[str], phone_number: Optional[str]) -> Contact:
-        """Create a new primary contact"""
-        try:
-            contact = Contact(
-                email=email,
-                phone_number=phone_number,
-                link_precedence='primary'
-            )
-            db_session.add(contact)
-            db_session.commit()
-            return contact
-        except SQLAlchemyError as e:
-            logger.error(f"Database error in create_primary_contact: {str(e)}")
-            db_session.rollback()
-            raise
+    def note_written(self, emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]],
+                     roots: Iterable[int]) -> None:
+        """Keep reads of freshly written keys and clusters on the primary, and mark the keys as known"""
+        emails, phone_numbers = list(emails), list(phone_numbers)
+        if self.reads is not None:
+            self.reads.note_write(emails, phone_numbers, roots)
+        if self.known_keys is not None:
+            self.known_keys.add(emails, phone_numbers)
     
-    def create_secondary_contact(self, primary_id: int, email: Optional[str], phone_number: Optional[str]) -> Contact:
-        """Create a new secondary contact linked to a primary"""
-        try:
-            contact = Contact(
-                email=email,
-                phone_number=phone_number,
-                linked_id=primary_id,
-                link_precedence='secondary'
-            )
-            db_session.add(contact)
-            db_session.commit()
-            return contact
-        except SQLAlchemyError as e:
-            logger.error(f"Database error in create_secondary_contact: {str(e)}")
-            db_session.rollback()
-            raise
+    def from_consolidated(self, rows, email: Optional[str], phone_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Turn consolidated_query rows into a lookup response, or None when the request must be resolved in full
+
+        Only a request whose every key is stored under the same primary is a pure
+        lookup; a key without a row may be new (or predate the table) and two
+        primaries mean a merge.
+        """
+        if (email and not normalize_email(email)) or (phone_number and not normalize_phone(phone_number)):
+            return None
+        kinds = {kind for kind, _ in cluster_keys([email], [phone_number])}
+        if {row.kind for row in rows} != kinds or len({row.primaryId for row in rows}) != 1:
+            return None
+        row = rows[0]
+        return {
+            'contact': {
+                'primaryContatctId': row.primaryId,
+                'emails': row.emails,
+                'phoneNumbers': row.phoneNumbers,
+                'secondaryContactIds': row.secondaryContactIds
+            }
+        }
     
-    def convert_to_secondary(self, contact: Contact, new_primary_id: int) -> None:
-        """Convert a primary contact to secondary and update its linked secondaries"""
-        try:
-            # Find all secondary contacts linked to this contact
-            secondaries = self.get_all_secondaries(contact.id)
-            
-            # Update all secondaries to point to the new primary
-            for secondary in secondaries:
-                secondary.linkedId = new_primary_id
-            
-            # Convert this contact to secondary
-            contact.linkPrecedence = 'secondary'
-            contact.linkedId = new_primary_id
-            
-            db_session.commit()
-        except SQLAlchemyError as e:
-            logger.error(f"Database error in convert_to_secondary: {str(e)}")
-            db_session.rollback()
-            raise
+    def lookup_consolidated(self, email: Optional[str], phone_number: Optional[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Answer a pure lookup with one indexed fetch from the materialized cluster tables
+
+        Reads the replica when the request may be routed there. Returns the
+        response (None when the full path is needed) and whether it came from the replica.
+        """
+        stmt = consolidated_query(email, phone_number)
+        if stmt is None:
+            return None, False
+        if self.reads is not None and not self.reads.written_keys([email], [phone_number]):
+            session = self.reads.session
+            try:
+                response = self.from_consolidated(session.execute(stmt).all(), email, phone_number)
+            except SQLAlchemyError:
+                logger.warning("Read replica unavailable, reading from the primary")
+            else:
+                # On a miss the cluster query on the replica decides, rather than a second probe here
+                fresh = response is not None and not self.reads.written_roots([response['contact']['primaryContatctId']])
+                return (response if fresh else None), fresh
+            finally:
+                session.rollback()
+        return self.from_consolidated(db_session.execute(stmt).all(), email, phone_number), False
+    
+    def store_consolidated(self, executor, response: Dict[str, Any], demoted_roots: Iterable[int],
+                           emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]],
+                           added: Iterable[int] = ()) -> None:
+        """Refresh the materialized cluster and record its events in the caller's transaction (a Session or Connection)"""
+        for stmt in consolidated_statements(response, demoted_roots, cluster_keys(emails, phone_numbers), added):
+            executor.execute(stmt)
+
+    def get_primary_row(self, primary_id: int) -> Optional[ContactRow]:
+        """Load a live primary contact, or None when the id is unknown, deleted or a secondary"""
+        row = db_session.execute(
+            select(*CONTACT_ROW_COLUMNS)
+            .where(Contact.id == primary_id, Contact.linkedId.is_(None), Contact.deletedAt.is_(None))
+        ).first()
+        return ContactRow(*row) if row is not None else None
+    
+    def get_cluster_page(self, primary: ContactRow, after: Optional[int], limit: int) -> Dict[str, Any]:
+        """One page of a cluster: the primary, up to `limit` secondaries after id `after`, and the next cursor"""
+        rows = db_session.execute(secondaries_query(primary.id, after).limit(limit + 1)).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'primary': contact_dict(primary),
+            'secondaries': [contact_dict(row) for row in rows],
+            'nextCursor': str(rows[-1].id) if more else None
+        }
+    
+    def get_changes(self, after: Optional[Tuple[int, int]], limit: int) -> Dict[str, Any]:
+        """One page of the change feed: up to `limit` events after cursor `after`, and the next cursor
+
+        The cursor is returned even on an empty page, so consumers keep polling with
+        the last one they got.
+        """
+        events = db_session.execute(changes_query(after).limit(limit)).scalars().all()
+        if events:
+            after = (events[-1].txid, events[-1].id)
+        return {
+            'events': [event_dict(event) for event in events],
+            'nextCursor': f"{after[0]}-{after[1]}" if after is not None else None
+        }
+    
+    def stream_cluster(self, primary_id: int, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Yield a cluster's secondaries in lists of up to `batch_size`, read through a server-side cursor
+
+        Holds one pooled connection until the generator is exhausted or closed, and
+        never more than one batch of rows in memory.
+        """
+        with engine.connect() as conn:
+            result = conn.execution_options(yield_per=batch_size).execute(secondaries_query(primary_id))
+            for rows in result.partitions():
+                yield [contact_dict(row) for row in rows]
+    
+    def add_contact(self,
+                    email: Optional[str],
+                    phone_number: Optional[str],
+                    linked_id: Optional[int] = None) -> Contact:
+        """Stage a new contact and flush it so its id is known, without committing"""
+        contact = Contact(
+            email=email,
+            phone_number=phone_number,
+            linked_id=linked_id,
+            link_precedence='secondary' if linked_id else 'primary'
+        )
+        db_session.add(contact)
+        db_session.flush()
+        return contact
+
+    def invalidate_clusters(self, *primary_ids: int) -> None:
+        """Drop cached clusters whose membership changed"""
+        if self.cache is not None:
+            self.cache.invalidate(*primary_ids)
     
     def need_new_secondary(self, 
                            primary: Contact, 
@@ -120,14 +571,81 @@ class ContactService:
                            email: Optional[str], 
                            phone_number: Optional[str]) -> bool:
         """Check if a new secondary contact needs to be created"""
-        existing_emails = [c.email for c in existing_contacts]
-        existing_phones = [c.phoneNumber for c in existing_contacts]
+        existing_emails = {normalize_email(c.email) for c in existing_contacts}
+        existing_phones = {normalize_phone(c.phoneNumber) for c in existing_contacts}
         
-        email_exists = not email or email in existing_emails
-        phone_exists = not phone_number or phone_number in existing_phones
+        email_exists = not email or normalize_email(email) in existing_emails
+        phone_exists = not phone_number or normalize_phone(phone_number) in existing_phones
         
         return not (email_exists and phone_exists)
     
+    def insert_unseen(self, email: Optional[str], phone_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Create a primary for keys the key filter has never seen, unless a contact holds them after all
+
+        The filter misses other workers' recent writes, so the INSERT is guarded by
+        NOT EXISTS on both keys and runs under the same key locks as any other
+        write. Returns None, having written nothing, when the guard finds a match.
+        """
+        locks = self.key_locks.acquire(db_session, [email], [phone_number], set())
+        try:
+            with phase('write'):
+                contact_id = db_session.execute(unseen_insert(email, phone_number)).scalar()
+            if contact_id is None:
+                db_session.rollback()
+                self.known_keys.add([email], [phone_number])
+                return None
+            with phase('consolidate'):
+                response = self.format_response(ContactRow(contact_id, email, phone_number, None, 'primary', None))
+                self.store_consolidated(db_session, response, (), [email], [phone_number], [contact_id])
+            with phase('commit'):
+                db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
+        finally:
+            locks.release()
+        self.note_written([email], [phone_number], [contact_id])
+        return response
+    
+    def insert_grouped(self,
+                       locks,
+                       email: Optional[str],
+                       phone_number: Optional[str],
+                       primary: Optional[ContactRow] = None,
+                       secondaries: List[ContactRow] = ()) -> Dict[str, Any]:
+        """Insert a contact through the group committer and return the response once its batch has committed
+
+        The new contact becomes a secondary of `primary` (a primary without one),
+        and its cluster's materialized row is written in the batch's transaction.
+        Local locks outlive the transaction, so the read transaction is ended first and
+        cannot hold up the batch's write; advisory locks end with it, so it stays open
+        (and the keys stay locked) until the batch is acknowledged. If this request
+        leads the batch, the batch is written and committed on its own session.
+        """
+        linked_id = primary.id if primary is not None else None
+        precedence = 'secondary' if linked_id else 'primary'
+        responses = []
+        
+        def store(conn, contact_id):
+            contact = ContactRow(contact_id, email, phone_number, linked_id, precedence, None)
+            if primary is None:
+                response = self.format_response(contact)
+            else:
+                response = self.build_consolidated(primary, [*secondaries, contact])
+            self.store_consolidated(conn, response, (), [email], [phone_number], [contact_id])
+            responses.append(response)
+        
+        if not locks.transactional:
+            db_session.rollback()
+        self.group_commit.insert({
+            'email': email,
+            'phoneNumber': phone_number,
+            'linkedId': linked_id,
+            'linkPrecedence': precedence
+        }, store, db_session)
+        db_session.rollback()
+        return responses[0]
+    
     def format_response(self, primary_contact: Contact) -> Dict[str, Any]:
         """Format response for a single primary contact with no secondaries"""
         emails = [primary_contact.email] if primary_contact.email else []
@@ -142,107 +660,425 @@ class ContactService:
             }
         }
     
-    def get_consolidated_contact(self, primary: Contact) -> Dict[str, Any]:
-        """Get a consolidated contact (primary + all secondaries)"""
-        secondaries = self.get_all_secondaries(primary.id)
-        
-        emails = []
-        phone_numbers = []
+    def build_consolidated(self, primary: Contact, secondaries: List[Contact]) -> Dict[str, Any]:
+        """Build the consolidated response from an already loaded primary and its secondaries
+
+        Emails and phone numbers are deduplicated with insertion-ordered dicts, the
+        primary's values first, so the cost stays linear in the cluster size.
+        """
+        emails = dict.fromkeys([primary.email] if primary.email else [])
+        phone_numbers = dict.fromkeys([primary.phoneNumber] if primary.phoneNumber else [])
         secondary_ids = []
         
-        # Add primary contact details first
-        if primary.email:
-            emails.append(primary.email)
-        
-        if primary.phoneNumber:
-            phone_numbers.append(primary.phoneNumber)
-        
-        # Add secondary contact details
         for secondary in secondaries:
             secondary_ids.append(secondary.id)
-            
-            if secondary.email and secondary.email not in emails:
-                emails.append(secondary.email)
-            
-            if secondary.phoneNumber and secondary.phoneNumber not in phone_numbers:
-                phone_numbers.append(secondary.phoneNumber)
+            if secondary.email:
+                emails[secondary.email] = None
+            if secondary.phoneNumber:
+                phone_numbers[secondary.phoneNumber] = None
         
         return {
             'contact': {
                 'primaryContatctId': primary.id,
-                'emails': emails,
-                'phoneNumbers': phone_numbers,
+                'emails': list(emails),
+                'phoneNumbers': list(phone_numbers),
                 'secondaryContactIds': secondary_ids
             }
         }
     
-    def identify_contact(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Main method to identify and consolidate contacts"""
+    def extract_keys(self, request_data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """Read email and phoneNumber from a request, accepting phone numbers sent as JSON numbers"""
         email = request_data.get('email')
         phone_number = request_data.get('phoneNumber')
+        if isinstance(phone_number, int) and not isinstance(phone_number, bool):
+            phone_number = str(phone_number)
+        return email, phone_number
+    
+    def plan_merge(self, cluster: List[ContactRow]) -> Tuple[ContactRow, List[ContactRow]]:
+        """Pick the oldest primary of a loaded cluster and list the contacts that must link to it"""
+        primary_contacts = [c for c in cluster if c.linkPrecedence == 'primary'] or cluster[:1]
+        primary_contact = min(primary_contacts, key=lambda c: (c.createdAt, c.id))
+        relinked = [
+            c for c in cluster
+            if c is not primary_contact
+            and (c.linkedId != primary_contact.id or c.linkPrecedence != 'secondary')
+        ]
+        return primary_contact, relinked
+    
+    def needs_write(self, cluster: List[ContactRow], email: Optional[str], phone_number: Optional[str]) -> bool:
+        """Check if identifying this email/phone against a loaded cluster would insert or relink contacts"""
+        if not cluster:
+            return True
+        primary_contact, relinked = self.plan_merge(cluster)
+        return bool(relinked) or self.need_new_secondary(primary_contact, cluster, email, phone_number)
+    
+    def lock_for_write(self, emails: List[str], phone_numbers: List[str], load, needs_write):
+        """Re-load clusters under per-key locks until the locks cover every cluster root seen
+
+        Lookup-only requests return their first read without locking. Writers lock
+        their emails, phone numbers and cluster roots, then re-read; if a concurrent
+        merge moved the cluster under a root they do not hold, they roll back and
+        retry, so locks are always taken in one sorted batch and cannot deadlock.
+        Each retry locks every root seen so far (see LockRetry). Returns the loaded
+        rows and the held locks (None when nothing is written); raises
+        LockContention if the roots still moved after MAX_LOCK_ATTEMPTS.
+        """
+        retry = LockRetry(self.key_locks, needs_write, MAX_LOCK_ATTEMPTS)
+        try:
+            rows = load()
+            while not retry.settled(rows):
+                if retry.locks is not None:
+                    db_session.rollback()
+                retry.next_attempt()
+                retry.locks = self.key_locks.acquire(db_session, emails, phone_numbers, retry.seen)
+                rows = load()
+        except BaseException:
+            retry.abandon()
+            raise
+        return rows, retry.locks
+    
+    def answer_lookup(self, email: Optional[str], phone_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Answer a request that changes nothing from the cache or the materialized tables; None otherwise"""
+        # Repeat lookups of an already linked email/phone pair are answered from the cache
+        if self.cache is not None:
+            with phase('cache'):
+                found = self.cache.get_stamped(email, phone_number)
+            if found is not None:
+                note_branch('cache_hit')
+                cached, self.cached_stamp = found
+                return cached
+            generation = self.cache.generation()
+        
+        # Pure lookups are answered from the materialized cluster tables with one indexed fetch
+        with phase('match'):
+            response, from_replica = self.lookup_consolidated(email, phone_number)
+        if response is not None:
+            note_branch('lookup')
+            if self.cache is not None and not from_replica:
+                self.cache.put(response, generation)
+        return response
+    
+    def lookup(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer the request if it is a pure lookup, or return None, holding no connection, when it must write
+        
+        Lets callers admit the read and the write of a request separately; pass
+        looked_up=True to identify_contact afterwards to skip the repeat lookup.
+        """
+        email, phone_number = self.extract_keys(request_data)
+        if not email and not phone_number:
+            raise ValueError('At least one of email or phoneNumber must be provided')
+        # Keys the filter has never seen cannot be a lookup
+        if self.known_keys is not None and self.known_keys.unseen(email, phone_number):
+            return None
+        try:
+            response = self.answer_lookup(email, phone_number)
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in lookup: {str(e)}")
+            db_session.rollback()
+            raise
+        if response is None:
+            # Return the connection to the pool while the request waits to write
+            db_session.rollback()
+        return response
+    
+    def identify_contact(self, request_data: Dict[str, Any], looked_up: bool = False) -> Dict[str, Any]:
+        """Main method to identify and consolidate contacts"""
+        email, phone_number = self.extract_keys(request_data)
         
         # Validate input
         if not email and not phone_number:
             raise ValueError('At least one of email or phoneNumber must be provided')
         
+        # Keys the filter has never seen cannot match: insert the new primary without looking first.
+        # Group commit batches its own inserts, so it keeps the full path
+        if self.known_keys is not None and self.group_commit is None and self.known_keys.unseen(email, phone_number):
+            response = self.insert_unseen(email, phone_number)
+            if response is not None:
+                note_branch('new_primary')
+                return response
+        
+        locks = None
         try:
-            # Find all matching contacts
-            matching_contacts = self.find_matching_contacts(email, phone_number)
+            # Pure lookups are answered from the cache or the materialized cluster tables
+            if not looked_up:
+                response = self.answer_lookup(email, phone_number)
+                if response is not None:
+                    return response
+            if self.cache is not None:
+                generation = self.cache.generation()
+            
+            # Otherwise load the whole cluster (matches, their roots and all descendants) in one
+            # query, locking its keys first if the request is going to write
+            with phase('match'):
+                cluster = self.read_replica(email, phone_number)
+                from_replica = cluster is not None
+                if not from_replica:
+                    cluster, locks = self.lock_for_write(
+                        [email], [phone_number],
+                        lambda: self.resolve_cluster(email, phone_number),
+                        lambda rows: self.needs_write(rows, email, phone_number)
+                    )
             
             # Case 1: No matching contacts found, create a new primary contact
-            if len(matching_contacts) == 0:
-                new_contact = self.create_primary_contact(email, phone_number)
-                return self.format_response(new_contact)
-            
-            # Separate primary and secondary contacts
-            primary_contacts = [c for c in matching_contacts if c.linkPrecedence == 'primary']
-            secondary_contacts = [c for c in matching_contacts if c.linkPrecedence == 'secondary']
-            
-            # Case 2: Only secondary contacts found
-            if len(primary_contacts) == 0:
-                # Get the primary contact for the first secondary
-                primary_id = secondary_contacts[0].linkedId
-                primary_contact = self.get_contact_by_id(primary_id)
-                
-                # Check if we need to create a new secondary contact
-                if self.need_new_secondary(primary_contact, matching_contacts, email, phone_number):
-                    self.create_secondary_contact(primary_id, email, phone_number)
-                
-                return self.get_consolidated_contact(primary_contact)
-            
-            # Case 3: One primary contact found
-            if len(primary_contacts) == 1:
-                primary_contact = primary_contacts[0]
-                
-                # Check if we need to create a new secondary contact
-                if self.need_new_secondary(primary_contact, matching_contacts, email, phone_number):
-                    self.create_secondary_contact(primary_contact.id, email, phone_number)
-                
-                return self.get_consolidated_contact(primary_contact)
-            
-            # Case 4: Multiple primary contacts found - we need to consolidate them
-            # Sort by creation date (oldest first)
-            primary_contacts.sort(key=lambda x: x.createdAt)
-            oldest_primary = primary_contacts[0]
-            other_primaries = primary_contacts[1:]
-            
-            # Convert other primaries to secondary linked to the oldest primary
-            for contact in other_primaries:
-                self.convert_to_secondary(contact, oldest_primary.id)
-            
-            # Check if we need to create a new secondary with the given email/phone
-            all_secondaries = self.get_all_secondaries(oldest_primary.id)
-            all_contacts = [oldest_primary] + all_secondaries
-            
-            if self.need_new_secondary(oldest_primary, all_contacts, email, phone_number):
-                self.create_secondary_contact(oldest_primary.id, email, phone_number)
-            
-            return self.get_consolidated_contact(oldest_primary)
+            if not cluster:
+                note_branch('new_primary')
+                if self.group_commit is not None:
+                    with phase('write'):
+                        response = self.insert_grouped(locks, email, phone_number)
+                    self.note_written([email], [phone_number], [response['contact']['primaryContatctId']])
+                    return response
+                with phase('write'):
+                    new_contact = self.add_contact(email, phone_number)
+                with phase('consolidate'):
+                    response = self.format_response(new_contact)
+                    self.store_consolidated(db_session, response, (), [email], [phone_number], [new_contact.id])
+                with phase('commit'):
+                    db_session.commit()
+                self.note_written([email], [phone_number], [new_contact.id])
+                return response
+            
+            # Cases 2-4: the oldest primary of the cluster wins, every other primary is demoted
+            with phase('resolve_primary'):
+                primary_contact, relinked = self.plan_merge(cluster)
+                roots = {c.id for c in cluster if c.linkedId is None}
+            
+            # Re-point demoted primaries and everything beneath them in one set-based statement
+            if relinked:
+                with phase('merge'):
+                    db_session.execute(relink_statement(roots, primary_contact.id))
+            
+            secondaries = [c for c in cluster if c is not primary_contact]
+            
+            # Check if we need to create a new secondary contact
+            created = self.need_new_secondary(primary_contact, cluster, email, phone_number)
+            note_branch('merge' if relinked else 'new_secondary' if created else 'lookup')
+            if created and not relinked and self.group_commit is not None:
+                with phase('write'):
+                    response = self.insert_grouped(locks, email, phone_number, primary_contact, secondaries)
+                self.invalidate_clusters(*roots)
+                self.note_written([email], [phone_number], roots)
+                return response
+            if created:
+                with phase('write'):
+                    secondaries.append(self.add_contact(email, phone_number, primary_contact.id))
+            
+            # Build the response before committing so no expired attribute is reloaded
+            with phase('consolidate'):
+                response = self.build_consolidated(primary_contact, secondaries)
+                if relinked or created:
+                    self.store_consolidated(db_session, response, roots - {primary_contact.id},
+                                            [email], [phone_number], [secondaries[-1].id] if created else [])
+            if relinked or created:
+                with phase('commit'):
+                    db_session.commit()
+                self.invalidate_clusters(*roots)
+                self.note_written([email], [phone_number], roots)
+            elif self.cache is not None and not from_replica:
+                # A lagging replica's answer is not cached, so it cannot outlive the lag
+                self.cache.put(response, generation)
+            return response
             
         except SQLAlchemyError as e:
             logger.error(f"Database error in identify_contact: {str(e)}")
             db_session.rollback()
             raise
+        except LockContention:
+            raise
         except Exception as e:
             logger.error(f"Unexpected error in identify_contact: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+        finally:
+            if locks is not None:
+                locks.release()
+    
+    def plan_batch(self, existing: List[ContactRow], keys: List[Tuple[Optional[str], Optional[str]]]):
+        """Replay batch records in memory over the loaded clusters, as sequential identify calls would
+
+        Returns the union-find forest, the contacts to create (in creation order),
+        the (primary, secondaries) snapshot answering each record and the stored
+        contacts whose linkage changes as (contact, linkedId, linkPrecedence).
+        """
+        forest = UnionFind()
+        members = {}
+        known_emails = {}
+        known_phones = {}
+        by_email = defaultdict(list)
+        by_phone = defaultdict(list)
+        
+        def add_node(node):
+            email_key = normalize_email(node.email)
+            phone_key = normalize_phone(node.phoneNumber)
+            forest.add(node)
+            members[node] = [node]
+            known_emails[node] = {email_key}
+            known_phones[node] = {phone_key}
+            if email_key:
+                by_email[email_key].append(node)
+            if phone_key:
+                by_phone[phone_key].append(node)
+        
+        def merge(winner, loser):
+            forest.union(winner, loser)
+            members[winner].extend(members.pop(loser))
+            known_emails[winner] |= known_emails.pop(loser)
+            known_phones[winner] |= known_phones.pop(loser)
+        
+        # Rebuild the stored clusters, rooted at their primaries
+        by_id = {c.id: c for c in existing}
+        for contact in existing:
+            add_node(contact)
+        for contact in existing:
+            parent = by_id.get(contact.linkedId)
+            if parent is not None:
+                merge(forest.find(parent), forest.find(contact))
+        
+        # Replay every record exactly as identify_contact would
+        pending = []
+        snapshots = []
+        for email, phone_number in keys:
+            email_key = normalize_email(email)
+            phone_key = normalize_phone(phone_number)
+            matches = (by_email.get(email_key, []) if email_key else []) + \
+                      (by_phone.get(phone_key, []) if phone_key else [])
+            
+            if not matches:
+                node = PendingContact(len(pending), email, phone_number)
+                pending.append(node)
+                add_node(node)
+                snapshots.append((node, []))
+                continue
+            
+            roots = {forest.find(m) for m in matches}
+            primary = min(roots, key=_age_key)
+            for root in roots:
+                if root is not primary:
+                    merge(primary, root)
+            
+            if (email_key and email_key not in known_emails[primary]) or \
+                    (phone_key and phone_key not in known_phones[primary]):
+                node = PendingContact(len(pending), email, phone_number)
+                pending.append(node)
+                add_node(node)
+                merge(primary, node)
+            
+            secondaries = sorted((m for m in members[primary] if m is not primary), key=_id_key)
+            snapshots.append((primary, secondaries))
+        
+        relinks = []
+        for contact in existing:
+            root = forest.find(contact)
+            linked_id, precedence = (None, 'primary') if root is contact else (root.id, 'secondary')
+            if (contact.linkedId, contact.linkPrecedence) != (linked_id, precedence):
+                relinks.append((contact, linked_id, precedence))
+        
+        return forest, pending, snapshots, relinks
+    
+    def store_batch_clusters(self, existing, keys, forest, pending, snapshots, relinks) -> None:
+        """Refresh the materialized rows of every cluster a batch changed, once per final cluster"""
+        changed = {forest.find(node) for node in pending}
+        changed |= {forest.find(contact) for contact, _, _ in relinks}
+        members = defaultdict(list)
+        for node in chain(existing, pending):
+            root = forest.find(node)
+            if root in changed and node is not root:
+                members[root].append(node)
+        
+        cluster_keys_of = defaultdict(list)
+        for (email, phone_number), (primary, _) in zip(keys, snapshots):
+            root = forest.find(primary)
+            if root in changed:
+                cluster_keys_of[root].append((email, phone_number))
+        demoted = defaultdict(list)
+        for contact, linked_id, _ in relinks:
+            if contact.linkedId is None:
+                demoted[forest.find(contact)].append(contact.id)
+        
+        added = defaultdict(list)
+        for node in pending:
+            added[forest.find(node)].append(node.id)
+        
+        for root in changed:
+            response = self.build_consolidated(root, sorted(members[root], key=lambda c: c.id))
+            written = cluster_keys_of[root]
+            self.store_consolidated(db_session, response, demoted[root],
+                                    [e for e, _ in written], [p for _, p in written], added[root])
+    
+    def identify_batch(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Identify many contacts at once, returning what sequential identify_contact calls would
+
+        Every cluster touched by the batch is loaded with one query and the records
+        are replayed in memory over a union-find forest. New contacts are then written
+        with one multi-row INSERT and every relink with one executemany UPDATE, all in
+        a single transaction.
+        """
+        keys = []
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise RequestError(f'Record {index} must be an object')
+            try:
+                validate_identify(record)
+            except RequestError as e:
+                raise RequestError(f'Record {index}: {e}')
+            keys.append(self.extract_keys(record))
+        emails = {e for e, _ in keys if e}
+        phone_numbers = {p for _, p in keys if p}
+        
+        locks = None
+        try:
+            def writes(existing):
+                _, pending, _, relinks = self.plan_batch(existing, keys)
+                return bool(pending or relinks)
+            
+            existing, locks = self.lock_for_write(
+                list(emails), list(phone_numbers),
+                lambda: self.resolve_clusters(emails, phone_numbers),
+                writes
+            )
+            original_roots = {c.id for c in existing if c.linkedId is None}
+            forest, pending, snapshots, relinks = self.plan_batch(existing, keys)
+            
+            # Insert new contacts in creation order; links to other new contacts are fixed up below
+            if pending:
+                rows = []
+                for node in pending:
+                    root = forest.find(node)
+                    rows.append({
+                        'email': node.email,
+                        'phoneNumber': node.phoneNumber,
+                        'linkedId': None if isinstance(root, PendingContact) else root.id,
+                        'linkPrecedence': 'primary' if root is node else 'secondary'
+                    })
+                new_ids = db_session.execute(
+                    insert(Contact).returning(Contact.id, sort_by_parameter_order=True),
+                    rows
+                ).scalars().all()
+                for node, new_id in zip(pending, new_ids):
+                    node.id = new_id
+            
+            updates = [
+                {'id': contact.id, 'linkedId': linked_id, 'linkPrecedence': precedence}
+                for contact, linked_id, precedence in relinks
+            ]
+            for node in pending:
+                root = forest.find(node)
+                if isinstance(root, PendingContact) and root is not node:
+                    updates.append({'id': node.id, 'linkedId': root.id, 'linkPrecedence': 'secondary'})
+            if updates:
+                db_session.execute(update(Contact), updates)
+            
+            # Build every response before committing so no expired attribute is reloaded
+            responses = [self.build_consolidated(primary, secondaries) for primary, secondaries in snapshots]
+            if pending or updates:
+                self.store_batch_clusters(existing, keys, forest, pending, snapshots, relinks)
+                db_session.commit()
+                self.invalidate_clusters(*original_roots)
+                self.note_written(emails, phone_numbers, original_roots)
+            return responses
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in identify_batch: {str(e)}")
+            db_session.rollback()
+            raise
+        finally:
+            if locks is not None:
+                locks.release()
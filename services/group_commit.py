@@ -0,0 +1,114 @@
+from typing import Any, Callable, Dict, List, Optional
+import threading
+
+from sqlalchemy import insert
+
+from config import GROUP_COMMIT_MAX_ROWS, GROUP_COMMIT_WINDOW_MS
+from database import engine
+from models import Contact
+from services.metrics import GROUP_COMMIT_ROWS
+
+
+class _Batch:
+    __slots__ = ('rows', 'follow_ups', 'ids', 'error', 'full', 'done')
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.follow_ups: List[Optional[Callable]] = []
+        self.ids: List[int] = []
+        self.error: Optional[BaseException] = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """Coalesces single-contact inserts from concurrent requests into one transaction
+
+    The first caller to arrive opens a batch and, as its leader, waits up to
+    `window` seconds (or until `max_rows` rows have joined) before writing every
+    row with one multi-row INSERT ... RETURNING and a single commit. Each caller
+    blocks until that commit and gets back the id of its own row. A caller's
+    follow_up(conn, id) runs in the same transaction right after the INSERT. If
+    the batch fails, every caller in it gets the error.
+
+    A leader that passes its `session` writes the batch on the connection that
+    session already holds and commits it, rather than checking out another one:
+    every waiting caller may be holding a pooled connection (and its advisory
+    locks) open, so with the pool full a second checkout would only time out.
+    """
+
+    def __init__(self, bind, window: float, max_rows: int):
+        self.bind = bind
+        self.window = window
+        self.max_rows = max(max_rows, 1)
+        self._lock = threading.Lock()
+        self._batch: Optional[_Batch] = None
+        self.batches = 0
+        self.rows = 0
+
+    def insert(self, row: Dict[str, Any], follow_up: Optional[Callable] = None, session=None) -> int:
+        """Queue one contact row and return its id once its batch has committed
+
+        If this caller leads the batch, the batch commits `session`'s transaction.
+        """
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            index = len(batch.rows)
+            batch.rows.append(row)
+            batch.follow_ups.append(follow_up)
+            if len(batch.rows) >= self.max_rows:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._flush(batch, session)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.ids[index]
+
+    def _write(self, conn, batch: _Batch) -> None:
+        batch.ids = conn.execute(
+            insert(Contact).returning(Contact.id, sort_by_parameter_order=True),
+            batch.rows
+        ).scalars().all()
+        for follow_up, contact_id in zip(batch.follow_ups, batch.ids):
+            if follow_up is not None:
+                follow_up(conn, contact_id)
+
+    def _flush(self, batch: _Batch, session=None) -> None:
+        try:
+            if session is None:
+                with self.bind.begin() as conn:
+                    self._write(conn, batch)
+            else:
+                try:
+                    self._write(session.connection(), batch)
+                    session.commit()
+                except BaseException:
+                    session.rollback()
+                    raise
+            with self._lock:
+                self.batches += 1
+                self.rows += len(batch.rows)
+            GROUP_COMMIT_ROWS.observe(len(batch.rows))
+        except BaseException as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
+# Shared by every ContactService in the process; None unless GROUP_COMMIT_WINDOW_MS is set
+group_committer = (
+    GroupCommitter(engine, GROUP_COMMIT_WINDOW_MS / 1000, GROUP_COMMIT_MAX_ROWS)
+    if GROUP_COMMIT_WINDOW_MS > 0 else None
+)
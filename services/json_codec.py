@@ -0,0 +1,140 @@
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
+import json
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    # Optional: pip install orjson for faster request parsing and response encoding
+    orjson = None
+
+from config import CLUSTER_CACHE_TTL, FAST_JSON_ENABLED, RESPONSE_BODY_CACHE_SIZE
+
+
+class JSONCodec:
+    """Encodes and decodes API bodies with orjson, or the standard library when `fast` is off
+
+    Both produce jsonify's layout: compact separators and sorted keys. orjson
+    writes non-ASCII characters as UTF-8 rather than \\u escapes, which decodes to
+    the same values. Objects orjson cannot encode, such as non-string keys or
+    integers beyond 64 bits, fall back to the standard library.
+    """
+
+    def __init__(self, fast: bool):
+        self.fast = fast and orjson is not None
+        self.name = 'orjson' if self.fast else 'json'
+
+    def dumps(self, obj: Any, default: Optional[Callable[[Any], Any]] = None, newline: bool = False) -> bytes:
+        if self.fast:
+            option = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if newline:
+                option |= orjson.OPT_APPEND_NEWLINE
+            try:
+                return orjson.dumps(obj, default=default, option=option)
+            except orjson.JSONEncodeError:
+                pass
+        text = json.dumps(obj, default=default, sort_keys=True, separators=(',', ':'))
+        return (text + '\n' if newline else text).encode()
+
+    def loads(self, data: Any) -> Any:
+        """Decode str or bytes; raises ValueError on malformed input"""
+        return orjson.loads(data) if self.fast else json.loads(data)
+
+
+class RequestError(ValueError):
+    """An /identify body that does not match the request schema"""
+
+
+def parse_identify(body: bytes, json_codec: Optional['JSONCodec'] = None) -> Dict[str, Any]:
+    """Decode and validate an /identify body in one pass over the raw bytes
+
+    Returns the decoded object itself, with an integer phoneNumber turned into
+    its string, instead of copying the fields out. Raises RequestError with the
+    message for the 400 response.
+    """
+    try:
+        request_data = (json_codec or codec).loads(body) if body else None
+    except ValueError:
+        raise RequestError('Request body must be valid JSON')
+    if not request_data or not isinstance(request_data, dict):
+        raise RequestError('Request body is required')
+    return validate_identify(request_data)
+
+
+def parse_batch(body: bytes, json_codec: Optional['JSONCodec'] = None) -> List[Any]:
+    """Decode an /identify/batch body; its records are checked by ContactService.identify_batch
+
+    Raises RequestError with the message for the 400 response.
+    """
+    try:
+        request_data = (json_codec or codec).loads(body) if body else None
+    except ValueError:
+        raise RequestError('Request body must be valid JSON')
+    if not isinstance(request_data, list) or not request_data:
+        raise RequestError('Request body must be a non-empty array of contacts')
+    return request_data
+
+
+def validate_identify(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Check the email and phoneNumber of one decoded /identify object, as parse_identify and each batch record do
+
+    Turns an integer phoneNumber into its string in place and returns the object;
+    other numbers, such as 12.5, are rejected.
+    """
+    email = request_data.get('email')
+    phone_number = request_data.get('phoneNumber')
+    if email is not None and not isinstance(email, str):
+        raise RequestError('email must be a string')
+    if isinstance(phone_number, int) and not isinstance(phone_number, bool):
+        phone_number = request_data['phoneNumber'] = str(phone_number)
+    elif phone_number is not None and not isinstance(phone_number, str):
+        raise RequestError('phoneNumber must be a string or an integer')
+    if not email and not phone_number:
+        raise RequestError('At least one of email or phoneNumber must be provided')
+    return request_data
+
+
+class ResponseBodies:
+    """Per-process LRU of encoded /identify bodies for clusters served from the cluster cache
+
+    Keyed by the stamp the cluster cache writes into each entry. A stamp is new on
+    every put(), so it only ever names one response: a changed cluster is cached
+    under a new stamp and its old body is never looked up again. Entries expire
+    after `ttl`, like the cache entries they were encoded from.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # stamp -> (expires_at, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if key is None or self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Optional[str], body: bytes) -> None:
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared by the Flask JSON provider, the /identify routes and the ASGI app
+codec = JSONCodec(FAST_JSON_ENABLED)
+response_bodies = ResponseBodies(RESPONSE_BODY_CACHE_SIZE, CLUSTER_CACHE_TTL)
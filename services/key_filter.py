@@ -0,0 +1,200 @@
+from typing import Iterable, Optional
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+from sqlalchemy import select
+
+from config import (KEY_FILTER_CAPACITY, KEY_FILTER_ENABLED, KEY_FILTER_ERROR_RATE,
+                    KEY_FILTER_REFRESH_SECONDS, KEY_FILTER_SNAPSHOT)
+from models import Contact
+from services.normalize import normalize_email, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout: magic, format version, hash count, bit count, items added, highest contact id seen
+SNAPSHOT_HEADER = struct.Struct('>4sBIQQQ')
+SNAPSHOT_MAGIC = b'KFLT'
+SNAPSHOT_VERSION = 1
+
+# Contact ids are handed out before commit, so catch-up re-reads this many ids behind the
+# highest one seen to pick up transactions that committed out of order
+CATCH_UP_OVERLAP = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of one blake2b digest"""
+
+    def __init__(self, bits: int, hashes: int, data: Optional[bytearray] = None, count: int = 0):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = data if data is not None else bytearray((bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> 'BloomFilter':
+        """Size a filter to hold `capacity` items at a false-positive rate of `error_rate`"""
+        bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        return cls(bits, max(round(bits / capacity * math.log(2)), 1))
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        """Set the item's bits; `count` only grows for items that were not already present"""
+        new = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.data[position >> 3] & mask:
+                self.data[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def filter_items(emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]]):
+    """The normalized keys of the emails and phone numbers, as filter items"""
+    items = [f"email:{key}" for key in map(normalize_email, emails) if key]
+    items += [f"phone:{key}" for key in map(normalize_phone, phone_numbers) if key]
+    return items
+
+
+class KeyFilter:
+    """Remembers every normalized email and phone number the contact table holds, approximately
+
+    A negative answer is certain for what the filter has seen: this worker's own
+    writes, the table at startup and rows caught up on every `refresh` seconds.
+    Writes by other workers since the last catch-up are not seen, so callers must
+    still guard their insert against an existing match. Until the first load
+    finishes every key reads as seen. The state is written to `snapshot` after each
+    catch-up, and a starting worker loads it and only reads the rows added since.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, snapshot: Optional[str] = None, refresh: float = 60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.snapshot = snapshot
+        self.refresh = refresh
+        self.bloom = BloomFilter.for_capacity(capacity, error_rate)
+        self.last_id = 0
+        self.ready = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def unseen(self, email: Optional[str], phone_number: Optional[str]) -> bool:
+        """True if every key given is certainly missing from what the filter has seen"""
+        items = filter_items([email], [phone_number])
+        return self.ready and bool(items) and not any(item in self.bloom for item in items)
+
+    def add(self, emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]]) -> None:
+        items = filter_items(emails, phone_numbers)
+        with self._lock:
+            for item in items:
+                self.bloom.add(item)
+
+    def catch_up(self, bind) -> int:
+        """Add the keys of live contacts created since the last catch-up; returns the rows read"""
+        rows = 0
+        with bind.connect() as conn:
+            result = conn.execution_options(yield_per=10000).execute(
+                select(Contact.id, Contact.emailKey, Contact.phoneKey)
+                .where(Contact.id > max(self.last_id - CATCH_UP_OVERLAP, 0), Contact.deletedAt.is_(None))
+                .order_by(Contact.id)
+            )
+            # Small batches keep request threads adding their own writes from waiting on the lock
+            for batch in result.partitions(1000):
+                with self._lock:
+                    for row in batch:
+                        if row.emailKey:
+                            self.bloom.add(f"email:{row.emailKey}")
+                        if row.phoneKey:
+                            self.bloom.add(f"phone:{row.phoneKey}")
+                    self.last_id = max(self.last_id, batch[-1].id)
+                rows += len(batch)
+        return rows
+
+    def save(self, path: str) -> None:
+        """Write the filter to `path` atomically, so workers sharing the path never read a partial file"""
+        with self._lock:
+            header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.bloom.hashes,
+                                          self.bloom.bits, self.bloom.count, self.last_id)
+            data = bytes(self.bloom.data)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(header)
+            f.write(data)
+        os.replace(temporary, path)
+
+    def load(self, path: str) -> bool:
+        """Replace the filter with the snapshot at `path` if it exists and matches the configured size"""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(SNAPSHOT_HEADER.size)
+                magic, version, hashes, bits, count, last_id = SNAPSHOT_HEADER.unpack(header)
+                data = bytearray(f.read())
+        except (OSError, struct.error):
+            return False
+        expected = BloomFilter.for_capacity(self.capacity, self.error_rate)
+        if (magic, version, hashes, bits) != (SNAPSHOT_MAGIC, SNAPSHOT_VERSION, expected.hashes, expected.bits) \
+                or len(data) != len(expected.data):
+            logger.warning(f"Ignoring key filter snapshot {path}: written with other settings")
+            return False
+        with self._lock:
+            self.bloom = BloomFilter(bits, hashes, data, count)
+            self.last_id = last_id
+        return True
+
+    def warm(self, bind) -> None:
+        """Load the snapshot, or read the whole table, then catch up; marks the filter ready"""
+        started = time.perf_counter()
+        loaded = self.snapshot is not None and self.load(self.snapshot)
+        rows = self.catch_up(bind)
+        self.ready = True
+        if self.snapshot is not None:
+            self.save(self.snapshot)
+        if self.bloom.count > self.capacity:
+            logger.warning(f"Key filter holds {self.bloom.count} keys, over its capacity of {self.capacity}; "
+                           "raise KEY_FILTER_CAPACITY to keep its false-positive rate")
+        logger.info(f"Key filter ready in {time.perf_counter() - started:.2f}s "
+                    f"({'snapshot + ' if loaded else ''}{rows} rows read)")
+
+    def start(self, bind) -> threading.Thread:
+        """Warm the filter, then catch up and snapshot every `refresh` seconds, on a daemon thread"""
+        def run():
+            try:
+                self.warm(bind)
+            except Exception as e:
+                logger.error(f"Key filter failed to load: {str(e)}")
+                if not self.ready:
+                    # New contacts keep taking the full path
+                    return
+            while True:
+                time.sleep(self.refresh)
+                try:
+                    self.catch_up(bind)
+                    if self.snapshot is not None:
+                        self.save(self.snapshot)
+                except Exception as e:
+                    logger.warning(f"Key filter refresh failed: {str(e)}")
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=run, name='key-filter', daemon=True)
+            self._thread.start()
+        return self._thread
+
+
+# Shared by every ContactService in the process; None unless KEY_FILTER_ENABLED is set
+key_filter = (
+    KeyFilter(KEY_FILTER_CAPACITY, KEY_FILTER_ERROR_RATE, KEY_FILTER_SNAPSHOT, KEY_FILTER_REFRESH_SECONDS)
+    if KEY_FILTER_ENABLED else None
+)
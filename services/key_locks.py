@@ -0,0 +1,185 @@
+from typing import Any, Callable, Iterable, List, Optional, Set
+import asyncio
+import hashlib
+import threading
+
+from sqlalchemy import func, select
+
+from services.normalize import normalize_email, normalize_phone
+
+
+class LockContention(Exception):
+    """Raised when a writer's clusters kept moving under new roots on every attempt to lock them
+
+    The request changed nothing and can be retried; the routes answer 503 with Retry-After.
+    """
+
+
+def lock_id(kind: str, value: Any) -> int:
+    """Hash an email, phone number or cluster root into a signed 64-bit advisory lock key"""
+    digest = hashlib.blake2b(f"{kind}:{value}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def lock_ids(emails: Iterable[str], phone_numbers: Iterable[str], roots: Iterable[int]) -> Set[int]:
+    ids = {lock_id('email', normalize_email(e)) for e in emails if e}
+    ids |= {lock_id('phone', normalize_phone(p)) for p in phone_numbers if p}
+    ids |= {lock_id('root', r) for r in roots}
+    return ids
+
+
+def advisory_lock_statement(ids: Set[int]):
+    """One SELECT taking every transaction-scoped advisory lock, in ascending key order"""
+    return select(*(func.pg_advisory_xact_lock(i) for i in sorted(ids)))
+
+
+class LocalLockTable:
+    """In-process lock per key for databases without advisory locks
+
+    Locks are created on first use and dropped when no thread holds or waits on
+    them, so the table only ever contains keys that are in flight.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._locks = {}  # key -> [lock, users]
+
+    def acquire(self, ids: Set[int]) -> None:
+        for key in sorted(ids):
+            with self._mutex:
+                entry = self._locks.setdefault(key, [threading.Lock(), 0])
+                entry[1] += 1
+            entry[0].acquire()
+
+    def release(self, ids: Set[int]) -> None:
+        for key in ids:
+            with self._mutex:
+                entry = self._locks[key]
+                entry[0].release()
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class AsyncLocalLockTable:
+    """asyncio counterpart of LocalLockTable for the ASGI serving mode"""
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, users]
+
+    async def acquire(self, ids: Set[int]) -> None:
+        for key in sorted(ids):
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            await entry[0].acquire()
+
+    def release(self, ids: Set[int]) -> None:
+        for key in ids:
+            entry = self._locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+class HeldLocks:
+    """Locks taken for one identify transaction
+
+    Advisory locks end with the transaction; local locks must be released by the
+    caller once it has committed or rolled back.
+    """
+
+    def __init__(self, table: Optional[Any], ids: Set[int], roots: Set[int]):
+        self.table = table
+        self.ids = ids
+        self.roots = roots
+        # Advisory locks only protect writes made in the transaction that took them
+        self.transactional = table is None
+
+    def covers(self, roots: Set[int]) -> bool:
+        """True if a cluster re-read under these locks has no root they do not protect"""
+        return roots <= self.roots
+
+    def release(self) -> None:
+        if self.table is not None:
+            self.table.release(self.ids)
+            self.table = None
+
+
+class KeyLocks:
+    """Serializes identify transactions whose emails, phone numbers or clusters collide
+
+    Requests on unrelated keys never wait on each other. On PostgreSQL every key is a
+    pg_advisory_xact_lock taken in one statement; elsewhere an in-process lock table
+    stands in, which serializes threads of one worker only.
+    """
+
+    def __init__(self):
+        self.local = LocalLockTable()
+        self.async_local = AsyncLocalLockTable()
+        self.retries = 0
+
+    def acquire(self, session, emails: Iterable[str], phone_numbers: Iterable[str], roots: Set[int]) -> HeldLocks:
+        ids = lock_ids(emails, phone_numbers, roots)
+        if session.get_bind().dialect.name == 'postgresql':
+            session.execute(advisory_lock_statement(ids))
+            return HeldLocks(None, ids, set(roots))
+        self.local.acquire(ids)
+        return HeldLocks(self.local, ids, set(roots))
+
+    async def acquire_async(self, session, emails: Iterable[str], phone_numbers: Iterable[str],
+                            roots: Set[int]) -> HeldLocks:
+        ids = lock_ids(emails, phone_numbers, roots)
+        if session.bind.dialect.name == 'postgresql':
+            await session.execute(advisory_lock_statement(ids))
+            return HeldLocks(None, ids, set(roots))
+        await self.async_local.acquire(ids)
+        return HeldLocks(self.async_local, ids, set(roots))
+
+
+class LockRetry:
+    """Retry policy of lock_for_write, shared by the sync and async services
+
+    The caller loads its rows and asks settled(rows). Once that is True the rows
+    stand: `locks` covers every cluster root in them, or is None when they need
+    no write. Otherwise the caller ends its transaction and calls next_attempt(),
+    which drops the held locks and raises LockContention when no attempt is left,
+    then locks `seen` into `locks` and loads again. `seen` holds every root read
+    so far, so it only grows and the loop converges.
+    """
+
+    def __init__(self, key_locks: 'KeyLocks', needs_write: Callable[[List[Any]], bool], attempts: int):
+        self.key_locks = key_locks
+        self.needs_write = needs_write
+        self.attempts_left = attempts
+        self.locks: Optional[HeldLocks] = None
+        self.seen: Set[int] = set()
+
+    def settled(self, rows: List[Any]) -> bool:
+        roots = {c.id for c in rows if c.linkedId is None}
+        if self.locks.covers(roots) if self.locks is not None else not self.needs_write(rows):
+            return True
+        self.seen |= roots
+        return False
+
+    def next_attempt(self) -> None:
+        if self.locks is not None:
+            self.locks.release()
+            self.locks = None
+            self.key_locks.retries += 1
+        if self.attempts_left <= 0:
+            raise LockContention('Clusters kept changing while waiting for their locks')
+        self.attempts_left -= 1
+
+    def abandon(self) -> None:
+        """Drop the held locks when loading under them failed"""
+        if self.locks is not None:
+            self.locks.release()
+            self.locks = None
+
+
+# Process-wide lock layer shared by every ContactService instance
+key_locks = KeyLocks()
@@ -0,0 +1,295 @@
+"""Request, database and identify-phase metrics exported in the Prometheus text format
+
+Metrics live in process memory, so with several gunicorn or uvicorn workers each
+worker reports its own; scrape every worker or run one worker per target.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values: Dict[Tuple, list] = {}  # labels -> [bucket counts, sum]
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time from callbacks registered per label set"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._callbacks: Dict[Tuple, Callable[[], float]] = {}
+
+    def set_function(self, fn: Callable[[], float], **labels: Any) -> None:
+        with self._lock:
+            self._callbacks[self._key(labels)] = fn
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            callbacks = sorted(self._callbacks.items())
+        for key, fn in callbacks:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(fn())}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_REQUESTS = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status')))
+REQUEST_STATEMENTS = registry.register(Histogram(
+    'http_request_db_statements', 'SQL statements executed per HTTP request', ('route',), COUNT_BUCKETS))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    'http_request_db_seconds', 'Time spent executing SQL per HTTP request', ('route',)))
+REQUEST_COMMITS = registry.register(Histogram(
+    'http_request_db_commits', 'Transactions committed per HTTP request', ('route',), COUNT_BUCKETS))
+IDENTIFY_SECONDS = registry.register(Histogram(
+    'identify_request_duration_seconds', 'Latency of /identify requests by the branch they took', ('branch',)))
+IDENTIFY_PHASES = registry.register(Histogram(
+    'identify_phase_duration_seconds', 'Time spent in each ContactService phase', ('phase',)))
+DB_STATEMENTS = registry.register(Histogram(
+    'db_statement_duration_seconds', 'Latency of individual SQL statements', ('engine',)))
+DB_COMMITS = registry.register(Counter(
+    'db_commits_total', 'Transactions committed', ('engine',)))
+DB_ROLLBACKS = registry.register(Counter(
+    'db_rollbacks_total', 'Transactions rolled back', ('engine',)))
+GROUP_COMMIT_ROWS = registry.register(Histogram(
+    'group_commit_batch_rows', 'Contacts written per group-commit transaction', (), COUNT_BUCKETS))
+BOOT_PHASES = registry.register(CallbackGauge(
+    'app_boot_phase_seconds', 'Time this worker spent in each startup phase (total since the entry point was imported)',
+    ('phase',)))
+ADMISSION_QUEUE_DEPTH = registry.register(CallbackGauge(
+    'admission_queue_depth', 'Requests waiting for an admission slot'))
+ADMISSION_IN_FLIGHT = registry.register(CallbackGauge(
+    'admission_in_flight', 'Requests holding an admission slot'))
+ADMISSION_WAIT = registry.register(Histogram(
+    'admission_wait_seconds', 'Time admitted requests waited for a slot', ('priority',)))
+ADMISSION_SHED = registry.register(Counter(
+    'admission_shed_total', 'Requests turned away with 503 (queue_full, deadline, timeout, displaced)',
+    ('priority', 'reason')))
+POOL_WAIT = registry.register(Histogram(
+    'db_pool_wait_seconds', 'Time spent checking a connection out of the pool, including opening new ones', ('engine',)))
+POOL_SIZE = registry.register(CallbackGauge(
+    'db_pool_size', 'Configured number of pooled connections', ('engine',)))
+POOL_CHECKED_OUT = registry.register(CallbackGauge(
+    'db_pool_checked_out', 'Connections currently checked out of the pool', ('engine',)))
+POOL_OVERFLOW = registry.register(CallbackGauge(
+    'db_pool_overflow', 'Connections open beyond pool_size (negative while the pool is filling)', ('engine',)))
+
+
+class RequestStats:
+    """Counters for the request running in the current thread or task"""
+    __slots__ = ('statements', 'db_seconds', 'commits', 'branch')
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.commits = 0
+        self.branch = None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def start_request():
+    """Begin collecting statements and timings for a request; returns a token for finish_request"""
+    return _current.set(RequestStats())
+
+
+def finish_request(token, method: str, route: str, status: int, seconds: float) -> None:
+    stats = _current.get()
+    _current.reset(token)
+    HTTP_REQUESTS.observe(seconds, method=method, route=route, status=status)
+    if stats is None:
+        return
+    REQUEST_STATEMENTS.observe(stats.statements, route=route)
+    REQUEST_DB_SECONDS.observe(stats.db_seconds, route=route)
+    REQUEST_COMMITS.observe(stats.commits, route=route)
+    if stats.branch is not None:
+        IDENTIFY_SECONDS.observe(seconds, branch=stats.branch)
+
+
+def note_branch(branch: str) -> None:
+    """Record which identify_contact branch (cache_hit, new_primary, lookup, new_secondary, merge) served the request"""
+    stats = _current.get()
+    if stats is not None:
+        stats.branch = branch
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time one ContactService phase on the monotonic clock"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        IDENTIFY_PHASES.observe(time.perf_counter() - started, phase=name)
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Count statements, DB time and transactions on a (sync) Engine and export its pool state"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['statement_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('statement_started', time.perf_counter())
+        DB_STATEMENTS.observe(elapsed, engine=name)
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, 'commit')
+    def commit(conn):
+        DB_COMMITS.inc(engine=name)
+        stats = _current.get()
+        if stats is not None:
+            stats.commits += 1
+
+    @event.listens_for(engine, 'rollback')
+    def rollback(conn):
+        DB_ROLLBACKS.inc(engine=name)
+
+    if isinstance(engine.pool, QueuePool):
+        engine.pool.metrics_name = name
+        # Read through engine.pool, which dispose() replaces
+        POOL_SIZE.set_function(lambda: engine.pool.size(), engine=name)
+        POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout(), engine=name)
+        POOL_OVERFLOW.set_function(lambda: engine.pool.overflow(), engine=name)
+
+
+class _TimedGetMixin:
+    """Times how long checkouts block on an exhausted pool"""
+    metrics_name = 'default'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, engine=self.metrics_name)
+
+    def recreate(self):
+        # Keep the metrics label on pools rebuilt by engine.dispose()
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+class TimedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
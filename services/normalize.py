@@ -0,0 +1,24 @@
+from typing import Any, Optional
+import re
+
+# Kept in step with the backfill in migrations/001_normalized_keys.sql
+WHITESPACE = ' \t\r\n'
+NON_DIGITS = re.compile(r'[^0-9]')
+
+
+def normalize_email(email: Any) -> Optional[str]:
+    """Lookup key for an email: trimmed and lower-cased"""
+    if email is None:
+        return None
+    return str(email).strip(WHITESPACE).lower() or None
+
+
+def normalize_phone(phone_number: Any) -> Optional[str]:
+    """Lookup key for a phone number: its digits only, E.164 style without the leading +
+
+    Values without any digit keep their trimmed text, so they still only match themselves.
+    """
+    if phone_number is None:
+        return None
+    value = str(phone_number).strip(WHITESPACE)
+    return NON_DIGITS.sub('', value) or value or None
@@ -0,0 +1,72 @@
+from typing import Any, Dict, Iterable, Optional
+from collections import deque
+import threading
+import time
+
+from config import READ_YOUR_WRITES_SECONDS
+from database import replica_session
+from services.normalize import normalize_email, normalize_phone
+
+
+class ReadRouter:
+    """Routes lookup-only reads to a replica, except for keys and clusters written recently
+
+    Every committed write records its normalized emails and phone numbers and the
+    cluster roots it touched for `window` seconds. Reads naming one of those keys
+    skip the replica, and replica results containing one of those roots are thrown
+    away, so a client always reads its own writes even while the replica lags.
+    Writes are only remembered by the worker that made them; with several workers,
+    set the window at least as long as the replica lag and route a client's
+    requests to one worker when it must see its writes immediately.
+    """
+
+    def __init__(self, session, window: float):
+        self.session = session
+        self.window = window
+        self._lock = threading.Lock()
+        self._expiry: Dict[Any, float] = {}
+        self._order: deque = deque()  # (expiry, entry), oldest first
+
+    def _prune(self, now: float) -> None:
+        while self._order and self._order[0][0] <= now:
+            expiry, entry = self._order.popleft()
+            if self._expiry.get(entry) == expiry:
+                del self._expiry[entry]
+
+    def _seen(self, entries: Iterable[Any]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            return any(entry in self._expiry for entry in entries)
+
+    def note_write(self, emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]],
+                   roots: Iterable[int]) -> None:
+        """Send reads of these keys and clusters to the primary for the next `window` seconds"""
+        entries = [('email', key) for key in map(normalize_email, emails) if key]
+        entries += [('phone', key) for key in map(normalize_phone, phone_numbers) if key]
+        entries += [('root', root) for root in roots]
+        now = time.monotonic()
+        expiry = now + self.window
+        with self._lock:
+            self._prune(now)
+            for entry in entries:
+                self._expiry[entry] = expiry
+                self._order.append((expiry, entry))
+
+    def written_keys(self, emails: Iterable[Optional[str]], phone_numbers: Iterable[Optional[str]]) -> bool:
+        """True if any of the keys was written within the window"""
+        entries = [('email', key) for key in map(normalize_email, emails) if key]
+        entries += [('phone', key) for key in map(normalize_phone, phone_numbers) if key]
+        return self._seen(entries)
+
+    def written_roots(self, roots: Iterable[int]) -> bool:
+        """True if any of the clusters rooted at these ids was written within the window"""
+        return self._seen(('root', root) for root in roots)
+
+    def written_clusters(self, rows) -> bool:
+        """True if the loaded rows belong to a cluster written within the window"""
+        return self.written_roots(c.linkedId if c.linkedId is not None else c.id for c in rows)
+
+
+# Shared by every ContactService in the process; None unless DATABASE_REPLICA_URL is set
+read_router = ReadRouter(replica_session, READ_YOUR_WRITES_SECONDS) if replica_session is not None else None
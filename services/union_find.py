@@ -0,0 +1,39 @@
+from typing import Any, Dict, Hashable
+
+
+class UnionFind:
+    """Disjoint-set forest with path compression over arbitrary hashable items
+
+    union() always keeps the first argument's root as the representative, so the
+    caller decides which contact of two merging clusters stays primary.
+    """
+
+    def __init__(self):
+        self.parent: Dict[Hashable, Hashable] = {}
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.parent
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, item: Hashable) -> None:
+        self.parent.setdefault(item, item)
+
+    def find(self, item: Hashable) -> Any:
+        """Return the representative of item's set, compressing the path walked"""
+        parent = self.parent
+        root = item
+        while parent[root] != root:
+            root = parent[root]
+        while parent[item] != root:
+            parent[item], item = root, parent[item]
+        return root
+
+    def union(self, winner: Hashable, loser: Hashable) -> Any:
+        """Merge loser's set into winner's set and return the surviving representative"""
+        winner_root = self.find(winner)
+        loser_root = self.find(loser)
+        if winner_root != loser_root:
+            self.parent[loser_root] = winner_root
+        return winner_root
@@ -124,14 +124,40 @@ curl -X POST http://localhost:5001/identify \
     "phoneNumber": "777777"
   }'
 
+echo -e "\n\n---------- BATCH ----------\n"
+
+# Test 13b: Identify several contacts in one batch request
+echo -e "\nTest 13b: Batch identify (results in input order)"
+curl -X POST http://localhost:5001/identify/batch \
+  -H "Content-Type: application/json" \
+  -d '[
+    {"email": "emmett@hillvalley.edu", "phoneNumber": "555555"},
+    {"email": "brown@hillvalley.edu", "phoneNumber": "555555"},
+    {"email": "jennifer@hillvalley.edu"}
+  ]'
+
 echo -e "\n\n---------- ERROR CASES ----------\n"
 
+# Test 13c: Malformed batch body
+echo -e "\nTest 13c: Invalid batch request - malformed JSON (400)"
+curl -X POST http://localhost:5001/identify/batch \
+  -H "Content-Type: application/json" \
+  -d '[{"email": "emmett@hillvalley.edu"'
+
 # Test 14: Invalid request with no email or phone
-echo -e "\nTest 14: Invalid request - missing both email and phone"
+echo -e "\n\nTest 14: Invalid request - missing both email and phone"
 curl -X POST http://localhost:5001/identify \
   -H "Content-Type: application/json" \
   -d '{}'
 
+# Test 14b: Non-integer phone number
+echo -e "\n\nTest 14b: Invalid request - float phoneNumber (400, must be a string or an integer)"
+curl -X POST http://localhost:5001/identify \
+  -H "Content-Type: application/json" \
+  -d '{
+    "phoneNumber": 12.5
+  }'
+
 # Test 15: Invalid request with null values
 echo -e "\n\nTest 15: Invalid request - null values"
 curl -X POST http://localhost:5001/identify \
@@ -151,4 +177,8 @@ curl -X POST http://localhost:5001/identify \
     "email": "lorraine@hillvalley.edu"
   }'
 
+# Test 17: Metrics recorded for the requests above
+echo -e "\n\nTest 17: Prometheus metrics"
+curl -s http://localhost:5001/metrics | grep -E '^identify_request_duration_seconds_count|^http_request_db_statements_sum'
+
 echo -e "\n\nTest complete!"
\ No newline at end of file